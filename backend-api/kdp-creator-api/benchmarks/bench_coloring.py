@@ -0,0 +1,139 @@
+"""Microbenchmarks for coloring-engine hot spots.
+
+Run from backend-api/kdp-creator-api:  python benchmarks/bench_coloring.py
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from PIL import Image, ImageEnhance
+
+from src.services.coloring import (
+    DETAIL_SIGMA,
+    EDGE_DILATE_ITERS,
+    _enhanced_lines,
+    _remove_small_holes,
+    _remove_small_objects,
+)
+
+
+def _remove_small_objects_per_label(mask, min_size=5):
+    """The previous implementation: one full-image comparison per component."""
+    u8 = mask.astype(np.uint8)
+    num, labels, stats, _ = cv2.connectedComponentsWithStats(u8, connectivity=8)
+    out = np.zeros_like(u8)
+    for label in range(1, num):
+        if stats[label, cv2.CC_STAT_AREA] >= min_size:
+            out[labels == label] = 1
+    return out.astype(bool)
+
+
+def enhanced_lines_float64(gray, *, detail_level="medium", threshold="auto", contrast=0, edge_enhancement="mild"):
+    """The previous float64 enhanced pipeline, kept as the reference for _enhanced_lines."""
+    working = cv2.equalizeHist(gray)
+    if contrast != 0:
+        working = np.array(ImageEnhance.Contrast(Image.fromarray(working)).enhance(1 + contrast / 100.0))
+    blurred = cv2.GaussianBlur(working.astype(np.float64), (0, 0), sigmaX=DETAIL_SIGMA[detail_level])
+    gx = cv2.Sobel(blurred, cv2.CV_64F, 1, 0, ksize=3)
+    gy = cv2.Sobel(blurred, cv2.CV_64F, 0, 1, ksize=3)
+    mag = np.hypot(gx, gy)
+    edge_bool = mag / (float(mag.max()) + 1e-8) > 0.1
+    if EDGE_DILATE_ITERS[edge_enhancement] > 0:
+        kernel = np.ones((3, 3), np.uint8)
+        edge_bool = cv2.dilate(edge_bool.astype(np.uint8), kernel, iterations=EDGE_DILATE_ITERS[edge_enhancement])
+        edge_bool = edge_bool.astype(bool)
+    if threshold == "auto":
+        threshold_value = float(cv2.threshold(working, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[0])
+    else:
+        threshold_value = float(threshold)
+    binary = working.astype(np.float64) < threshold_value
+    binary = _remove_small_holes(_remove_small_objects(binary, min_size=5), area_threshold=10)
+    return ((1 - (binary | edge_bool).astype(np.uint8)) * 255).astype(np.uint8)
+
+
+def photo_like_canvas(height=3338, width=2588, seed=0):
+    """Smooth shapes plus sensor noise — closer to a real photo than pure noise."""
+    rng = np.random.default_rng(seed)
+    canvas = np.full((height, width), 230, np.uint8)
+    for _ in range(60):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        axes = (int(rng.integers(20, width // 4)), int(rng.integers(20, height // 4)))
+        cv2.ellipse(canvas, center, axes, float(rng.integers(0, 180)), 0, 360, int(rng.integers(0, 200)), -1)
+    noise = rng.normal(0, 12, canvas.shape)
+    return np.clip(canvas + noise, 0, 255).astype(np.uint8)
+
+
+def _peak_traced_bytes(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_enhanced_memory(height=3338, width=2588):
+    """Peak traced allocation (numpy/OpenCV buffers) per page pixel, float64 reference vs lean."""
+    canvas = photo_like_canvas(height, width)
+    pixels = canvas.size
+    opts = {"detail_level": "medium", "threshold": "auto", "contrast": 10, "edge_enhancement": "mild"}
+    return {
+        "float64_bytes_per_px": _peak_traced_bytes(lambda: enhanced_lines_float64(canvas, **opts)) / pixels,
+        "lean_bytes_per_px": _peak_traced_bytes(lambda: _enhanced_lines(canvas, **opts)) / pixels,
+        "float64_s": _best_of(lambda: enhanced_lines_float64(canvas, **opts), 1),
+        "lean_s": _best_of(lambda: _enhanced_lines(canvas, **opts), 1),
+    }
+
+
+def noisy_mask(height=3300, width=2550, density=0.3, seed=0):
+    """Thresholded noise at 8.5x11 @ 300 DPI: tens of thousands of tiny components."""
+    return np.random.default_rng(seed).random((height, width)) < density
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_remove_small_objects(height=3300, width=2550, repeat=3, include_baseline=True):
+    mask = noisy_mask(height, width)
+    components = cv2.connectedComponents(mask.astype(np.uint8), connectivity=8)[0] - 1
+    results = {
+        "components": components,
+        "lookup_table_s": _best_of(lambda: _remove_small_objects(mask, min_size=5), repeat),
+        "holes_lookup_table_s": _best_of(lambda: _remove_small_holes(mask, area_threshold=10), repeat),
+    }
+    if include_baseline:
+        results["per_label_s"] = _best_of(lambda: _remove_small_objects_per_label(mask, min_size=5), 1)
+    return results
+
+
+if __name__ == "__main__":
+    # The per-label baseline is O(labels x pixels); use a quarter-size page so it finishes.
+    quick = bench_remove_small_objects(1650, 1275)
+    print(
+        f"1275x1650 noisy mask, {quick['components']} components: "
+        f"per-label {quick['per_label_s']:.2f}s, lookup table {quick['lookup_table_s'] * 1000:.1f}ms "
+        f"({quick['per_label_s'] / quick['lookup_table_s']:.0f}x)"
+    )
+    full = bench_remove_small_objects(include_baseline=False)
+    print(
+        f"2550x3300 noisy mask, {full['components']} components: "
+        f"objects {full['lookup_table_s'] * 1000:.1f}ms, holes {full['holes_lookup_table_s'] * 1000:.1f}ms"
+    )
+    memory = bench_enhanced_memory()
+    print(
+        f"enhanced 8.5x11+bleed: float64 {memory['float64_bytes_per_px']:.1f} B/px in {memory['float64_s']:.2f}s, "
+        f"lean {memory['lean_bytes_per_px']:.1f} B/px in {memory['lean_s']:.2f}s"
+    )
@@ -0,0 +1,128 @@
+"""Microbenchmarks for template interior rendering.
+
+Run from backend-api/kdp-creator-api:  python benchmarks/bench_templates.py
+"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from reportlab.lib.colors import HexColor
+from reportlab.pdfgen import canvas
+
+from src.data.templates import get_template
+from src.services.template_generator import DOT_RADIUS, GENERATORS, PageBuilder, _dot_grid_ops, _hex_color, _steps
+
+
+def draw_dots_per_circle(builder, left, right, top, bottom, spacing=14):
+    """The previous implementation: one canvas.circle (four Bezier curves) per dot."""
+
+    def draw():
+        builder.canvas.setFillColor(HexColor("#94a3b8"))
+        y = top
+        while y > bottom:
+            x = left
+            while x < right:
+                builder.canvas.circle(x, y, DOT_RADIUS, fill=1, stroke=0)
+                x += spacing
+            y -= spacing
+
+    builder.stamp(("dots", left, right, top, bottom, spacing), draw)
+
+
+def _best_of(fn, repeat):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_full_dot_page(spacing=12, pages=50, repeat=3):
+    """A full 8.5x11 dot grid drawn straight onto every page (no stamping): raw per-page draw cost."""
+    width, height = 612.0, 792.0
+    box = (36.0, width - 36.0, height - 36.0, 36.0)
+
+    def per_circle():
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=(width, height))
+        for _ in range(pages):
+            c.setFillColor(HexColor("#94a3b8"))
+            y = box[2]
+            while y > box[3]:
+                x = box[0]
+                while x < box[1]:
+                    c.circle(x, y, DOT_RADIUS, fill=1, stroke=0)
+                    x += spacing
+                y -= spacing
+            c.showPage()
+        c.save()
+        return len(buffer.getvalue())
+
+    def single_path():
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=(width, height))
+        for _ in range(pages):
+            c.saveState()
+            c.setStrokeColor(HexColor("#94a3b8"))
+            c.setLineWidth(2 * DOT_RADIUS)
+            c.setLineCap(1)
+            c.addLiteral(_dot_grid_ops(*box, spacing))
+            c.restoreState()
+            c.showPage()
+        c.save()
+        return len(buffer.getvalue())
+
+    circle_s, circle_bytes = _best_of(per_circle, repeat)
+    path_s, path_bytes = _best_of(single_path, repeat)
+    return {
+        "dots_per_page": len(_steps(box[0], box[1], spacing)) * len(_steps(box[2], box[3], -spacing)),
+        "per_circle_ms_per_page": circle_s * 1000 / pages,
+        "single_path_ms_per_page": path_s * 1000 / pages,
+        "per_circle_kb_per_page": circle_bytes / 1024 / pages,
+        "single_path_kb_per_page": path_bytes / 1024 / pages,
+    }
+
+
+def bench_dot_journal(page_count=180, repeat=3):
+    """The wellness journal with page_style "dot", old per-circle dots vs the single-path grid."""
+    template = get_template("tpl-wellness-cbt-journal")
+    options = {**template["defaults"], "page_style": "dot", "page_count": page_count, "duration_days": page_count}
+    accent = _hex_color(options.get("accent_color"))
+    generator = GENERATORS[template["niche"]]
+
+    def render(legacy):
+        builder = PageBuilder(template["trim_size"], bool(template.get("bleed")), page_count)
+        if legacy:
+            builder.draw_dots = lambda *args, **kwargs: draw_dots_per_circle(builder, *args, **kwargs)
+        return len(generator(builder, options, accent, page_count))
+
+    circle_s, circle_bytes = _best_of(lambda: render(True), repeat)
+    path_s, path_bytes = _best_of(lambda: render(False), repeat)
+    return {
+        "pages": page_count,
+        "per_circle_ms_per_page": circle_s * 1000 / page_count,
+        "single_path_ms_per_page": path_s * 1000 / page_count,
+        "per_circle_kb": circle_bytes / 1024,
+        "single_path_kb": path_bytes / 1024,
+    }
+
+
+if __name__ == "__main__":
+    page = bench_full_dot_page()
+    print(
+        f"8.5x11 dot page at 12pt, ~{page['dots_per_page']} dots: "
+        f"per-circle {page['per_circle_ms_per_page']:.2f}ms / {page['per_circle_kb_per_page']:.1f}KB, "
+        f"single path {page['single_path_ms_per_page']:.2f}ms / {page['single_path_kb_per_page']:.1f}KB per page"
+    )
+    journal = bench_dot_journal()
+    print(
+        f"dot journal, {journal['pages']} pages: "
+        f"per-circle {journal['per_circle_ms_per_page']:.2f}ms/page, {journal['per_circle_kb']:.0f}KB; "
+        f"single path {journal['single_path_ms_per_page']:.2f}ms/page, {journal['single_path_kb']:.0f}KB"
+    )
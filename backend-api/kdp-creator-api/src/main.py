@@ -67,6 +67,7 @@ from src.routes.templates import templates_bp
 from src.routes.totp import totp_bp
 from src.routes.user import user_bp
 from src.utils.responses import error_response, success_response
+from src.utils.uploads import UploadRequest, max_upload_bytes
 
 _DEFAULT_PROD_ORIGINS = (
     "https://dashboard.kdpsuite.com,"
@@ -97,6 +98,9 @@ def _parse_cors_origins():
 _CORS_ORIGINS = _parse_cors_origins()
 
 app = Flask(__name__)
+# Spool multipart uploads to temp files; per-endpoint limits come from @upload_limit.
+app.request_class = UploadRequest
+app.config["MAX_CONTENT_LENGTH"] = max_upload_bytes()
 
 _secret_key = os.environ.get("SECRET_KEY")
 _jwt_secret = os.environ.get("JWT_SECRET_KEY")
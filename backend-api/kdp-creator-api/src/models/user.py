@@ -1,8 +1,13 @@
+import hashlib
 import os
+import threading
+import time
 import urllib.error
 import urllib.request
+from collections import OrderedDict
 from functools import wraps
 
+import jwt as pyjwt
 from flask import g, has_request_context, request
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
@@ -61,6 +66,160 @@ def get_supabase_user(token):
         return None
 
 
+def verify_supabase_token(token):
+    """Verify a Supabase JWT. Signatures are always required."""
+    secret = os.environ.get("SUPABASE_JWT_SECRET")
+    if not secret:
+        print("Token verification failed: SUPABASE_JWT_SECRET is required")
+        return None
+    try:
+        return pyjwt.decode(
+            token,
+            secret,
+            algorithms=["HS256"],
+            audience="authenticated",
+        )
+    except Exception as token_error:
+        print(f"Token verification failed: {token_error}")
+        return None
+
+
+# ============================================================================
+# Access-token verification cache
+# ============================================================================
+
+DEFAULT_TOKEN_CACHE_SECONDS = 60
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+
+
+def _env_int(name, default):
+    raw = os.environ.get(name, "").strip()
+    try:
+        return max(0, int(raw)) if raw else default
+    except ValueError:
+        return default
+
+
+class ClaimsUser:
+    """The parts of a Supabase user that routes read, taken from locally verified JWT claims."""
+
+    def __init__(self, claims):
+        self.id = claims.get("sub")
+        self.email = claims.get("email")
+        self.role = claims.get("role")
+        self.app_metadata = claims.get("app_metadata") or {}
+        self.user_metadata = claims.get("user_metadata") or {}
+        self.claims = claims
+
+
+class TokenCache:
+    """Bounded token -> user map. Entries live ``ttl`` seconds, never past the token's own exp."""
+
+    def __init__(self, ttl, max_entries, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, token, user, token_exp=None):
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        expires_at = self._clock() + self.ttl
+        if token_exp:
+            expires_at = min(expires_at, float(token_exp))
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_TOKEN_CACHE = None
+
+
+def token_cache():
+    """Verified-token cache (AUTH_TOKEN_CACHE_SECONDS / AUTH_TOKEN_CACHE_SIZE)."""
+    global _TOKEN_CACHE
+    if _TOKEN_CACHE is None:
+        _TOKEN_CACHE = TokenCache(
+            _env_int("AUTH_TOKEN_CACHE_SECONDS", DEFAULT_TOKEN_CACHE_SECONDS),
+            _env_int("AUTH_TOKEN_CACHE_SIZE", DEFAULT_TOKEN_CACHE_SIZE),
+        )
+    return _TOKEN_CACHE
+
+
+def _unverified_exp(token):
+    try:
+        return pyjwt.decode(token, options={"verify_signature": False}).get("exp")
+    except Exception:
+        return None
+
+
+def verify_access_token(token, remote=False):
+    """Resolve a bearer token to a user, or None if it is invalid or expired.
+
+    With SUPABASE_JWT_SECRET set, signature, audience and expiry are checked locally and
+    Supabase Auth is not called. Without it, get_user runs on a cache miss. ``remote=True``
+    always asks Supabase Auth, so a session revoked before its token expires is refused.
+    """
+    cache = token_cache()
+    if remote and supabase is not None:
+        user = get_supabase_user(token)
+        if user is None:
+            cache.discard(token)
+        else:
+            cache.put(token, user, _unverified_exp(token))
+        return user
+    user = cache.get(token)
+    if user is not None:
+        return user
+    if os.environ.get("SUPABASE_JWT_SECRET"):
+        claims = verify_supabase_token(token)
+        if not claims or not claims.get("sub") or not claims.get("exp"):
+            return None
+        user, token_exp = ClaimsUser(claims), claims["exp"]
+    else:
+        user = get_supabase_user(token)
+        if user is None:
+            return None
+        token_exp = _unverified_exp(token)
+    cache.put(token, user, token_exp)
+    return user
+
+
+def forget_access_token(token):
+    """Drop a token from the verification cache (after logout or revocation)."""
+    if token:
+        token_cache().discard(token)
+
+
 def bearer_token():
     if not has_request_context():
         return None
@@ -225,8 +384,12 @@ def user_is_admin(user, profile=None):
     return isinstance(role, str) and role.strip().lower() == "admin"
 
 
-def jwt_required():
-    """Decorator to require Supabase JWT token"""
+def jwt_required(verify_remote=False):
+    """Decorator to require Supabase JWT token
+
+    Tokens are verified locally (see verify_access_token). Pass ``verify_remote=True`` on
+    revocation-sensitive routes to confirm the session with Supabase Auth on every call.
+    """
 
     def decorator(f):
         @wraps(f)
@@ -235,7 +398,7 @@ def jwt_required():
             if not auth_header or not auth_header.startswith("Bearer "):
                 return error_response("Missing or invalid token", "AUTH_MISSING", status_code=401)
             token = auth_header.split(" ")[1]
-            user = get_supabase_user(token)
+            user = verify_access_token(token, remote=verify_remote)
             if not user:
                 return error_response("Invalid or expired token", "AUTH_INVALID", status_code=401)
             request.user = user
@@ -268,18 +431,48 @@ def get_jwt_identity():
     return str(request.user.id) if hasattr(request, "user") else None
 
 
+def _request_profiles():
+    """Profiles already loaded during this request (user_id -> row or None), or None off-request."""
+    if not has_request_context():
+        return None
+    profiles = getattr(g, "_user_profiles", None)
+    if profiles is None:
+        profiles = g._user_profiles = {}
+    return profiles
+
+
 class UserProfile:
     @staticmethod
     def get_by_id(user_id):
+        """The user_profiles row, fetched at most once per request.
+
+        Auth, MFA, quota checks and the handler all read the same row; anything that writes
+        it calls invalidate so later reads in the request refetch. Failed fetches are not
+        remembered.
+        """
+        profiles = _request_profiles()
+        key = str(user_id)
+        if profiles is not None and key in profiles:
+            return profiles[key]
         client = data_client()
         if not client:
             return None
         try:
             res = client.table("user_profiles").select("*").eq("id", user_id).maybe_single().execute()
-            return res.data if res.data else None
+            profile = res.data if res.data else None
         except Exception as profile_error:
             print(f"Failed to fetch user profile {user_id}: {profile_error}")
             return None
+        if profiles is not None:
+            profiles[key] = profile
+        return profile
+
+    @staticmethod
+    def invalidate(user_id):
+        """Forget this request's copy of a profile after writing to it."""
+        profiles = _request_profiles()
+        if profiles is not None:
+            profiles.pop(str(user_id), None)
 
     @staticmethod
     def to_dict(profile):
@@ -319,6 +512,8 @@ class BatchJob:
             "created_at": job.get("created_at"),
             "completed_at": job.get("completed_at"),
             "error_message": job.get("error_message"),
+            "attempts": job.get("attempts", 0),
+            "result": job.get("result"),
         }
 
 
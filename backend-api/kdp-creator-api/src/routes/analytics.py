@@ -197,7 +197,7 @@ def get_user_metrics():
 
 
 @analytics_bp.route("/business-metrics", methods=["GET"])
-@jwt_required()
+@jwt_required(verify_remote=True)
 @admin_required
 def get_business_metrics():
     try:
@@ -2,10 +2,8 @@
 Authentication sync route for bridging Supabase Auth with Flask backend.
 """
 
-import os
 from datetime import datetime
 
-import jwt as pyjwt
 from flask import Blueprint, request
 from flask_jwt_extended import create_access_token
 
@@ -18,6 +16,7 @@ from src.models.user import (
     jwt_required,
     supabase,
     user_scoped_client,
+    verify_supabase_token,
 )
 from src.utils.auth_cookies import read_refresh_cookie, with_refresh_cookie
 from src.utils.responses import error_response, success_response
@@ -25,24 +24,6 @@ from src.utils.responses import error_response, success_response
 auth_sync_bp = Blueprint("auth_sync", __name__)
 
 
-def verify_supabase_token(token: str) -> dict:
-    """Verify a Supabase JWT. Signatures are always required."""
-    secret = os.environ.get("SUPABASE_JWT_SECRET")
-    if not secret:
-        print("Token verification failed: SUPABASE_JWT_SECRET is required")
-        return None
-    try:
-        return pyjwt.decode(
-            token,
-            secret,
-            algorithms=["HS256"],
-            audience="authenticated",
-        )
-    except Exception as token_error:
-        print(f"Token verification failed: {token_error}")
-        return None
-
-
 def _upsert_user_profile(user, access_token=None) -> dict:
     """Ensure a Supabase user has a user_profiles row."""
     user_id = str(user.id)
@@ -73,6 +54,7 @@ def _upsert_user_profile(user, access_token=None) -> dict:
         return new_profile
 
     res = client.table("user_profiles").insert(new_profile).execute()
+    UserProfile.invalidate(user_id)
     return res.data[0] if res.data else new_profile
 
 
@@ -1,113 +1,174 @@
-import threading
-import time
-from datetime import datetime
-
 from flask import Blueprint, request
-
-from src.models.user import BatchJob, UserProfile, data_client, get_jwt_identity, jwt_required, supabase
-from src.routes.subscription import enforce_batch_quota, record_batch_usage
+from werkzeug.utils import secure_filename
+
+from src.models.user import BatchJob, UserProfile, get_jwt_identity, jwt_required
+from src.routes.subscription import refund_batch_usage, reserve_batch_quota
+from src.services.batch_jobs import JOB_TYPE_ALIASES, notify_job_workers, refund_job_quota
+from src.services.coloring import MAX_SOURCE_PIXELS, ColoringParamError, parse_coloring_form
+from src.services.job_queue import get_job_store
+from src.services.kdp_specs import KdpSpecError, get_trim
+from src.storage import create_signed_url, upload_file
 from src.utils.rate_limit import rate_limit_batch_processing
 from src.utils.responses import error_response, success_response
+from src.utils.uploads import image_upload_problem, pdf_upload_problem, upload_limit
 
 batch_bp = Blueprint("batch", __name__)
 
 
+def _truthy(value, default="true"):
+    return str(value if value is not None else default).lower() in ("1", "true", "yes")
+
+
+def _job_with_downloads(job):
+    """BatchJob.to_dict plus fresh signed URLs for finished outputs."""
+    job_dict = BatchJob.to_dict(job)
+    result = job_dict.get("result") or {}
+    if job_dict["status"] == "completed":
+        for output in result.get("outputs", []):
+            output["download_url"] = create_signed_url(output["path"])
+    return job_dict
+
+
 @batch_bp.route("/batch/jobs", methods=["GET"])
 @jwt_required()
 def get_batch_jobs():
     user_id = get_jwt_identity()
     try:
-        res = (
-            data_client()
-            .table("batch_jobs")
-            .select("*")
-            .eq("user_id", user_id)
-            .order("created_at", desc=True)
-            .limit(50)
-            .execute()
-        )
-        return success_response({"jobs": [BatchJob.to_dict(j) for j in res.data]})
+        jobs = get_job_store().list_for_user(user_id, limit=50)
+        return success_response({"jobs": [BatchJob.to_dict(j) for j in jobs]})
     except Exception as e:
         return error_response("Failed to fetch batch jobs", "DATABASE_ERROR", status_code=500)
 
 
+@batch_bp.route("/batch/jobs/<int:job_id>", methods=["GET"])
+@jwt_required()
+def get_batch_job(job_id):
+    user_id = get_jwt_identity()
+    try:
+        job = get_job_store().get(job_id)
+    except Exception:
+        return error_response("Failed to fetch batch job", "DATABASE_ERROR", status_code=500)
+    if not job or str(job.get("user_id")) != str(user_id):
+        return error_response("Job not found", "JOB_NOT_FOUND", status_code=404)
+    return success_response({"job": _job_with_downloads(job)})
+
+
+@batch_bp.route("/batch/jobs/<int:job_id>/cancel", methods=["POST"])
+@jwt_required()
+def cancel_batch_job(job_id):
+    user_id = get_jwt_identity()
+    store = get_job_store()
+    try:
+        cancelled_from = store.cancel(job_id, user_id)
+        job = store.get(job_id)
+        if not cancelled_from:
+            if not job or str(job.get("user_id")) != str(user_id):
+                return error_response("Job not found", "JOB_NOT_FOUND", status_code=404)
+            return error_response(f"Job is already {job.get('status')}", "JOB_NOT_CANCELLABLE", status_code=409)
+        if cancelled_from == "queued":
+            # Nothing ran yet, so the quota reserved at submit goes back.
+            refund_job_quota(job)
+        return success_response({"job": BatchJob.to_dict(job)})
+    except Exception:
+        return error_response("Failed to cancel batch job", "DATABASE_ERROR", status_code=500)
+
+
 @batch_bp.route("/batch/submit", methods=["POST"])
 @rate_limit_batch_processing
 @jwt_required()
+@upload_limit("batch")
 def submit_batch_job():
+    """Queue a batch job.
+
+    Inputs come either as multipart files (uploaded to storage here) or, for JSON bodies,
+    as an ``inputs`` list of storage paths the caller already uploaded under their own prefix.
+    """
     user_id = get_jwt_identity()
     profile = UserProfile.get_by_id(user_id)
     if not profile:
         return error_response("User not found", "USER_NOT_FOUND", status_code=404)
 
-    data = request.get_json()
-    job_type = data.get("job_type")
-    total_files = data.get("total_files", 0)
-
-    if not job_type or total_files < 1:
-        return error_response("job_type and total_files are required", "INVALID_INPUT", status_code=400)
+    if request.files:
+        data = request.form
+        inputs = None
+    else:
+        data = request.get_json(silent=True) or {}
+        inputs = data.get("inputs") or []
+
+    job_type = JOB_TYPE_ALIASES.get((data.get("job_type") or "").strip().lower())
+    if not job_type:
+        return error_response(
+            f"job_type must be one of: {', '.join(sorted(JOB_TYPE_ALIASES))}", "INVALID_INPUT", status_code=400
+        )
 
-    quota_error = enforce_batch_quota(user_id)
+    trim_size = data.get("trim_size", "8.5x11")
+    payload = {"trim_size": trim_size}
+    try:
+        get_trim(trim_size)
+        if job_type == "convert_image":
+            payload["coloring"] = parse_coloring_form(data)
+            payload["with_bleed"] = _truthy(data.get("with_bleed"))
+            payload["cover_title"] = (data.get("cover_title") or "").strip()
+        else:
+            payload["target_format"] = data.get("target_format", "kdp-print")
+    except KdpSpecError as exc:
+        return error_response(str(exc), "INVALID_TRIM", status_code=400)
+    except ColoringParamError as exc:
+        return error_response(str(exc), exc.code, status_code=400)
+
+    if inputs is not None:
+        if not isinstance(inputs, list) or not all(isinstance(path, str) for path in inputs):
+            return error_response("inputs must be a list of storage paths", "INVALID_INPUT", status_code=400)
+        if any(not path.startswith(f"{user_id}/") or ".." in path for path in inputs):
+            return error_response("inputs must be your own uploaded files", "INVALID_INPUT", status_code=403)
+    if not request.files and not inputs:
+        return error_response("At least one input file is required", "MISSING_FILES", status_code=400)
+    if inputs is None:
+        rejected = []
+        for key in sorted(request.files.keys()):
+            for upload in request.files.getlist(key):
+                label = upload.filename or key
+                if job_type == "convert_image":
+                    problem = image_upload_problem(upload, MAX_SOURCE_PIXELS, label=label)
+                else:
+                    problem = pdf_upload_problem(upload, label=label)
+                if problem:
+                    rejected.append({"file": label, "code": problem[0], "message": problem[1]})
+        if rejected:
+            return error_response(
+                f"{len(rejected)} file(s) rejected",
+                rejected[0]["code"],
+                details={"failed_files": rejected},
+                status_code=400,
+            )
+
+    quota_error, reserved = reserve_batch_quota(user_id)
     if quota_error:
         return quota_error
 
-    job_data = {
-        "user_id": user_id,
-        "job_type": job_type,
-        "total_files": total_files,
-        "status": "queued",
-    }
-
     try:
-        res = data_client().table("batch_jobs").insert(job_data).execute()
-        if not res.data:
-            return error_response("Failed to create job", "DATABASE_ERROR", status_code=500)
-
-        job = res.data[0]
-        record_batch_usage(user_id)
-
-        # Optimization: Pass app context to thread
-        threading.Thread(target=_process_batch_job_optimized, args=(job["id"],), daemon=True).start()
+        if inputs is None:
+            inputs = [
+                upload_file(upload.read(), str(user_id), secure_filename(upload.filename or key), "batch_input")["path"]
+                for key in sorted(request.files.keys())
+                for upload in request.files.getlist(key)
+            ]
+        payload["inputs"] = inputs
+        # Refunded by the workers if the job fails for good, or here if it is cancelled before it runs.
+        payload["reserved_quota"] = reserved
+
+        job = get_job_store().enqueue(
+            {
+                "user_id": user_id,
+                "job_type": job_type,
+                "total_files": len(inputs),
+                "tier": profile.get("subscription_tier", "free"),
+                "payload": payload,
+            }
+        )
+        notify_job_workers()
 
         return success_response({"job": BatchJob.to_dict(job)}, status_code=201)
     except Exception as e:
+        refund_batch_usage(user_id, reserved)
         return error_response("Batch submission failed", "BATCH_ERROR", status_code=500)
-
-
-def _process_batch_job_optimized(job_id):
-    """
-    Optimized batch processing:
-    1. Reduces DB polling by 90%
-    2. Batches progress updates
-    3. Handles cancellation efficiently
-    """
-    try:
-        # Update status to processing
-        supabase.table("batch_jobs").update({"status": "processing"}).eq("id", job_id).execute()
-
-        res = supabase.table("batch_jobs").select("total_files").eq("id", job_id).single().execute()
-        if not res.data:
-            return
-        total_files = res.data["total_files"]
-
-        # Optimization: Update DB every 10% or every 10 files, whichever is smaller
-        update_interval = max(1, min(10, total_files // 10))
-
-        for i in range(1, total_files + 1):
-            # Simulate actual work (in real app, this would be image/pdf processing)
-            time.sleep(0.1)
-
-            # Optimization: Check status only every interval to save DB calls
-            if i % update_interval == 0 or i == total_files:
-                check_res = supabase.table("batch_jobs").select("status").eq("id", job_id).single().execute()
-                if not check_res.data or check_res.data["status"] == "cancelled":
-                    return
-
-                supabase.table("batch_jobs").update({"processed_files": i}).eq("id", job_id).execute()
-
-        supabase.table("batch_jobs").update(
-            {"status": "completed", "completed_at": datetime.utcnow().isoformat() + "Z"}
-        ).eq("id", job_id).execute()
-
-    except Exception as e:
-        supabase.table("batch_jobs").update({"status": "failed", "error_message": str(e)}).eq("id", job_id).execute()
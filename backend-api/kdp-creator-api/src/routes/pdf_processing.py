@@ -5,32 +5,42 @@ import uuid
 
 from flask import Blueprint, current_app, request
 from PIL import Image
-from pypdf import PdfReader, PdfWriter, Transformation
-from reportlab.lib.colors import grey
-from reportlab.lib.utils import ImageReader
-from reportlab.pdfgen import canvas
 
 from src.models.user import data_client, get_jwt_identity, jwt_required
 from src.routes.subscription import (
     enforce_batch_quota,
     enforce_conversion_quota,
-    record_batch_usage,
-    record_conversion_usage,
+    refund_batch_usage,
+    refund_conversion_usage,
+    reserve_batch_quota,
+    reserve_conversion_quota,
 )
-from src.services.coloring import ColoringParamError, coloring_bitmap, parse_coloring_form
+from src.services.coloring import (
+    MAX_SOURCE_PIXELS,
+    PREVIEW_WORKING_DPI,
+    ColoringParamError,
+    cached_coloring_gray,
+    parse_coloring_form,
+    png_bytes_from_gray,
+)
+from src.services.coloring_pool import render_coloring_batch
 from src.services.kdp_specs import (
     MIN_PAGE_COUNT,
-    PRINT_DPI,
     STANDARD_COLOR_MIN_PAGES,
     KdpSpecError,
     get_trim,
     interior_page_size,
     interior_page_size_pts,
 )
+from src.services.pdf_format import format_pdf_for_kdp, target_wants_bleed
+from src.services.pdf_scan import inspect_pdf
+from src.services.preflight import preflight_pdf
+from src.services.raster_pdf import RasterPdfWriter
 from src.storage import upload_file
 from src.utils.logger import PerformanceTimer
 from src.utils.rate_limit import rate_limit_pdf_processing
 from src.utils.responses import error_response, success_response
+from src.utils.uploads import check_image_upload, check_pdf_upload, image_upload_problem, upload_limit
 
 pdf_bp = Blueprint("pdf", __name__)
 
@@ -67,46 +77,11 @@ def get_kdp_dimensions(trim_size, target_format, with_bleed=None):
         return interior_page_size_pts("6x9", with_bleed=with_bleed)
 
 
-def generate_title_page_pdf(title, trim_size, with_bleed=True):
-    """Create a simple title page PDF prepended to batch output."""
-    target_w, target_h = get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed)
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=(target_w, target_h))
-    c.setFillColor(grey)
-    c.setFont("Helvetica-Bold", min(36, target_w / 12))
-    c.drawCentredString(target_w / 2, target_h / 2 + 20, title[:80])
-    c.setFont("Helvetica", 14)
-    c.drawCentredString(target_w / 2, target_h / 2 - 30, "KDP Creator Suite")
-    c.showPage()
-    c.save()
-    buffer.seek(0)
-    return buffer.getvalue()
-
-
-def _png_bytes_to_pdf_page(png_bytes, trim_size, with_bleed=True):
-    """Place PNG on a correctly sized KDP page without stretching."""
-    target_w, target_h = get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed)
-    img = Image.open(io.BytesIO(png_bytes))
-    img_w_pt = img.width * 72 / PRINT_DPI
-    img_h_pt = img.height * 72 / PRINT_DPI
-    scale = min(target_w / img_w_pt, target_h / img_h_pt)
-    draw_w = img_w_pt * scale
-    draw_h = img_h_pt * scale
-    x = (target_w - draw_w) / 2
-    y = (target_h - draw_h) / 2
-    temp_pdf_buffer = io.BytesIO()
-    c = canvas.Canvas(temp_pdf_buffer, pagesize=(target_w, target_h))
-    c.setFillColorRGB(1, 1, 1)
-    c.rect(0, 0, target_w, target_h, fill=1, stroke=0)
-    c.drawImage(ImageReader(io.BytesIO(png_bytes)), x, y, width=draw_w, height=draw_h)
-    c.showPage()
-    c.save()
-    temp_pdf_buffer.seek(0)
-    return PdfReader(temp_pdf_buffer).pages[0]
-
-
 def generate_optimized_preview(content_bytes, content_type="pdf"):
-    """Generate a low-res preview. Safe if pdf2image/poppler are unavailable."""
+    """Generate a low-res preview. Safe if pdf2image/poppler are unavailable.
+
+    content_type "gray" takes a coloring-engine uint8 array instead of encoded bytes.
+    """
     try:
         if content_type == "pdf":
             try:
@@ -119,6 +94,8 @@ def generate_optimized_preview(content_bytes, content_type="pdf"):
             except Exception as preview_error:
                 current_app.logger.warning(f"PDF preview unavailable: {preview_error}")
                 return None
+        elif content_type == "gray":
+            preview_img = Image.fromarray(content_bytes)
         else:
             preview_img = Image.open(io.BytesIO(content_bytes))
 
@@ -131,33 +108,10 @@ def generate_optimized_preview(content_bytes, content_type="pdf"):
         return None
 
 
-def _fit_page_to_target(page, target_w, target_h):
-    """Uniformly scale and center a PDF page onto a target canvas (no stretch)."""
-    src_w = float(page.mediabox.width)
-    src_h = float(page.mediabox.height)
-    if src_w <= 0 or src_h <= 0:
-        return page
-
-    scale = min(target_w / src_w, target_h / src_h)
-    writer = PdfWriter()
-    blank = writer.add_blank_page(width=target_w, height=target_h)
-    tx = (target_w - src_w * scale) / 2
-    ty = (target_h - src_h * scale) / 2
-    blank.merge_transformed_page(
-        page,
-        Transformation().scale(scale, scale).translate(tx, ty),
-    )
-    return blank
-
-
-def _coloring_bitmap(img_bytes, trim_size, with_bleed=True, **coloring_opts):
-    """Thin dispatcher — default engine=legacy via coloring_bitmap."""
-    return coloring_bitmap(img_bytes, trim_size, with_bleed=with_bleed, **coloring_opts)
-
-
 @pdf_bp.route("/pdf/convert-coloring", methods=["POST"])
 @rate_limit_pdf_processing
 @jwt_required()
+@upload_limit("image")
 def convert_to_coloring():
     user_id = get_jwt_identity()
     quota_error = enforce_conversion_quota(user_id)
@@ -167,6 +121,9 @@ def convert_to_coloring():
         return error_response("No file uploaded", "MISSING_FILE", status_code=400)
 
     file = request.files["file"]
+    upload_error = check_image_upload(file, MAX_SOURCE_PIXELS)
+    if upload_error:
+        return upload_error
     trim_size = request.form.get("trim_size", "8.5x11")
     with_bleed = request.form.get("with_bleed", "true").lower() in ("1", "true", "yes")
 
@@ -178,28 +135,33 @@ def convert_to_coloring():
     except ColoringParamError as exc:
         return error_response(str(exc), exc.code, status_code=400)
 
+    if request.form.get("preview", "false").lower() in ("1", "true", "yes"):
+        return _coloring_preview(file.read(), trim_size, with_bleed, coloring_opts)
+
+    quota_error, reserved = reserve_conversion_quota(user_id)
+    if quota_error:
+        return quota_error
     with PerformanceTimer("coloring_conversion"):
         try:
-            png_bytes = _coloring_bitmap(
+            # Slider re-runs on the same photo are served from the content-addressed cache.
+            gray, cache_hit = cached_coloring_gray(
                 file.read(),
                 trim_size,
                 with_bleed=with_bleed,
                 **coloring_opts,
             )
-            preview = generate_optimized_preview(png_bytes, "image")
+            preview = generate_optimized_preview(gray, "gray")
 
             # Prefer single-page PDF for KDP interior upload readiness
             as_pdf = request.form.get("output_format", "pdf").lower() != "png"
             if as_pdf:
-                writer = PdfWriter()
-                writer.add_page(_png_bytes_to_pdf_page(png_bytes, trim_size, with_bleed=with_bleed))
-                pdf_buffer = io.BytesIO()
-                writer.write(pdf_buffer)
-                output_bytes = pdf_buffer.getvalue()
+                writer = RasterPdfWriter(*get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed))
+                writer.add_bitmap_page(gray)
+                output_bytes = writer.getvalue()
                 filename = f"coloring_{uuid.uuid4().hex[:8]}.pdf"
                 file_format = "PDF"
             else:
-                output_bytes = png_bytes
+                output_bytes = png_bytes_from_gray(gray)
                 filename = f"coloring_{uuid.uuid4().hex[:8]}.png"
                 file_format = "PNG"
 
@@ -214,9 +176,9 @@ def convert_to_coloring():
                     "format": file_format,
                     "trim_size": trim_size,
                     "engine": coloring_opts["engine"],
+                    "cache_hit": cache_hit,
                 },
             )
-            record_conversion_usage(user_id)
             return success_response(
                 {
                     "download_url": storage_info["signed_url"],
@@ -228,8 +190,10 @@ def convert_to_coloring():
                 }
             )
         except ColoringParamError as exc:
+            refund_conversion_usage(user_id, reserved)
             return error_response(str(exc), exc.code, status_code=400)
         except Exception as e:
+            refund_conversion_usage(user_id, reserved)
             current_app.logger.error(f"Coloring conversion failed: {str(e)}")
             record_pdf_analytics(
                 user_id,
@@ -239,9 +203,37 @@ def convert_to_coloring():
             return error_response("Conversion failed", "CONVERSION_ERROR", status_code=500)
 
 
+def _coloring_preview(img_bytes, trim_size, with_bleed, coloring_opts):
+    """Draft render for live settings: reduced working DPI, JPEG only, nothing stored or counted."""
+    with PerformanceTimer("coloring_preview"):
+        try:
+            gray, _ = cached_coloring_gray(
+                img_bytes,
+                trim_size,
+                with_bleed=with_bleed,
+                dpi=PREVIEW_WORKING_DPI,
+                **coloring_opts,
+            )
+            return success_response(
+                {
+                    "preview": generate_optimized_preview(gray, "gray"),
+                    "preview_only": True,
+                    "preview_dpi": PREVIEW_WORKING_DPI,
+                    "with_bleed": with_bleed,
+                    "trim_size": trim_size,
+                }
+            )
+        except ColoringParamError as exc:
+            return error_response(str(exc), exc.code, status_code=400)
+        except Exception as e:
+            current_app.logger.error(f"Coloring preview failed: {str(e)}")
+            return error_response("Preview failed", "CONVERSION_ERROR", status_code=500)
+
+
 @pdf_bp.route("/pdf/format-kdp", methods=["POST"])
 @rate_limit_pdf_processing
 @jwt_required()
+@upload_limit("pdf")
 def format_kdp():
     user_id = get_jwt_identity()
     quota_error = enforce_conversion_quota(user_id)
@@ -251,43 +243,25 @@ def format_kdp():
         return error_response("No file uploaded", "MISSING_FILE", status_code=400)
 
     file = request.files["file"]
+    upload_error = check_pdf_upload(file)
+    if upload_error:
+        return upload_error
     trim_size = request.form.get("trim_size", "8.5x11")
     target_format = request.form.get("target_format", "kdp-print")
-    with_bleed = "print" in target_format and target_format != "kdp-ebook"
+    with_bleed = target_wants_bleed(target_format)
 
     try:
         get_trim(trim_size)
     except KdpSpecError as exc:
         return error_response(str(exc), "INVALID_TRIM", status_code=400)
 
+    quota_error, reserved = reserve_conversion_quota(user_id)
+    if quota_error:
+        return quota_error
     with PerformanceTimer("kdp_formatting"):
         try:
-            pdf_bytes = file.read()
-            reader = PdfReader(io.BytesIO(pdf_bytes))
-            writer = PdfWriter()
-
-            if target_format == "kdp-ebook":
-                # Pass through pages without print bleed sizing
-                for page in reader.pages:
-                    writer.add_page(page)
-            else:
-                target_w, target_h = get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed)
-                for page in reader.pages:
-                    writer.add_page(_fit_page_to_target(page, target_w, target_h))
-
-            # Pad to even page count for print interiors
-            if with_bleed or target_format == "kdp-print":
-                while len(writer.pages) % 2 != 0:
-                    target_w, target_h = get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed)
-                    writer.add_blank_page(width=target_w, height=target_h)
-                if len(writer.pages) < MIN_PAGE_COUNT:
-                    target_w, target_h = get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed)
-                    while len(writer.pages) < MIN_PAGE_COUNT:
-                        writer.add_blank_page(width=target_w, height=target_h)
-
-            output_buffer = io.BytesIO()
-            writer.write(output_buffer)
-            output_bytes = output_buffer.getvalue()
+            formatted = format_pdf_for_kdp(file.stream, trim_size, target_format)
+            output_bytes = formatted.pdf_bytes
 
             filename = f"kdp_{uuid.uuid4().hex[:8]}.pdf"
             storage_info = upload_file(output_bytes, str(user_id), filename, "kdp_formatted_pdf")
@@ -302,19 +276,19 @@ def format_kdp():
                     "target_format": target_format,
                 },
             )
-            record_conversion_usage(user_id)
             return success_response(
                 {
                     "download_url": storage_info["signed_url"],
                     "preview": generate_optimized_preview(output_bytes, "pdf"),
                     "file_size_mb": round(len(output_bytes) / (1024 * 1024), 2),
                     "format": "PDF",
-                    "page_count": len(writer.pages),
+                    "page_count": formatted.page_count,
                     "with_bleed": with_bleed,
                     "trim_size": trim_size,
                 }
             )
         except Exception as e:
+            refund_conversion_usage(user_id, reserved)
             current_app.logger.error(f"KDP formatting failed: {str(e)}")
             record_pdf_analytics(
                 user_id,
@@ -327,6 +301,7 @@ def format_kdp():
 @pdf_bp.route("/pdf/batch-coloring", methods=["POST"])
 @rate_limit_pdf_processing
 @jwt_required()
+@upload_limit("batch")
 def batch_convert_coloring():
     user_id = get_jwt_identity()
     quota_error = enforce_batch_quota(user_id)
@@ -361,40 +336,55 @@ def batch_convert_coloring():
     else:
         file_keys = sorted(request.files.keys())
 
-    output_pngs = []
-
+    file_keys = [key for key in file_keys if key in request.files]
+    rejected = [
+        {"file": key, "code": problem[0], "message": problem[1]}
+        for key in file_keys
+        for problem in [image_upload_problem(request.files[key], MAX_SOURCE_PIXELS, label=key)]
+        if problem
+    ]
+    if rejected:
+        return error_response(
+            f"{len(rejected)} of {len(file_keys)} files could not be converted",
+            rejected[0]["code"],
+            details={"failed_files": rejected},
+            status_code=400,
+        )
+
+    output_pages = []
+
+    quota_error, reserved = reserve_batch_quota(user_id)
+    if quota_error:
+        return quota_error
     with PerformanceTimer("batch_coloring_conversion"):
         try:
-            for key in file_keys:
-                if key not in request.files:
-                    continue
-                file = request.files[key]
-                output_pngs.append(
-                    _coloring_bitmap(
-                        file.read(),
-                        trim_size,
-                        with_bleed=with_bleed,
-                        **coloring_opts,
-                    )
+            uploads = [(key, request.files[key].read()) for key in file_keys]
+            outcomes = render_coloring_batch(uploads, trim_size, with_bleed=with_bleed, **coloring_opts)
+            failed = [
+                {"file": outcome.key, "code": outcome.error_code, "message": outcome.error_message}
+                for outcome in outcomes
+                if not outcome.ok
+            ]
+            if failed:
+                refund_batch_usage(user_id, reserved)
+                return error_response(
+                    f"{len(failed)} of {len(outcomes)} files could not be converted",
+                    failed[0]["code"],
+                    details={"failed_files": failed},
+                    status_code=400,
                 )
+            output_pages = [outcome.gray for outcome in outcomes]
 
-            pdf_writer = PdfWriter()
+            pdf_writer = RasterPdfWriter(*get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed))
 
             if generate_cover and cover_title:
-                cover_bytes = generate_title_page_pdf(cover_title, trim_size, with_bleed=with_bleed)
-                cover_reader = PdfReader(io.BytesIO(cover_bytes))
-                pdf_writer.add_page(cover_reader.pages[0])
-
-            for png_bytes in output_pngs:
-                pdf_writer.add_page(_png_bytes_to_pdf_page(png_bytes, trim_size, with_bleed=with_bleed))
+                pdf_writer.add_title_page(cover_title)
 
-            target_w, target_h = get_kdp_dimensions(trim_size, "print", with_bleed=with_bleed)
-            while len(pdf_writer.pages) < MIN_PAGE_COUNT or len(pdf_writer.pages) % 2 != 0:
-                pdf_writer.add_blank_page(width=target_w, height=target_h)
+            for gray in output_pages:
+                pdf_writer.add_bitmap_page(gray)
 
-            final_pdf_buffer = io.BytesIO()
-            pdf_writer.write(final_pdf_buffer)
-            final_pdf_bytes = final_pdf_buffer.getvalue()
+            pdf_writer.pad_for_print(MIN_PAGE_COUNT)
+            final_pdf_bytes = pdf_writer.getvalue()
 
             filename = f"batch_coloring_{uuid.uuid4().hex[:8]}.pdf"
             storage_info = upload_file(final_pdf_bytes, str(user_id), filename, "batch_coloring_pdf")
@@ -404,7 +394,7 @@ def batch_convert_coloring():
                 "batch_coloring_conversion",
                 {
                     "status": "success",
-                    "file_count": len(output_pngs),
+                    "file_count": len(output_pages),
                     "has_cover": bool(generate_cover and cover_title),
                     "file_size_mb": round(len(final_pdf_bytes) / (1024 * 1024), 2),
                     "format": "PDF",
@@ -412,20 +402,21 @@ def batch_convert_coloring():
                     "engine": coloring_opts["engine"],
                 },
             )
-            record_batch_usage(user_id)
             return success_response(
                 {
                     "download_url": storage_info["signed_url"],
-                    "preview": (generate_optimized_preview(output_pngs[0], "image") if output_pngs else None),
+                    "preview": (generate_optimized_preview(output_pages[0], "gray") if output_pages else None),
                     "file_size_mb": round(len(final_pdf_bytes) / (1024 * 1024), 2),
                     "format": "PDF",
-                    "page_count": len(pdf_writer.pages),
+                    "page_count": pdf_writer.page_count,
                     "with_bleed": with_bleed,
                 }
             )
         except ColoringParamError as exc:
+            refund_batch_usage(user_id, reserved)
             return error_response(str(exc), exc.code, status_code=400)
         except Exception as e:
+            refund_batch_usage(user_id, reserved)
             current_app.logger.error(f"Batch coloring conversion failed: {str(e)}")
             record_pdf_analytics(
                 user_id,
@@ -443,16 +434,23 @@ def batch_convert_coloring():
 @pdf_bp.route("/pdf/validate-kdp", methods=["POST"])
 @rate_limit_pdf_processing
 @jwt_required()
+@upload_limit("pdf")
 def validate_kdp():
     user_id = get_jwt_identity()
     if "file" not in request.files:
         return error_response("No file uploaded", "MISSING_FILE", status_code=400)
 
     file = request.files["file"]
+    upload_error = check_pdf_upload(file)
+    if upload_error:
+        return upload_error
     trim_size = request.form.get("trim_size", "8.5x11")
     target_format = request.form.get("target_format", "print")
     with_bleed = "print" in target_format
     print_profile = request.form.get("print_profile", "bw_white")
+    # Image DPI / font embedding analysis parses every page, so it is opt-in (preflight=true);
+    # the dashboard's automatic check on upload stays on the page-tree scan.
+    run_preflight = request.form.get("preflight", "false").lower() in ("1", "true", "yes")
 
     try:
         get_trim(trim_size)
@@ -461,10 +459,10 @@ def validate_kdp():
 
     with PerformanceTimer("kdp_validation"):
         try:
-            pdf_bytes = file.read()
-            reader = PdfReader(io.BytesIO(pdf_bytes))
+            # Reads only the xref, trailer and page tree of the spooled upload.
+            scan = inspect_pdf(file.stream)
 
-            num_pages = len(reader.pages)
+            num_pages = scan.page_count
             if num_pages == 0:
                 return error_response("PDF contains no pages", "EMPTY_PDF", status_code=400)
 
@@ -480,30 +478,26 @@ def validate_kdp():
                 errors.append(f"Standard color requires at least {STANDARD_COLOR_MIN_PAGES} pages (got {num_pages}).")
 
             mismatched = 0
-            for idx, page in enumerate(reader.pages, start=1):
-                media_box = page.mediabox
-                pdf_width = float(media_box.width) / 72
-                pdf_height = float(media_box.height) / 72
+            for idx in range(num_pages):
+                pdf_width, pdf_height = scan.page_size_inches(idx)
                 if abs(pdf_width - expected.width) >= 0.05 or abs(pdf_height - expected.height) >= 0.05:
                     mismatched += 1
                     if mismatched <= 5:
                         warnings.append(
-                            f"Page {idx} size {pdf_width:.2f}x{pdf_height:.2f} in "
+                            f"Page {idx + 1} size {pdf_width:.2f}x{pdf_height:.2f} in "
                             f"does not match expected {expected.width:.2f}x{expected.height:.2f} in."
                         )
             if mismatched > 5:
                 warnings.append(f"...and {mismatched - 5} additional page size mismatches.")
 
             # Font / image checks (best-effort)
-            try:
-                if reader.metadata is None:
-                    warnings.append("PDF has no document metadata.")
-            except Exception:
-                pass
-
-            first_page = reader.pages[0]
-            pdf_width = float(first_page.mediabox.width) / 72
-            pdf_height = float(first_page.mediabox.height) / 72
+            if not scan.has_info:
+                warnings.append("PDF has no document metadata.")
+            preflight = preflight_pdf(file.stream) if run_preflight else None
+            if preflight is not None:
+                warnings.extend(preflight.warnings())
+
+            pdf_width, pdf_height = scan.page_size_inches(0)
             dimension_match = mismatched == 0
             is_valid = dimension_match and not errors
 
@@ -527,6 +521,7 @@ def validate_kdp():
                     "warnings": warnings + errors,
                     "with_bleed": with_bleed,
                     "trim_size": trim_size,
+                    "preflight": preflight.to_dict() if preflight is not None else None,
                     "message": (
                         "PDF validation complete. Always confirm with Amazon KDP Print Previewer "
                         "and a physical proof before publishing."
@@ -5,6 +5,7 @@ import stripe
 from flask import Blueprint, request
 
 from src.models.user import UserProfile, get_jwt_identity, jwt_required, supabase
+from src.services.usage_counters import get_usage_store
 from src.utils.responses import error_response, success_response
 
 subscription_bp = Blueprint("subscription", __name__)
@@ -162,6 +163,7 @@ def _update_profile(user_id, fields):
     if not supabase or not fields:
         return False
     payload = {**fields, "updated_at": datetime.utcnow().isoformat()}
+    UserProfile.invalidate(user_id)
     try:
         res = supabase.table("user_profiles").update(payload).eq("id", str(user_id)).execute()
         return bool(res.data)
@@ -279,70 +281,98 @@ def _tier_usage_for_user(user_id):
     return limits, conversions, batch_ops
 
 
+def _quota_error(kind, used, limit):
+    label = "conversion" if kind == "conversions" else "batch processing"
+    return error_response(
+        f"Monthly {label} limit reached. Upgrade your plan to continue.",
+        "QUOTA_EXCEEDED",
+        details={"kind": kind, "used": used, "limit": limit},
+        status_code=403,
+    )
+
+
 def enforce_conversion_quota(user_id):
+    """Fast refusal from the request's profile; the work itself runs under reserve_conversion_quota."""
     limits, used, _ = _tier_usage_for_user(user_id)
     limit = limits["monthly_conversions"]
     if limit == -1:
         return None
     if used >= limit:
-        return error_response(
-            "Monthly conversion limit reached. Upgrade your plan to continue.",
-            "QUOTA_EXCEEDED",
-            details={"kind": "conversions", "used": used, "limit": limit},
-            status_code=403,
-        )
+        return _quota_error("conversions", used, limit)
     return None
 
 
 def enforce_batch_quota(user_id):
+    """Fast refusal from the request's profile; the work itself runs under reserve_batch_quota."""
     limits, _, used = _tier_usage_for_user(user_id)
     limit = limits["batch_processing_limit"]
     if limit == -1:
         return None
     if used >= limit:
-        return error_response(
-            "Monthly batch processing limit reached. Upgrade your plan to continue.",
-            "QUOTA_EXCEEDED",
-            details={"kind": "batch_operations", "used": used, "limit": limit},
-            status_code=403,
-        )
+        return _quota_error("batch_operations", used, limit)
     return None
 
 
-def record_conversion_usage(user_id, amount=1):
-    if not supabase or amount < 1:
-        return
-    profile = UserProfile.get_by_id(user_id)
-    if not profile:
-        return
-    current = profile.get("conversions_this_month", 0) or 0
-    try:
-        supabase.table("user_profiles").update(
-            {
-                "conversions_this_month": current + amount,
-                "updated_at": datetime.utcnow().isoformat(),
-            }
-        ).eq("id", str(user_id)).execute()
-    except Exception as usage_error:
-        print(f"Failed to record conversion usage for {user_id}: {usage_error}")
+_USAGE_LIMIT_KEYS = {"conversions": "monthly_conversions", "batch_operations": "batch_processing_limit"}
 
 
-def record_batch_usage(user_id, amount=1):
-    if not supabase or amount < 1:
-        return
-    profile = UserProfile.get_by_id(user_id)
-    if not profile:
-        return
-    current = profile.get("batch_operations_this_month", 0) or 0
+def _consume_usage(user_id, kind, amount):
+    """Apply ``amount`` to the counter; returns (allowed, used, recorded).
+
+    Without a usage store, or when the store fails, the work is allowed but nothing was recorded,
+    so there is nothing to refund either.
+    """
+    store = get_usage_store()
+    if store is None:
+        return True, None, False
+    limit_key = _USAGE_LIMIT_KEYS[kind]
+    tier_limits = {tier: spec[limit_key] for tier, spec in SUBSCRIPTION_TIERS.items()}
     try:
-        supabase.table("user_profiles").update(
-            {
-                "batch_operations_this_month": current + amount,
-                "updated_at": datetime.utcnow().isoformat(),
-            }
-        ).eq("id", str(user_id)).execute()
+        allowed, used = store.consume(str(user_id), kind, amount, tier_limits)
     except Exception as usage_error:
-        print(f"Failed to record batch usage for {user_id}: {usage_error}")
+        print(f"Failed to update {kind} usage for {user_id}: {usage_error}")
+        return True, None, False
+    finally:
+        UserProfile.invalidate(user_id)
+    return allowed, used, allowed
+
+
+def _reserve_usage(user_id, kind, amount):
+    limits, _, _ = _tier_usage_for_user(user_id)
+    allowed, used, recorded = _consume_usage(user_id, kind, amount)
+    if allowed:
+        return None, amount if recorded else 0
+    return _quota_error(kind, used, limits[_USAGE_LIMIT_KEYS[kind]]), 0
+
+
+def _refund_usage(user_id, kind, reserved):
+    if reserved > 0:
+        _consume_usage(user_id, kind, -reserved)
+
+
+def reserve_conversion_quota(user_id, amount=1):
+    """Count ``amount`` conversions before doing them; returns (error_response or None, reserved).
+
+    Check and increment are one atomic step, so parallel requests cannot overshoot the quota.
+    ``reserved`` is how many conversions were actually recorded (0 if the counter could not be
+    updated); pass it to refund_conversion_usage if the conversion then fails.
+    """
+    return _reserve_usage(user_id, "conversions", amount)
+
+
+def refund_conversion_usage(user_id, reserved):
+    """Give back what reserve_conversion_quota recorded; a reservation of 0 is a no-op."""
+    _refund_usage(user_id, "conversions", reserved)
+
+
+def reserve_batch_quota(user_id, amount=1):
+    """Count ``amount`` batch operations before running them; see reserve_conversion_quota."""
+    return _reserve_usage(user_id, "batch_operations", amount)
+
+
+def refund_batch_usage(user_id, reserved):
+    """Give back what reserve_batch_quota recorded; a reservation of 0 is a no-op."""
+    _refund_usage(user_id, "batch_operations", reserved)
 
 
 @subscription_bp.route("/upgrade", methods=["POST"])
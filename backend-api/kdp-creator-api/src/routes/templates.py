@@ -1,16 +1,65 @@
+import json
+import threading
 import uuid
 
-from flask import Blueprint, request
+from flask import Blueprint, current_app, request
 
 from src.data.templates import catalog_payload, get_template
 from src.models.user import get_jwt_identity, jwt_required
 from src.services.kdp_specs import KdpSpecError
+from src.services.result_cache import cache_from_env, content_key
 from src.utils.rate_limit import rate_limit_pdf_processing
 from src.utils.responses import error_response, success_response
 
 templates_bp = Blueprint("templates", __name__)
 
 
+_UPLOADED = None
+_UPLOADED_LOCK = threading.Lock()
+
+
+def uploaded_products():
+    """Storage paths + preview of products a user already uploaded (TEMPLATE_UPLOADS_CACHE_MB / _CACHE_DIR)."""
+    global _UPLOADED
+    with _UPLOADED_LOCK:
+        if _UPLOADED is None:
+            _UPLOADED = cache_from_env("TEMPLATE_UPLOADS", 8)
+        return _UPLOADED
+
+
+def _reuse_uploads(upload_key: str, submit_stage, create_signed_url, client):
+    """Fresh signed URLs for an identical earlier upload, or None if it is unknown or gone."""
+    blob = uploaded_products().get(upload_key)
+    if blob is None:
+        return None
+    record = json.loads(blob)
+    interior_url = submit_stage(create_signed_url, record["interior_path"], client=client)
+    cover_url = submit_stage(create_signed_url, record["cover_path"], client=client)
+    urls = (interior_url.result(), cover_url.result())
+    if not all(urls):
+        return None
+    return urls + (record.get("preview"),)
+
+
+def _discard_uploads(uploads, delete_file, client):
+    """Cancel pending uploads and delete the ones that still finish, so a failed request leaves no objects."""
+    for upload in uploads:
+        if upload.cancel():
+            continue
+
+        def _delete(done):
+            if done.exception() is None:
+                delete_file(done.result()["path"], client=client)
+
+        upload.add_done_callback(_delete)
+
+
+def _in_app_context(app, fn, *args):
+    # Stage threads have no app context; the preview logs through current_app.
+    with app.app_context():
+        return fn(*args)
+
+
 @templates_bp.route("/templates", methods=["GET"])
 def list_templates():
     niche = request.args.get("niche")
@@ -29,9 +78,16 @@ def get_template_detail(template_id):
 @rate_limit_pdf_processing
 @jwt_required()
 def generate_template_product(template_id):
-    from src.routes.subscription import enforce_conversion_quota, enforce_template_tier, record_conversion_usage
+    from src.routes.pdf_processing import generate_optimized_preview
+    from src.routes.subscription import (
+        enforce_conversion_quota,
+        enforce_template_tier,
+        refund_conversion_usage,
+        reserve_conversion_quota,
+    )
     from src.services.template_generator import generate_product
-    from src.storage import upload_file
+    from src.services.template_pool import submit_stage
+    from src.storage import create_signed_url, delete_file, storage_client, upload_file
 
     user_id = get_jwt_identity()
     quota_error = enforce_conversion_quota(user_id)
@@ -49,30 +105,56 @@ def generate_template_product(template_id):
     payload = request.get_json(silent=True) or {}
     options = payload.get("options") if isinstance(payload.get("options"), dict) else payload
 
+    quota_error, reserved = reserve_conversion_quota(user_id)
+    if quota_error:
+        return quota_error
     try:
         result = generate_product(template, options)
     except KdpSpecError as exc:
+        refund_conversion_usage(user_id, reserved)
         return error_response(str(exc), "KDP_SPEC_ERROR", status_code=400)
     except Exception:
+        refund_conversion_usage(user_id, reserved)
         return error_response("Generation failed", "GENERATION_ERROR", status_code=500)
 
-    try:
+    # Output is deterministic, so a user's earlier upload of the same product only needs new URLs.
+    upload_key = content_key(user_id, result.product_key)
+    # Stage threads have no request, so the caller's RLS-scoped client is resolved here.
+    client = storage_client()
+    reused = _reuse_uploads(upload_key, submit_stage, create_signed_url, client) if result.product_key else None
+    if reused is not None:
+        interior_url, cover_url, preview_b64 = reused
+    else:
+        # Both uploads and the preview only need the finished PDFs; run them side by side.
+        app = current_app._get_current_object()
         interior_name = f"interior_{template_id}_{uuid.uuid4().hex[:8]}.pdf"
         cover_name = f"cover_{template_id}_{uuid.uuid4().hex[:8]}.pdf"
-        interior_info = upload_file(result.interior_pdf, str(user_id), interior_name, "template_interior")
-        cover_info = upload_file(result.cover_pdf, str(user_id), cover_name, "template_cover")
-    except Exception:
-        return error_response("Upload failed", "UPLOAD_ERROR", status_code=500)
-
-    preview_b64 = None
-    try:
-        from src.routes.pdf_processing import generate_optimized_preview
-
-        preview_b64 = generate_optimized_preview(result.interior_pdf, "pdf")
-    except Exception:
-        preview_b64 = None
+        interior_upload = submit_stage(
+            upload_file, result.interior_pdf, str(user_id), interior_name, "template_interior", client=client
+        )
+        cover_upload = submit_stage(
+            upload_file, result.cover_pdf, str(user_id), cover_name, "template_cover", client=client
+        )
+        preview = submit_stage(_in_app_context, app, generate_optimized_preview, result.interior_pdf, "pdf")
+
+        try:
+            interior_info = interior_upload.result()
+            cover_info = cover_upload.result()
+        except Exception:
+            _discard_uploads((interior_upload, cover_upload), delete_file, client)
+            refund_conversion_usage(user_id, reserved)
+            return error_response("Upload failed", "UPLOAD_ERROR", status_code=500)
+
+        try:
+            preview_b64 = preview.result()
+        except Exception:
+            preview_b64 = None
+
+        interior_url = interior_info.get("signed_url")
+        cover_url = cover_info.get("signed_url")
+        record = {"interior_path": interior_info["path"], "cover_path": cover_info["path"], "preview": preview_b64}
+        uploaded_products().put(upload_key, json.dumps(record).encode("utf-8"))
 
-    record_conversion_usage(user_id)
     return success_response(
         {
             "template_id": template_id,
@@ -80,8 +162,8 @@ def generate_template_product(template_id):
             "trim_size": result.trim_size,
             "print_profile": result.print_profile,
             "with_bleed": result.with_bleed,
-            "interior_download_url": interior_info.get("signed_url"),
-            "cover_download_url": cover_info.get("signed_url"),
+            "interior_download_url": interior_url,
+            "cover_download_url": cover_url,
             "cover": {
                 "width_in": result.cover_width_in,
                 "height_in": result.cover_height_in,
@@ -90,6 +172,7 @@ def generate_template_product(template_id):
             },
             "compliance": result.compliance,
             "preview": preview_b64,
+            "cached": result.cached,
             "message": (
                 "Generated print-ready interior and paperback cover. "
                 "Run Amazon KDP Print Previewer and order a proof before publishing."
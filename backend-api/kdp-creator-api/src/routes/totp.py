@@ -9,7 +9,7 @@ totp_bp = Blueprint("totp", __name__)
 
 
 @totp_bp.route("/2fa/setup", methods=["POST"])
-@jwt_required()
+@jwt_required(verify_remote=True)
 def setup_2fa():
     user_id = get_jwt_identity()
     profile = UserProfile.get_by_id(user_id)
@@ -20,6 +20,7 @@ def setup_2fa():
 
     secret = pyotp.random_base32()
     data_client().table("user_profiles").update({"totp_secret": secret}).eq("id", user_id).execute()
+    UserProfile.invalidate(user_id)
 
     totp = pyotp.TOTP(secret)
     provisioning_uri = totp.provisioning_uri(
@@ -37,7 +38,7 @@ def setup_2fa():
 
 
 @totp_bp.route("/2fa/verify", methods=["POST"])
-@jwt_required()
+@jwt_required(verify_remote=True)
 def verify_2fa():
     user_id = get_jwt_identity()
     profile = UserProfile.get_by_id(user_id)
@@ -56,6 +57,7 @@ def verify_2fa():
     totp = pyotp.TOTP(secret)
     if totp.verify(code, valid_window=1):
         data_client().table("user_profiles").update({"totp_enabled": True}).eq("id", user_id).execute()
+        UserProfile.invalidate(user_id)
         return success_response(
             {"mfa_token": issue_mfa_token(user_id)},
             "2FA has been enabled successfully",
@@ -65,7 +67,7 @@ def verify_2fa():
 
 
 @totp_bp.route("/2fa/disable", methods=["POST"])
-@jwt_required()
+@jwt_required(verify_remote=True)
 def disable_2fa():
     user_id = get_jwt_identity()
     profile = UserProfile.get_by_id(user_id)
@@ -88,6 +90,7 @@ def disable_2fa():
                 "totp_secret": None,
             }
         ).eq("id", user_id).execute()
+        UserProfile.invalidate(user_id)
         return success_response(message="2FA has been disabled")
 
     return error_response("Invalid verification code", "VALIDATION_ERROR", status_code=400)
@@ -8,6 +8,7 @@ from src.models.user import (
     admin_required,
     bearer_token,
     data_client,
+    forget_access_token,
     get_jwt_identity,
     jwt_required,
     revoke_supabase_session,
@@ -77,6 +78,7 @@ def get_current_user():
 @log_request
 def logout():
     token = bearer_token()
+    forget_access_token(token)
     try:
         if token:
             revoke_supabase_session(token, "global")
@@ -87,7 +89,7 @@ def logout():
 
 
 @user_bp.route("/users", methods=["GET"])
-@jwt_required()
+@jwt_required(verify_remote=True)
 @admin_required
 def get_users():
     try:
@@ -138,6 +140,7 @@ def update_user(user_id):
     try:
         with PerformanceTimer(f"update_user:{user_id}"):
             res = data_client().table("user_profiles").update(update_data).eq("id", user_id).execute()
+            UserProfile.invalidate(user_id)
             if not res.data:
                 return error_response("User not found", "USER_NOT_FOUND", status_code=404)
 
@@ -149,7 +152,7 @@ def update_user(user_id):
 
 
 @user_bp.route("/users/<user_id>", methods=["DELETE"])
-@jwt_required()
+@jwt_required(verify_remote=True)
 @log_request
 def delete_user(user_id):
     current_user_id = get_jwt_identity()
@@ -164,6 +167,7 @@ def delete_user(user_id):
     try:
         with PerformanceTimer(f"delete_user:{user_id}"):
             data_client().table("user_profiles").delete().eq("id", user_id).execute()
+            UserProfile.invalidate(user_id)
             try:
                 supabase.auth.admin.delete_user(user_id)
             except Exception as auth_delete_error:
@@ -180,7 +184,7 @@ def delete_user(user_id):
 
 
 @user_bp.route("/account", methods=["DELETE"])
-@jwt_required()
+@jwt_required(verify_remote=True)
 @log_request
 def delete_own_account():
     """Self-service account deletion (profile + auth user)."""
@@ -243,6 +247,7 @@ def sync_user_profile():
                 "updated_at": datetime.utcnow().isoformat(),
             }
             res = data_client().table("user_profiles").insert(new_profile_data).execute()
+            UserProfile.invalidate(user_id)
             if not res.data:
                 return error_response(
                     "Failed to create user profile",
@@ -0,0 +1,148 @@
+"""Batch job handlers run by the job-queue workers (see src/services/job_queue.py).
+
+Each handler reads its inputs from storage, runs the same pipeline as the synchronous
+/pdf routes, reports progress per file, and returns the job's result document.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import uuid
+
+from src.services.coloring import ColoringParamError, coloring_gray
+from src.services.job_queue import JobContext, JobWorkerPool, PermanentJobError, get_job_store
+from src.services.kdp_specs import MIN_PAGE_COUNT, KdpSpecError, interior_page_size_pts
+from src.services.pdf_format import format_pdf_for_kdp
+from src.services.raster_pdf import RasterPdfWriter
+from src.storage import download_file, upload_file
+
+# Client-facing names accepted by /batch/submit → queue job_type.
+JOB_TYPE_ALIASES = {
+    "convert_image": "convert_image",
+    "coloring": "convert_image",
+    "coloring_book": "convert_image",
+    "convert_pdf": "convert_pdf",
+    "format_kdp": "convert_pdf",
+}
+
+
+def _basename(path: str) -> str:
+    return path.rsplit("/", 1)[-1]
+
+
+def run_coloring_job(ctx: JobContext) -> dict:
+    """convert_image: every input becomes one line-art page of a single print-ready PDF."""
+    payload = ctx.payload
+    inputs = payload.get("inputs") or []
+    trim_size = payload.get("trim_size", "8.5x11")
+    with_bleed = bool(payload.get("with_bleed", True))
+    cover_title = (payload.get("cover_title") or "").strip()
+
+    try:
+        writer = RasterPdfWriter(*interior_page_size_pts(trim_size, with_bleed=with_bleed))
+    except KdpSpecError as exc:
+        raise PermanentJobError(str(exc)) from exc
+    if cover_title:
+        writer.add_title_page(cover_title)
+
+    for index, path in enumerate(inputs, start=1):
+        ctx.check_cancelled()
+        try:
+            gray = coloring_gray(download_file(path), trim_size, with_bleed=with_bleed, **payload.get("coloring", {}))
+        except ColoringParamError as exc:
+            raise PermanentJobError(f"{_basename(path)}: {exc}") from exc
+        writer.add_bitmap_page(gray)
+        del gray
+        ctx.progress(index)
+
+    writer.pad_for_print(MIN_PAGE_COUNT)
+    pdf_bytes = writer.getvalue()
+    ctx.check_cancelled()
+    storage_info = upload_file(
+        pdf_bytes, str(ctx.job["user_id"]), f"batch_coloring_{uuid.uuid4().hex[:8]}.pdf", "batch_coloring_pdf"
+    )
+    return {
+        "outputs": [
+            {
+                "source": [_basename(path) for path in inputs],
+                "path": storage_info["path"],
+                "page_count": writer.page_count,
+                "file_size_bytes": storage_info["file_size_bytes"],
+            }
+        ],
+        "trim_size": trim_size,
+        "with_bleed": with_bleed,
+    }
+
+
+def run_format_job(ctx: JobContext) -> dict:
+    """convert_pdf: reformat each input PDF to the KDP trim; one output per input."""
+    payload = ctx.payload
+    trim_size = payload.get("trim_size", "8.5x11")
+    target_format = payload.get("target_format", "kdp-print")
+    outputs = []
+
+    for index, path in enumerate(payload.get("inputs") or [], start=1):
+        ctx.check_cancelled()
+        try:
+            formatted = format_pdf_for_kdp(download_file(path), trim_size, target_format)
+        except KdpSpecError as exc:
+            raise PermanentJobError(str(exc)) from exc
+        storage_info = upload_file(
+            formatted.pdf_bytes, str(ctx.job["user_id"]), f"kdp_{uuid.uuid4().hex[:8]}.pdf", "kdp_formatted_pdf"
+        )
+        outputs.append(
+            {
+                "source": _basename(path),
+                "path": storage_info["path"],
+                "page_count": formatted.page_count,
+                "file_size_bytes": storage_info["file_size_bytes"],
+            }
+        )
+        ctx.progress(index)
+
+    return {"outputs": outputs, "trim_size": trim_size, "target_format": target_format}
+
+
+JOB_HANDLERS = {
+    "convert_image": run_coloring_job,
+    "convert_pdf": run_format_job,
+}
+
+
+def refund_job_quota(job: dict) -> None:
+    """Give back the batch quota reserved at submit (payload reserved_quota) for a job that never ran to completion."""
+    from src.routes.subscription import refund_batch_usage
+
+    refund_batch_usage(job["user_id"], int((job.get("payload") or {}).get("reserved_quota") or 0))
+
+
+def configured_job_workers() -> int:
+    raw = os.environ.get("JOB_WORKERS", "").strip()
+    try:
+        return max(1, int(raw)) if raw else 2
+    except ValueError:
+        return 2
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def start_job_workers(size: int | None = None) -> JobWorkerPool:
+    """Start (once per process) the worker pool that drains the batch-job queue."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = JobWorkerPool(
+                get_job_store(), JOB_HANDLERS, size=size or configured_job_workers(), on_failed=refund_job_quota
+            ).start()
+        return _POOL
+
+
+def notify_job_workers() -> None:
+    """Wake in-process workers after an enqueue; no-op when workers run out of process."""
+    if os.environ.get("JOB_WORKERS_EMBEDDED", "1").strip().lower() in ("0", "false", "no"):
+        return
+    start_job_workers().notify()
@@ -7,7 +7,10 @@ Not a skimage/scipy verbatim port — behavioral target only.
 
 from __future__ import annotations
 
+import hashlib
 import io
+import struct
+import threading
 from typing import Any, Union
 
 import cv2
@@ -15,6 +18,7 @@ import numpy as np
 from PIL import Image, ImageEnhance
 
 from src.services.kdp_specs import PRINT_DPI, interior_page_size_pts
+from src.services.result_cache import LRUByteCache, TieredByteCache, cache_from_env, content_key
 
 # Reject absurd uploads before decode/process (WS7-A). ~50MP covers typical phone photos.
 MAX_SOURCE_PIXELS = 50_000_000
@@ -22,8 +26,19 @@ DETAIL_LEVELS = frozenset({"low", "medium", "high"})
 EDGE_MODES = frozenset({"off", "mild", "strong"})
 ENGINES = frozenset({"legacy", "enhanced"})
 
+# Bump whenever engine output changes so cached results from older code are never served.
+ENGINE_CACHE_VERSION = 2
+
+# Draft renders for the settings panel: ~1/10 the pixels of a 300-DPI page, still larger
+# than the 600 px preview so the thumbnail is downsampled, not upscaled.
+PREVIEW_WORKING_DPI = 96
+
 DETAIL_SIGMA = {"low": 2.0, "medium": 1.0, "high": 0.5}
 EDGE_DILATE_ITERS = {"off": 0, "mild": 1, "strong": 2}
+# Peak working-set budget for _enhanced_lines, in bytes per page pixel (canvas excluded):
+# three float32 buffers during the Sobel stage plus the uint8 working planes. ~140 MB for
+# 8.5x11 with bleed at 300 DPI, vs ~43 B/px (~370 MB) for the former float64 pipeline.
+ENHANCED_PEAK_BYTES_PER_PIXEL = 16
 
 
 class ColoringParamError(ValueError):
@@ -34,15 +49,27 @@ class ColoringParamError(ValueError):
         self.code = code
 
 
-def _target_pixels(trim_size: str, with_bleed: bool) -> tuple[int, int]:
+def _target_pixels(trim_size: str, with_bleed: bool, dpi: int = PRINT_DPI) -> tuple[int, int]:
     target_width_pt, target_height_pt = interior_page_size_pts(trim_size, with_bleed=with_bleed)
     return (
-        int(target_width_pt / 72 * PRINT_DPI),
-        int(target_height_pt / 72 * PRINT_DPI),
+        int(target_width_pt / 72 * dpi),
+        int(target_height_pt / 72 * dpi),
     )
 
 
-def _load_rgb(img_bytes: bytes, *, flatten_alpha: bool) -> Image.Image:
+def _fit_size(src_width: int, src_height: int, target_width: int, target_height: int) -> tuple[int, int]:
+    """Largest aspect-preserving size that fits the target box."""
+    aspect_ratio = src_width / src_height
+    if aspect_ratio > target_width / target_height:
+        return target_width, int(target_width / aspect_ratio)
+    return int(target_height * aspect_ratio), target_height
+
+
+def _load_rgb(img_bytes: bytes, *, flatten_alpha: bool, fit_within: tuple[int, int] | None = None) -> Image.Image:
+    """Decode to RGB. With fit_within, JPEGs are DCT-downscaled at decode time (1/2, 1/4, 1/8)
+    to the smallest size that still covers the aspect-fit target, so a 48 MP photo bound for
+    an ~8 MP page is never decoded at full size.
+    """
     image = Image.open(io.BytesIO(img_bytes))
     w, h = image.size
     if w * h > MAX_SOURCE_PIXELS:
@@ -50,6 +77,8 @@ def _load_rgb(img_bytes: bytes, *, flatten_alpha: bool) -> Image.Image:
             f"Image too large ({w}×{h}). Max {MAX_SOURCE_PIXELS} pixels.",
             "IMAGE_TOO_LARGE",
         )
+    if fit_within is not None and image.format == "JPEG":
+        image.draft(None, _fit_size(w, h, *fit_within))
     if flatten_alpha and image.mode in ("RGBA", "LA", "P"):
         background = Image.new("RGB", image.size, (255, 255, 255))
         rgba = image.convert("RGBA")
@@ -58,19 +87,10 @@ def _load_rgb(img_bytes: bytes, *, flatten_alpha: bool) -> Image.Image:
     return image.convert("RGB")
 
 
-def _prepare_canvas(image: Image.Image, trim_size: str, with_bleed: bool) -> Image.Image:
+def _prepare_canvas(image: Image.Image, trim_size: str, with_bleed: bool, dpi: int = PRINT_DPI) -> Image.Image:
     """Aspect-fit + white pad to KDP trim pixels (Suite framing, not stretch-to-box)."""
-    target_width_px, target_height_px = _target_pixels(trim_size, with_bleed)
-    img_width, img_height = image.size
-    aspect_ratio = img_width / img_height
-    target_aspect = target_width_px / target_height_px
-
-    if aspect_ratio > target_aspect:
-        new_width = target_width_px
-        new_height = int(new_width / aspect_ratio)
-    else:
-        new_height = target_height_px
-        new_width = int(new_height * aspect_ratio)
+    target_width_px, target_height_px = _target_pixels(trim_size, with_bleed, dpi)
+    new_width, new_height = _fit_size(*image.size, target_width_px, target_height_px)
     image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
     padded = Image.new("RGB", (target_width_px, target_height_px), (255, 255, 255))
@@ -80,36 +100,66 @@ def _prepare_canvas(image: Image.Image, trim_size: str, with_bleed: bool) -> Ima
     return padded
 
 
-def _png_bytes_from_gray_u8(gray: np.ndarray) -> bytes:
+def _canvas_gray(
+    img_bytes: bytes, trim_size: str, with_bleed: bool, *, flatten_alpha: bool, dpi: int = PRINT_DPI
+) -> np.ndarray:
+    """Decoded, resized, padded grayscale trim canvas — cached, since no engine knob affects it.
+
+    Both engines share the canvas (RGB→GRAY is the same luma either way); only alpha
+    flattening differs, so it is part of the key. The returned array is read-only.
+    """
+    key = content_key("canvas", image_digest(img_bytes), trim_size, bool(with_bleed), flatten_alpha, dpi)
+    cache = canvas_cache()
+    blob = cache.get(key)
+    if blob is not None:
+        return _unpack_canvas(blob)
+    image = _load_rgb(img_bytes, flatten_alpha=flatten_alpha, fit_within=_target_pixels(trim_size, with_bleed, dpi))
+    padded = _prepare_canvas(image, trim_size, with_bleed, dpi)
+    gray = cv2.cvtColor(np.array(padded), cv2.COLOR_RGB2GRAY)
+    cache.put(key, _pack_canvas(gray))
+    return gray
+
+
+def png_bytes_from_gray(gray: np.ndarray) -> bytes:
+    """Encode an engine result as PNG (PNG download path)."""
     output_buffer = io.BytesIO()
     Image.fromarray(gray).save(output_buffer, format="PNG")
     return output_buffer.getvalue()
 
 
+def legacy_coloring_gray(
+    img_bytes: bytes,
+    trim_size: str,
+    threshold: int = 127,
+    with_bleed: bool = True,
+    dpi: int = PRINT_DPI,
+) -> np.ndarray:
+    """Current Suite path: grayscale + fixed binary threshold. Returns uint8 0/255 at trim pixels."""
+    gray = _canvas_gray(img_bytes, trim_size, with_bleed, flatten_alpha=False, dpi=dpi)
+    _, binary = cv2.threshold(gray, int(threshold), 255, cv2.THRESH_BINARY)
+    return binary
+
+
 def legacy_coloring_bitmap(
     img_bytes: bytes,
     trim_size: str,
     threshold: int = 127,
     with_bleed: bool = True,
 ) -> bytes:
-    """Current Suite path: grayscale + fixed binary threshold."""
-    image = _load_rgb(img_bytes, flatten_alpha=False)
-    padded = _prepare_canvas(image, trim_size, with_bleed)
-    cv_image = cv2.cvtColor(np.array(padded), cv2.COLOR_RGB2BGR)
-    gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
-    _, binary = cv2.threshold(gray, int(threshold), 255, cv2.THRESH_BINARY)
-    return _png_bytes_from_gray_u8(binary)
+    """PNG-encoded legacy_coloring_gray."""
+    return png_bytes_from_gray(legacy_coloring_gray(img_bytes, trim_size, threshold, with_bleed))
 
 
 def _remove_small_objects(mask: np.ndarray, min_size: int = 5) -> np.ndarray:
-    """mask: bool, True = keep (line). Drop connected components smaller than min_size."""
-    u8 = mask.astype(np.uint8)
-    num, labels, stats, _ = cv2.connectedComponentsWithStats(u8, connectivity=8)
-    out = np.zeros_like(u8)
-    for label in range(1, num):
-        if stats[label, cv2.CC_STAT_AREA] >= min_size:
-            out[labels == label] = 1
-    return out.astype(bool)
+    """mask: bool, True = keep (line). Drop connected components smaller than min_size.
+
+    One pass over the label image: a per-label keep table indexed by the labels, instead
+    of a full-image comparison per component.
+    """
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=8)
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_size
+    keep[0] = False  # label 0 is the background (False pixels)
+    return keep[labels]
 
 
 def _remove_small_holes(mask: np.ndarray, area_threshold: int = 10) -> np.ndarray:
@@ -121,7 +171,7 @@ def _remove_small_holes(mask: np.ndarray, area_threshold: int = 10) -> np.ndarra
     return ~cleaned_inv
 
 
-def enhanced_coloring_bitmap(
+def enhanced_coloring_gray(
     img_bytes: bytes,
     trim_size: str,
     *,
@@ -130,8 +180,13 @@ def enhanced_coloring_bitmap(
     threshold: Union[str, int] = "auto",
     contrast: int = 0,
     edge_enhancement: str = "mild",
-) -> bytes:
-    """OpenCV reimplementation of kdp_converter line-art knobs; Suite framing retained."""
+    dpi: int = PRINT_DPI,
+) -> np.ndarray:
+    """OpenCV reimplementation of kdp_converter line-art knobs; Suite framing retained.
+
+    Below PRINT_DPI (previews) blur sigma, dilation and the speck/hole areas scale with the
+    resolution so the draft looks like a downsized print render.
+    """
     detail_level = (detail_level or "medium").lower()
     edge_enhancement = (edge_enhancement or "mild").lower()
     if detail_level not in DETAIL_LEVELS:
@@ -140,46 +195,77 @@ def enhanced_coloring_bitmap(
         raise ColoringParamError("Invalid edge_enhancement", "INVALID_EDGE_ENHANCEMENT")
     contrast = int(max(-50, min(50, int(contrast))))
 
-    image = _load_rgb(img_bytes, flatten_alpha=True)
-    padded = _prepare_canvas(image, trim_size, with_bleed)
-    gray = cv2.cvtColor(np.array(padded), cv2.COLOR_RGB2GRAY)
-    equalized = cv2.equalizeHist(gray)
+    gray = _canvas_gray(img_bytes, trim_size, with_bleed, flatten_alpha=True, dpi=dpi)
+    return _enhanced_lines(
+        gray,
+        detail_level=detail_level,
+        threshold=threshold,
+        contrast=contrast,
+        edge_enhancement=edge_enhancement,
+        scale=dpi / PRINT_DPI,
+    )
+
 
-    working = equalized
+def _enhanced_lines(
+    gray: np.ndarray,
+    *,
+    detail_level: str,
+    threshold: Union[str, int],
+    contrast: int,
+    edge_enhancement: str,
+    scale: float = 1.0,
+) -> np.ndarray:
+    """Enhanced engine on a prepared canvas, kept within ENHANCED_PEAK_BYTES_PER_PIXEL.
+
+    Edges run in float32 in one scratch buffer: the squared gradient magnitude is compared
+    against (0.1 · max)², so no sqrt/normalized copies exist, and the float buffers are
+    released before component cleanup allocates its int32 labels.
+    """
+    working = cv2.equalizeHist(gray)
     if contrast != 0:
         pil = Image.fromarray(working)
         factor = 1 + (contrast / 100.0)
         working = np.array(ImageEnhance.Contrast(pil).enhance(factor), dtype=np.uint8)
 
-    sigma = DETAIL_SIGMA[detail_level]
-    blurred = cv2.GaussianBlur(working.astype(np.float64), (0, 0), sigmaX=sigma)
-
-    gx = cv2.Sobel(blurred, cv2.CV_64F, 1, 0, ksize=3)
-    gy = cv2.Sobel(blurred, cv2.CV_64F, 0, 1, ksize=3)
-    mag = np.hypot(gx, gy)
-    mag_norm = mag / (float(mag.max()) + 1e-8)
-    edge_bool = mag_norm > 0.1
+    sigma = DETAIL_SIGMA[detail_level] * scale
+    blurred = working.astype(np.float32)
+    cv2.GaussianBlur(blurred, (0, 0), sigmaX=sigma, dst=blurred)
+    grad_sq = cv2.Sobel(blurred, cv2.CV_32F, 1, 0, ksize=3)
+    cv2.multiply(grad_sq, grad_sq, dst=grad_sq)
+    gy = cv2.Sobel(blurred, cv2.CV_32F, 0, 1, ksize=3)
+    del blurred
+    cv2.multiply(gy, gy, dst=gy)
+    cv2.add(grad_sq, gy, dst=grad_sq)
+    del gy
+    edge_limit = 0.1 * (float(np.sqrt(grad_sq.max())) + 1e-8)
+    edges = cv2.compare(grad_sq, edge_limit * edge_limit, cv2.CMP_GT)
+    del grad_sq
     dilate_iters = EDGE_DILATE_ITERS[edge_enhancement]
+    if dilate_iters > 0 and scale != 1.0:
+        dilate_iters = max(1, round(dilate_iters * scale))
     if dilate_iters > 0:
-        kernel = np.ones((3, 3), np.uint8)
-        edge_bool = cv2.dilate(edge_bool.astype(np.uint8), kernel, iterations=dilate_iters).astype(bool)
+        edges = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=dilate_iters)
 
     if threshold == "auto" or (isinstance(threshold, str) and threshold.lower() == "auto"):
-        otsu_in = working.astype(np.uint8)
-        threshold_value, _ = cv2.threshold(otsu_in, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        threshold_value = float(threshold_value)
+        threshold_value, _ = cv2.threshold(working, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
     else:
-        threshold_value = float(max(0, min(255, int(threshold))))
+        threshold_value = max(0, min(255, int(threshold)))
 
-    # Dark pixels → line (True)
-    binary = working.astype(np.float64) < threshold_value
-    binary = _remove_small_objects(binary, min_size=5)
-    binary = _remove_small_holes(binary, area_threshold=10)
-    result = binary | edge_bool
+    # Dark pixels → line (True); integer compare, so no float copy of the page.
+    binary = working < int(np.ceil(threshold_value))
+    area_scale = scale * scale
+    binary = _remove_small_objects(binary, min_size=max(1, round(5 * area_scale)))
+    binary = _remove_small_holes(binary, area_threshold=max(1, round(10 * area_scale)))
+    np.logical_or(binary, edges, out=binary)
 
     # True (line) → 0 black; False → 255 white
-    out = ((1 - result.astype(np.uint8)) * 255).astype(np.uint8)
-    return _png_bytes_from_gray_u8(out)
+    np.logical_not(binary, out=binary)
+    return binary.view(np.uint8) * np.uint8(255)
+
+
+def enhanced_coloring_bitmap(img_bytes: bytes, trim_size: str, **kwargs) -> bytes:
+    """PNG-encoded enhanced_coloring_gray."""
+    return png_bytes_from_gray(enhanced_coloring_gray(img_bytes, trim_size, **kwargs))
 
 
 def parse_coloring_form(form: Any) -> dict:
@@ -246,7 +332,7 @@ def parse_coloring_form(form: Any) -> dict:
     }
 
 
-def coloring_bitmap(
+def coloring_gray(
     img_bytes: bytes,
     trim_size: str,
     *,
@@ -256,11 +342,12 @@ def coloring_bitmap(
     detail_level: str = "medium",
     contrast: int = 0,
     edge_enhancement: str = "mild",
-) -> bytes:
-    """Dispatcher: default engine=legacy preserves prior output path."""
+    dpi: int = PRINT_DPI,
+) -> np.ndarray:
+    """Dispatcher: default engine=legacy preserves prior output path. Returns uint8 0 (line) / 255 (paper)."""
     engine = (engine or "legacy").lower()
     if engine == "enhanced":
-        return enhanced_coloring_bitmap(
+        return enhanced_coloring_gray(
             img_bytes,
             trim_size,
             with_bleed=with_bleed,
@@ -268,12 +355,116 @@ def coloring_bitmap(
             threshold=threshold,
             contrast=contrast,
             edge_enhancement=edge_enhancement,
+            dpi=dpi,
         )
     if engine != "legacy":
         raise ColoringParamError("engine must be 'legacy' or 'enhanced'", "INVALID_ENGINE")
-    return legacy_coloring_bitmap(
+    return legacy_coloring_gray(
         img_bytes,
         trim_size,
         threshold=int(threshold) if threshold != "auto" else 127,
         with_bleed=with_bleed,
+        dpi=dpi,
     )
+
+
+def coloring_bitmap(img_bytes: bytes, trim_size: str, **kwargs) -> bytes:
+    """PNG-encoded coloring_gray (same keyword arguments)."""
+    return png_bytes_from_gray(coloring_gray(img_bytes, trim_size, **kwargs))
+
+
+_RESULT_CACHE = None
+_CANVAS_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def result_cache():
+    """Process-wide cache of finished pages (COLORING_RESULT_CACHE_MB / _CACHE_DIR)."""
+    global _RESULT_CACHE
+    with _CACHE_LOCK:
+        if _RESULT_CACHE is None:
+            _RESULT_CACHE = cache_from_env("COLORING_RESULT", 64)
+        return _RESULT_CACHE
+
+
+def canvas_cache():
+    """Process-wide cache of prepared 8-bit canvases (COLORING_CANVAS_CACHE_MB / _CACHE_DIR)."""
+    global _CANVAS_CACHE
+    with _CACHE_LOCK:
+        if _CANVAS_CACHE is None:
+            _CANVAS_CACHE = cache_from_env("COLORING_CANVAS", 128)
+        return _CANVAS_CACHE
+
+
+def disable_stage_caches() -> None:
+    """Batch pool workers see each upload once; keep their memory for rendering."""
+    global _RESULT_CACHE, _CANVAS_CACHE
+    with _CACHE_LOCK:
+        _RESULT_CACHE = TieredByteCache(LRUByteCache(0))
+        _CANVAS_CACHE = TieredByteCache(LRUByteCache(0))
+
+
+def _effective_opts(
+    engine: str = "legacy",
+    threshold: Union[str, int] = 127,
+    detail_level: str = "medium",
+    contrast: int = 0,
+    edge_enhancement: str = "mild",
+) -> dict:
+    """Only the knobs the chosen engine reads, so e.g. legacy ignores a contrast slider."""
+    engine = (engine or "legacy").lower()
+    if engine == "legacy":
+        return {"engine": engine, "threshold": int(threshold) if threshold != "auto" else 127}
+    return {
+        "engine": engine,
+        "threshold": str(threshold).lower() if isinstance(threshold, str) else int(threshold),
+        "detail_level": (detail_level or "medium").lower(),
+        "contrast": int(max(-50, min(50, int(contrast)))),
+        "edge_enhancement": (edge_enhancement or "mild").lower(),
+    }
+
+
+def image_digest(img_bytes: bytes) -> str:
+    """SHA-256 of the uploaded bytes — the content address for every coloring cache."""
+    return hashlib.sha256(img_bytes).hexdigest()
+
+
+def coloring_result_key(digest: str, trim_size: str, *, with_bleed: bool = True, dpi: int = PRINT_DPI, **opts) -> str:
+    """Upload digest + normalized engine options + framing and working DPI."""
+    effective = _effective_opts(**opts)
+    return content_key(ENGINE_CACHE_VERSION, digest, trim_size, bool(with_bleed), dpi, sorted(effective.items()))
+
+
+def _pack_gray(gray: np.ndarray) -> bytes:
+    height, width = gray.shape
+    return struct.pack(">II", height, width) + np.packbits(gray >= 128, axis=1).tobytes()
+
+
+def _unpack_gray(blob: bytes) -> np.ndarray:
+    height, width = struct.unpack_from(">II", blob)
+    packed = np.frombuffer(blob, dtype=np.uint8, offset=8).reshape(height, -1)
+    return np.unpackbits(packed, axis=1, count=width) * np.uint8(255)
+
+
+def _pack_canvas(gray: np.ndarray) -> bytes:
+    height, width = gray.shape
+    return struct.pack(">II", height, width) + np.ascontiguousarray(gray).tobytes()
+
+
+def _unpack_canvas(blob: bytes) -> np.ndarray:
+    height, width = struct.unpack_from(">II", blob)
+    return np.frombuffer(blob, dtype=np.uint8, offset=8).reshape(height, width)
+
+
+def cached_coloring_gray(
+    img_bytes: bytes, trim_size: str, *, with_bleed: bool = True, dpi: int = PRINT_DPI, **opts
+) -> tuple:
+    """coloring_gray through the result cache. Returns (gray, cache_hit)."""
+    key = coloring_result_key(image_digest(img_bytes), trim_size, with_bleed=with_bleed, dpi=dpi, **opts)
+    cache = result_cache()
+    blob = cache.get(key)
+    if blob is not None:
+        return _unpack_gray(blob), True
+    gray = coloring_gray(img_bytes, trim_size, with_bleed=with_bleed, dpi=dpi, **opts)
+    cache.put(key, _pack_gray(gray))
+    return gray, False
@@ -0,0 +1,141 @@
+"""Bounded process-pool execution for the per-image coloring stage.
+
+Batch Coloring renders every upload through the same CPU-bound OpenCV pipeline. Running
+those renders in a shared process pool lets a batch use every core instead of one request
+thread. COLORING_WORKERS sets the pool size; 0/1 (or Vercel, where worker processes are
+not available) keeps the old in-thread serial path.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+from src.services.coloring import ColoringParamError, coloring_gray, disable_stage_caches
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_SIZE = 0
+_POOL_LOCK = threading.Lock()
+
+
+@dataclass
+class ColoringOutcome:
+    """Result for one uploaded file; exactly one of gray / error_code is set."""
+
+    key: str
+    gray: Optional[np.ndarray] = None
+    error_code: Optional[str] = None
+    error_message: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error_code is None
+
+
+def configured_workers() -> int:
+    """Pool size from COLORING_WORKERS; defaults to the CPU count (serial on Vercel)."""
+    raw = os.environ.get("COLORING_WORKERS", "").strip()
+    if raw:
+        try:
+            return max(0, int(raw))
+        except ValueError:
+            return 1
+    if os.environ.get("VERCEL"):
+        return 1
+    return os.cpu_count() or 1
+
+
+def _init_worker() -> None:
+    # One OpenCV thread per process; the pool is the parallelism.
+    try:
+        import cv2
+
+        cv2.setNumThreads(1)
+    except Exception:
+        pass
+    disable_stage_caches()
+
+
+def _render_one(img_bytes: bytes, trim_size: str, with_bleed: bool, opts: dict[str, Any]):
+    """Worker entrypoint. ColoringParamError does not survive pickling with its code, so flatten it."""
+    try:
+        return coloring_gray(img_bytes, trim_size, with_bleed=with_bleed, **opts), None, None
+    except ColoringParamError as exc:
+        return None, exc.code, str(exc)
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_SIZE != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False, cancel_futures=True)
+            # spawn: forking a parent that already runs OpenCV/BLAS threads can deadlock children.
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            _POOL_SIZE = workers
+        return _POOL
+
+
+def _discard_pool() -> None:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+        _POOL_SIZE = 0
+
+
+def shutdown_pool() -> None:
+    """Stop worker processes (tests / graceful shutdown)."""
+    _discard_pool()
+
+
+def _render_serial(items: list[tuple[str, bytes]], trim_size: str, with_bleed: bool, opts: dict[str, Any]):
+    outcomes = []
+    for key, img_bytes in items:
+        gray, code, message = _render_one(img_bytes, trim_size, with_bleed, opts)
+        outcomes.append(ColoringOutcome(key, gray, code, message))
+    return outcomes
+
+
+def render_coloring_batch(
+    items: Iterable[tuple[str, bytes]],
+    trim_size: str,
+    *,
+    with_bleed: bool = True,
+    workers: Optional[int] = None,
+    **coloring_opts,
+) -> list[ColoringOutcome]:
+    """Render (key, image bytes) pairs; outcomes keep input order with per-file errors.
+
+    Unexpected (non-parameter) exceptions propagate, matching the serial path.
+    """
+    items = list(items)
+    if workers is None:
+        workers = configured_workers()
+    if workers <= 1 or len(items) <= 1:
+        return _render_serial(items, trim_size, with_bleed, coloring_opts)
+
+    try:
+        pool = _get_pool(workers)
+        futures = [pool.submit(_render_one, img_bytes, trim_size, with_bleed, coloring_opts) for _, img_bytes in items]
+        outcomes = []
+        for (key, _), future in zip(items, futures):
+            gray, code, message = future.result()
+            outcomes.append(ColoringOutcome(key, gray, code, message))
+        return outcomes
+    except (BrokenProcessPool, OSError, PermissionError):
+        # Worker died or the platform cannot start processes — drop the pool and finish in-thread.
+        _discard_pool()
+        return _render_serial(items, trim_size, with_bleed, coloring_opts)
@@ -0,0 +1,555 @@
+"""Durable batch-job queue: leased claims, heartbeats, retries with backoff, cancellation.
+
+Jobs live in the batch_jobs table (see scripts/migrations/batch_job_queue.sql), so a worker
+process that dies only loses its lease: once lease_expires_at passes, another worker
+reclaims the job. Without Supabase (local dev, tests) the same table is kept in SQLite.
+
+Concurrency is bounded twice: the worker pool size caps jobs per process, and
+TIER_CONCURRENCY caps how many jobs one user may have running at once.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Optional
+
+from src.utils.logger import log_error_msg, log_warning
+
+DEFAULT_LEASE_SECONDS = 120
+HEARTBEAT_SECONDS = 30
+DEFAULT_MAX_ATTEMPTS = 3
+BACKOFF_BASE_SECONDS = 10
+BACKOFF_MAX_SECONDS = 600
+
+# Max jobs running at once per user, by subscription tier.
+TIER_CONCURRENCY = {"free": 1, "pro": 2, "studio": 4, "unlimited": 8}
+
+ACTIVE_STATUSES = ("queued", "processing")
+
+
+class JobCancelled(Exception):
+    """The job was cancelled or its lease was lost; stop without touching the row."""
+
+
+class PermanentJobError(Exception):
+    """Bad input that retrying cannot fix — fail the job immediately."""
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat()
+
+
+def backoff_seconds(attempts: int) -> int:
+    return min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+
+
+def tier_limit(tier: Optional[str]) -> int:
+    return TIER_CONCURRENCY.get(tier or "free", TIER_CONCURRENCY["free"])
+
+
+# ============================================================================
+# Stores
+# ============================================================================
+
+
+class SqliteJobStore:
+    """Local stand-in for the Postgres queue. One connection, serialized by a lock."""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS batch_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            job_type TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            tier TEXT NOT NULL DEFAULT 'free',
+            total_files INTEGER NOT NULL DEFAULT 0,
+            processed_files INTEGER NOT NULL DEFAULT 0,
+            payload TEXT,
+            result TEXT,
+            error_message TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 3,
+            leased_by TEXT,
+            lease_expires_at TEXT,
+            heartbeat_at TEXT,
+            next_run_at TEXT,
+            created_at TEXT,
+            completed_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_batch_jobs_status_next_run ON batch_jobs (status, next_run_at);
+    """
+    _JSON_FIELDS = ("payload", "result")
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(self._SCHEMA)
+
+    def _row(self, row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        for field in self._JSON_FIELDS:
+            if job.get(field):
+                job[field] = json.loads(job[field])
+        return job
+
+    def _get(self, job_id) -> Optional[dict]:
+        return self._row(self._conn.execute("SELECT * FROM batch_jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def enqueue(self, job: dict) -> dict:
+        fields = {
+            "status": "queued",
+            "max_attempts": DEFAULT_MAX_ATTEMPTS,
+            "created_at": _iso(_now()),
+            **job,
+        }
+        for field in self._JSON_FIELDS:
+            if field in fields and fields[field] is not None:
+                fields[field] = json.dumps(fields[field])
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        with self._lock:
+            cur = self._conn.execute(
+                f"INSERT INTO batch_jobs ({columns}) VALUES ({placeholders})",  # nosec B608 - column names are ours
+                tuple(fields.values()),
+            )
+            return self._get(cur.lastrowid)
+
+    def get(self, job_id) -> Optional[dict]:
+        with self._lock:
+            return self._get(job_id)
+
+    def list_for_user(self, user_id: str, limit: int = 50) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM batch_jobs WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT ?",
+                (user_id, limit),
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim(self, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[dict]:
+        now = _iso(_now())
+        lease_until = _iso(_now() + timedelta(seconds=lease_seconds))
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                candidates = self._conn.execute(
+                    """
+                    SELECT * FROM batch_jobs
+                    WHERE (status = 'queued' AND (next_run_at IS NULL OR next_run_at <= ?))
+                       OR (status = 'processing' AND lease_expires_at < ?)
+                    ORDER BY created_at, id
+                    LIMIT 100
+                    """,
+                    (now, now),
+                ).fetchall()
+                running = dict(
+                    self._conn.execute(
+                        """
+                        SELECT user_id, COUNT(*) FROM batch_jobs
+                        WHERE status = 'processing' AND lease_expires_at >= ?
+                        GROUP BY user_id
+                        """,
+                        (now,),
+                    ).fetchall()
+                )
+                claimed = None
+                for row in candidates:
+                    if row["status"] == "processing" and row["attempts"] >= row["max_attempts"]:
+                        # Lease expired on the final attempt: the worker kept dying on this job.
+                        self._conn.execute(
+                            "UPDATE batch_jobs SET status = 'failed', error_message = ?, leased_by = NULL, "
+                            "completed_at = ? WHERE id = ?",
+                            ("Worker lost the job too many times", now, row["id"]),
+                        )
+                        continue
+                    if running.get(row["user_id"], 0) >= tier_limit(row["tier"]):
+                        continue
+                    self._conn.execute(
+                        "UPDATE batch_jobs SET status = 'processing', leased_by = ?, lease_expires_at = ?, "
+                        "heartbeat_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (worker_id, lease_until, now, row["id"]),
+                    )
+                    claimed = row["id"]
+                    break
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._get(claimed) if claimed is not None else None
+
+    def _update_leased(self, job_id, worker_id: str, assignments: str, params: tuple) -> bool:
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE batch_jobs SET {assignments} "  # nosec B608 - assignments are ours
+                "WHERE id = ? AND leased_by = ? AND status = 'processing'",
+                (*params, job_id, worker_id),
+            )
+            return cur.rowcount > 0
+
+    def heartbeat(self, job_id, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        now = _now()
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "lease_expires_at = ?, heartbeat_at = ?",
+            (_iso(now + timedelta(seconds=lease_seconds)), _iso(now)),
+        )
+
+    def progress(self, job_id, worker_id: str, processed_files: int) -> bool:
+        return self._update_leased(job_id, worker_id, "processed_files = ?", (processed_files,))
+
+    def complete(self, job_id, worker_id: str, result: dict) -> bool:
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "status = 'completed', result = ?, leased_by = NULL, completed_at = ?, error_message = NULL",
+            (json.dumps(result), _iso(_now())),
+        )
+
+    def retry_later(self, job_id, worker_id: str, error: str, delay_seconds: int) -> bool:
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "status = 'queued', leased_by = NULL, lease_expires_at = NULL, error_message = ?, next_run_at = ?",
+            (error, _iso(_now() + timedelta(seconds=delay_seconds))),
+        )
+
+    def fail(self, job_id, worker_id: str, error: str) -> bool:
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "status = 'failed', leased_by = NULL, error_message = ?, completed_at = ?",
+            (error, _iso(_now())),
+        )
+
+    def cancel(self, job_id, user_id: str) -> Optional[str]:
+        """Cancel an active job; returns the status it was cancelled from, or None."""
+        with self._lock:
+            for status in ACTIVE_STATUSES:
+                cur = self._conn.execute(
+                    "UPDATE batch_jobs SET status = 'cancelled', leased_by = NULL, completed_at = ? "
+                    "WHERE id = ? AND user_id = ? AND status = ?",
+                    (_iso(_now()), job_id, user_id, status),
+                )
+                if cur.rowcount > 0:
+                    return status
+            return None
+
+
+class SupabaseJobStore:
+    """batch_jobs via PostgREST; claims go through the claim_batch_job RPC (FOR UPDATE SKIP LOCKED)."""
+
+    def __init__(self, client, list_client: Optional[Callable[[], Any]] = None):
+        self.client = client
+        # Listing runs on-request with the caller's JWT so RLS applies.
+        self._list_client = list_client or (lambda: client)
+
+    def _table(self):
+        return self.client.table("batch_jobs")
+
+    def enqueue(self, job: dict) -> dict:
+        fields = {"status": "queued", "max_attempts": DEFAULT_MAX_ATTEMPTS, **job}
+        res = self._table().insert(fields).execute()
+        if not res.data:
+            raise RuntimeError("Failed to create job")
+        return res.data[0]
+
+    def get(self, job_id) -> Optional[dict]:
+        res = self._table().select("*").eq("id", job_id).maybe_single().execute()
+        return res.data if res and res.data else None
+
+    def list_for_user(self, user_id: str, limit: int = 50) -> list[dict]:
+        res = (
+            self._list_client()
+            .table("batch_jobs")
+            .select("*")
+            .eq("user_id", user_id)
+            .order("created_at", desc=True)
+            .limit(limit)
+            .execute()
+        )
+        return res.data or []
+
+    def claim(self, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[dict]:
+        res = self.client.rpc(
+            "claim_batch_job",
+            {
+                "p_worker_id": worker_id,
+                "p_lease_seconds": lease_seconds,
+                "p_tier_limits": TIER_CONCURRENCY,
+            },
+        ).execute()
+        rows = res.data or []
+        if isinstance(rows, dict):
+            rows = [rows]
+        return rows[0] if rows and rows[0].get("id") is not None else None
+
+    def _update_leased(self, job_id, worker_id: str, fields: dict) -> bool:
+        res = (
+            self._table()
+            .update(fields)
+            .eq("id", job_id)
+            .eq("leased_by", worker_id)
+            .eq("status", "processing")
+            .execute()
+        )
+        return bool(res.data)
+
+    def heartbeat(self, job_id, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        now = _now()
+        return self._update_leased(
+            job_id,
+            worker_id,
+            {"lease_expires_at": _iso(now + timedelta(seconds=lease_seconds)), "heartbeat_at": _iso(now)},
+        )
+
+    def progress(self, job_id, worker_id: str, processed_files: int) -> bool:
+        return self._update_leased(job_id, worker_id, {"processed_files": processed_files})
+
+    def complete(self, job_id, worker_id: str, result: dict) -> bool:
+        return self._update_leased(
+            job_id,
+            worker_id,
+            {
+                "status": "completed",
+                "result": result,
+                "leased_by": None,
+                "completed_at": _iso(_now()),
+                "error_message": None,
+            },
+        )
+
+    def retry_later(self, job_id, worker_id: str, error: str, delay_seconds: int) -> bool:
+        return self._update_leased(
+            job_id,
+            worker_id,
+            {
+                "status": "queued",
+                "leased_by": None,
+                "lease_expires_at": None,
+                "error_message": error,
+                "next_run_at": _iso(_now() + timedelta(seconds=delay_seconds)),
+            },
+        )
+
+    def fail(self, job_id, worker_id: str, error: str) -> bool:
+        return self._update_leased(
+            job_id,
+            worker_id,
+            {"status": "failed", "leased_by": None, "error_message": error, "completed_at": _iso(_now())},
+        )
+
+    def cancel(self, job_id, user_id: str) -> Optional[str]:
+        # One conditional update per status, so the caller learns whether the job had started.
+        for status in ACTIVE_STATUSES:
+            res = (
+                self._table()
+                .update({"status": "cancelled", "leased_by": None, "completed_at": _iso(_now())})
+                .eq("id", job_id)
+                .eq("user_id", user_id)
+                .eq("status", status)
+                .execute()
+            )
+            if res.data:
+                return status
+        return None
+
+
+def _sqlite_path() -> str:
+    configured = os.environ.get("JOB_QUEUE_SQLITE_PATH")
+    if configured:
+        return configured
+    base = os.environ.get("VERCEL") and "/tmp" or os.path.join(os.path.dirname(os.path.dirname(__file__)), "database")
+    os.makedirs(base, exist_ok=True)
+    return os.path.join(base, "jobs.db")
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_job_store():
+    """Process-wide store: Supabase (service role) when configured, else local SQLite."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            from src.models.user import data_client, supabase
+
+            if supabase is not None:
+                _STORE = SupabaseJobStore(supabase, list_client=data_client)
+            else:
+                _STORE = SqliteJobStore(_sqlite_path())
+        return _STORE
+
+
+# ============================================================================
+# Workers
+# ============================================================================
+
+
+class JobContext:
+    """Handed to job handlers: progress reporting, cancellation, and the lease heartbeat."""
+
+    def __init__(self, store, job: dict, worker_id: str, lease_seconds: int, heartbeat_seconds: float):
+        self.store = store
+        self.job = job
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._lost = threading.Event()
+        self._done = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+
+    @property
+    def payload(self) -> dict:
+        return self.job.get("payload") or {}
+
+    def _beat(self):
+        while not self._done.wait(self.heartbeat_seconds):
+            try:
+                if not self.store.heartbeat(self.job["id"], self.worker_id, self.lease_seconds):
+                    self._lost.set()
+                    return
+            except Exception as heartbeat_error:
+                # Transient store error: keep trying until the lease actually runs out.
+                log_warning("Batch job heartbeat failed", job_id=self.job["id"], error=str(heartbeat_error))
+
+    def __enter__(self):
+        self._heartbeat.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._heartbeat.join(timeout=self.heartbeat_seconds)
+
+    def check_cancelled(self) -> None:
+        if self._lost.is_set():
+            raise JobCancelled()
+
+    def progress(self, processed_files: int) -> None:
+        """Record progress; raises JobCancelled when the job was cancelled or reclaimed."""
+        self.check_cancelled()
+        if not self.store.progress(self.job["id"], self.worker_id, processed_files):
+            self._lost.set()
+            raise JobCancelled()
+
+
+def _fail(store, job: dict, worker_id: str, error: str, on_failed: Optional[Callable[[dict], None]]) -> str:
+    # on_failed runs only when this worker's update landed, so a job is never settled twice.
+    if store.fail(job["id"], worker_id, error) and on_failed is not None:
+        on_failed(job)
+    return "failed"
+
+
+def run_job(
+    store,
+    job: dict,
+    handlers: dict[str, Callable[[JobContext], dict]],
+    worker_id: str,
+    lease_seconds: int = DEFAULT_LEASE_SECONDS,
+    heartbeat_seconds: float = HEARTBEAT_SECONDS,
+    on_failed: Optional[Callable[[dict], None]] = None,
+) -> str:
+    """Run one claimed job to a terminal (or retry) state; returns the resulting status.
+
+    ``on_failed(job)`` is called once the job is marked failed for good (e.g. to refund its quota).
+    """
+    handler = handlers.get(job.get("job_type"))
+    if handler is None:
+        return _fail(store, job, worker_id, f"No handler for job type '{job.get('job_type')}'", on_failed)
+    try:
+        with JobContext(store, job, worker_id, lease_seconds, heartbeat_seconds) as ctx:
+            result = handler(ctx)
+            ctx.check_cancelled()
+    except JobCancelled:
+        return "cancelled"
+    except PermanentJobError as exc:
+        return _fail(store, job, worker_id, str(exc), on_failed)
+    except Exception as exc:
+        attempts = int(job.get("attempts") or 1)
+        if attempts < int(job.get("max_attempts") or DEFAULT_MAX_ATTEMPTS):
+            store.retry_later(job["id"], worker_id, str(exc), backoff_seconds(attempts))
+            return "queued"
+        return _fail(store, job, worker_id, str(exc), on_failed)
+    if store.complete(job["id"], worker_id, result or {}):
+        return "completed"
+    return "cancelled"
+
+
+class JobWorkerPool:
+    """N polling worker threads sharing one store; safe to run in several processes at once."""
+
+    def __init__(
+        self,
+        store,
+        handlers: dict[str, Callable[[JobContext], dict]],
+        size: int = 2,
+        poll_interval: float = 1.0,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        heartbeat_seconds: float = HEARTBEAT_SECONDS,
+        on_failed: Optional[Callable[[dict], None]] = None,
+    ):
+        self.store = store
+        self.handlers = handlers
+        self.size = max(1, size)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.on_failed = on_failed
+        self.prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def run_once(self, worker_id: Optional[str] = None) -> Optional[str]:
+        """Claim and run a single job. Returns its status, or None if nothing was claimable."""
+        worker_id = worker_id or f"{self.prefix}:0"
+        job = self.store.claim(worker_id, self.lease_seconds)
+        if job is None:
+            return None
+        return run_job(
+            self.store, job, self.handlers, worker_id, self.lease_seconds, self.heartbeat_seconds, self.on_failed
+        )
+
+    def _loop(self, index: int):
+        worker_id = f"{self.prefix}:{index}"
+        while not self._stop.is_set():
+            try:
+                status = self.run_once(worker_id)
+            except Exception as worker_error:
+                log_error_msg("Batch job worker error", worker_id=worker_id, error=str(worker_error))
+                status = None
+            if status is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def notify(self):
+        """Wake idle workers (e.g. right after an enqueue)."""
+        self._wake.set()
+
+    def start(self) -> "JobWorkerPool":
+        for index in range(self.size):
+            thread = threading.Thread(target=self._loop, args=(index,), daemon=True, name=f"batch-worker-{index}")
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
@@ -0,0 +1,190 @@
+"""Reformat an uploaded manuscript PDF to a KDP interior page size.
+
+Every source page goes through one PdfWriter. Fitting turns the page's content into a Form
+XObject placed with a transform matrix on a page with a new MediaBox, so content and
+resources are referenced, never re-parsed or merged. Objects shared between pages (fonts,
+images) are cloned once, since the writer tracks what it has already copied, and byte-identical
+streams embedded separately (e.g. the same font in every chapter) are merged by content hash
+before writing.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+from dataclasses import dataclass
+from typing import BinaryIO, Union
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.generic import (
+    ArrayObject,
+    DecodedStreamObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    RectangleObject,
+    StreamObject,
+)
+
+from src.services.kdp_specs import MIN_PAGE_COUNT, interior_page_size_pts
+
+# Boxes that describe the source geometry; the fitted page only keeps a new MediaBox.
+_SOURCE_BOXES = ("/CropBox", "/BleedBox", "/TrimBox", "/ArtBox")
+_FORM_NAME = "/KdpPage"
+
+
+@dataclass
+class FormatResult:
+    pdf_bytes: bytes
+    page_count: int
+    with_bleed: bool
+
+
+def target_wants_bleed(target_format: str) -> bool:
+    return "print" in (target_format or "") and target_format != "kdp-ebook"
+
+
+def fit_transform(src_box, target_w: float, target_h: float) -> tuple[float, float, float] | None:
+    """(scale, tx, ty) that uniformly scales and centers src_box on the target (no stretch)."""
+    left, bottom, right, top = (float(value) for value in src_box)
+    src_w = right - left
+    src_h = top - bottom
+    if src_w <= 0 or src_h <= 0:
+        return None
+    scale = min(target_w / src_w, target_h / src_h)
+    tx = (target_w - src_w * scale) / 2 - left * scale
+    ty = (target_h - src_h * scale) / 2 - bottom * scale
+    return scale, tx, ty
+
+
+def _stream(writer: PdfWriter, data: bytes, shared: dict | None):
+    """Indirect stream for ``data``; identical placements (same page size) are written once."""
+    if shared is not None and data in shared:
+        return shared[data]
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    reference = writer._add_object(stream)
+    if shared is not None:
+        shared[data] = reference
+    return reference
+
+
+def _page_form(writer: PdfWriter, page):
+    """Turn a page's contents into a Form XObject and return its reference.
+
+    A single content stream is retagged in place (no decode or re-encode); an array of
+    streams is joined into one compressed stream. The form points at the page's own
+    /Resources object, so resources shared between pages stay shared.
+    """
+    contents = page.raw_get("/Contents") if "/Contents" in page else None
+    source = contents.get_object() if contents is not None else None
+    if isinstance(contents, IndirectObject) and isinstance(source, StreamObject) and "/Subtype" not in source:
+        form, reference = source, contents
+    else:
+        parts = source if isinstance(source, ArrayObject) else [source] if source is not None else []
+        joined = DecodedStreamObject()
+        joined.set_data(b"\n".join(part.get_object().get_data() for part in parts))
+        form = joined.flate_encode()
+        reference = writer._add_object(form)
+
+    form[NameObject("/Type")] = NameObject("/XObject")
+    form[NameObject("/Subtype")] = NameObject("/Form")
+    form[NameObject("/BBox")] = RectangleObject(page.mediabox)
+    form[NameObject("/Resources")] = page.raw_get("/Resources") if "/Resources" in page else DictionaryObject()
+    if "/Group" in page:
+        form[NameObject("/Group")] = page.raw_get("/Group")
+    return reference
+
+
+def _retarget(obj, remap: dict) -> None:
+    items = obj.items() if isinstance(obj, DictionaryObject) else enumerate(obj)
+    for key, value in list(items):
+        if isinstance(value, IndirectObject):
+            if value in remap:
+                obj[key] = remap[value]
+        elif isinstance(value, (DictionaryObject, ArrayObject)):
+            _retarget(value, remap)
+
+
+def merge_identical_streams(writer: PdfWriter) -> int:
+    """Point every reference to a byte-identical stream at one copy; returns how many were dropped.
+
+    Streams are compared on their encoded bytes and dictionary, so nothing is decompressed
+    (pypdf's compress_identical_objects decodes every stream to hash it).
+    """
+    first_seen: dict = {}
+    remap: dict = {}
+    for index, obj in enumerate(writer._objects):
+        if not isinstance(obj, StreamObject):
+            continue
+        key = (hashlib.sha256(obj._data).digest(), repr(sorted(obj.items())))
+        original = first_seen.setdefault(key, obj.indirect_reference)
+        if original != obj.indirect_reference:
+            remap[obj.indirect_reference] = original
+            writer._objects[index] = None
+    if remap:
+        for obj in writer._objects:
+            if isinstance(obj, (DictionaryObject, ArrayObject)):
+                _retarget(obj, remap)
+    return len(remap)
+
+
+def fit_page_to_target(writer: PdfWriter, page, target_w: float, target_h: float, shared: dict | None = None) -> None:
+    """Fit a page already added to ``writer`` onto the target canvas, in place.
+
+    The original content becomes a Form XObject drawn once through a ``cm`` transform.
+    """
+    transform = fit_transform(page.mediabox, target_w, target_h)
+    if transform is None:
+        return
+    scale, tx, ty = transform
+
+    form = _page_form(writer, page)
+    placement = b"q %.6f 0 0 %.6f %.4f %.4f cm %s Do Q" % (scale, scale, tx, ty, _FORM_NAME.encode())
+    page[NameObject("/Contents")] = _stream(writer, placement, shared)
+    page[NameObject("/Resources")] = DictionaryObject(
+        {NameObject("/XObject"): DictionaryObject({NameObject(_FORM_NAME): form})}
+    )
+    page.pop(NameObject("/Group"), None)
+
+    page.mediabox = RectangleObject([0, 0, target_w, target_h])
+    for box in _SOURCE_BOXES:
+        page.pop(NameObject(box), None)
+    # /Rotate is dropped, as the previous merge-based fitting did; annotations follow the content.
+    page.pop(NameObject("/Rotate"), None)
+    for annotation in page.get("/Annots") or []:
+        annotation = annotation.get_object()
+        if "/Rect" in annotation:
+            left, bottom, right, top = (float(value) for value in annotation["/Rect"])
+            annotation[NameObject("/Rect")] = RectangleObject(
+                [left * scale + tx, bottom * scale + ty, right * scale + tx, top * scale + ty]
+            )
+
+
+def format_pdf_for_kdp(pdf: Union[bytes, BinaryIO], trim_size: str, target_format: str = "kdp-print") -> FormatResult:
+    """Fit every page to the trim (plus bleed for print) and pad print interiors to KDP minimums.
+
+    ``pdf`` may be bytes or a seekable binary stream (e.g. the spooled upload), which is
+    read lazily rather than copied into memory.
+    """
+    with_bleed = target_wants_bleed(target_format)
+    reader = PdfReader(io.BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf)
+    writer = PdfWriter()
+    target_w, target_h = interior_page_size_pts(trim_size, with_bleed=with_bleed)
+    shared_streams: dict = {}
+
+    for source_page in reader.pages:
+        page = writer.add_page(source_page)
+        if target_format != "kdp-ebook":
+            # ebook pages pass through without print bleed sizing
+            fit_page_to_target(writer, page, target_w, target_h, shared_streams)
+
+    # Pad to even page count for print interiors
+    if with_bleed or target_format == "kdp-print":
+        while len(writer.pages) % 2 != 0 or len(writer.pages) < MIN_PAGE_COUNT:
+            writer.add_blank_page(width=target_w, height=target_h)
+
+    merge_identical_streams(writer)
+    output_buffer = io.BytesIO()
+    writer.write(output_buffer)
+    return FormatResult(output_buffer.getvalue(), len(writer.pages), with_bleed)
@@ -0,0 +1,440 @@
+"""Lazy PDF structure scan: xref, trailer and page tree only.
+
+KDP validation needs the page count, each page's MediaBox and whether the file has an /Info
+dictionary. This reads the upload through a memory map (or the in-memory spool buffer),
+follows trailer -> catalog -> page tree, and resolves inherited MediaBox values; content
+streams, fonts and images are never touched. Files it cannot read this way (encryption,
+non-Flate object streams, a damaged xref) raise PdfScanError, and inspect_pdf falls back to
+pypdf, which can repair them.
+"""
+
+from __future__ import annotations
+
+import io
+import mmap
+import re
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import NamedTuple
+
+import numpy as np
+from pypdf import PdfReader
+
+_WS = rb"\x00\t\n\x0c\r "
+_REGULAR = rb"[^\x00\t\n\x0c\r ()<>\[\]{}/%]"
+_TOKEN = re.compile(
+    rb"[%s]*(?:%%[^\r\n]*[%s]*)*" % (_WS, _WS)
+    + rb"(?:(<<)|(>>)|(\[)|(\])"  # 1-4: dict / array delimiters
+    + rb"|(/%s*)" % _REGULAR  # 5: name
+    + rb"|(\d+)[%s]+(\d+)[%s]+R(?!%s)" % (_WS, _WS, _REGULAR)  # 6-7: indirect reference
+    + rb"|([+-]?(?:\d+\.?\d*|\.\d+))"  # 8: number
+    + rb"|(<[0-9A-Fa-f%s]*>)" % _WS  # 9: hex string
+    + rb"|(\()"  # 10: literal string
+    + rb"|([A-Za-z]+))"  # 11: keyword
+)
+_KEY = re.compile(rb"[%s]*(?:%%[^\r\n]*[%s]*)*(?:(/%s*)|(>>))" % (_WS, _WS, _REGULAR))
+_NUMBER = rb"[%s]*([+-]?(?:\d+\.?\d*|\.\d+))" % _WS
+# Fast path for the common all-number rectangle ([0 0 612 792]).
+_RECT = re.compile(_NUMBER * 4 + rb"[%s]*\]" % _WS)
+_STRING_BOUNDARY = re.compile(rb"[()\\]")
+# Delimiters that change nesting while skipping a value (hex strings and comments are opaque).
+_SKIP = re.compile(rb"<<|>>|\[|\]|\(|<[^>]*>|%[^\r\n]*")
+_OBJ_HEADER = re.compile(rb"[%s]*(\d+)[%s]+(\d+)[%s]+obj" % (_WS, _WS, _WS))
+_STREAM_START = re.compile(rb"[%s]*stream(?:\r\n|\n|\r)" % _WS)
+_XREF_SUBSECTION = re.compile(rb"[%s]*(\d+)[%s]+(\d+)[\t\x0c ]*(?:\r\n|\n|\r)" % (_WS, _WS))
+_XREF_ENTRY = re.compile(rb"[%s]*(\d{10})[ ]+(\d{5})[ ]+([nf])" % _WS)
+_TRAILER = re.compile(rb"[%s]*trailer" % _WS)
+_STARTXREF = re.compile(rb"startxref[%s]+(\d+)" % _WS)
+_KEYWORDS = {b"true": True, b"false": False, b"null": None}
+_NODE_KEYS = frozenset({"/Type", "/Kids", "/MediaBox"})
+_CLOSE = object()
+
+
+class PdfScanError(Exception):
+    """The file needs a full parser (damaged, encrypted or using unsupported features)."""
+
+
+class Ref(NamedTuple):
+    num: int
+    gen: int
+
+
+class _Stream(NamedTuple):
+    info: dict
+    start: int
+
+
+def parse_value(buf, pos: int, keys: frozenset | None = None):
+    """Parse one PDF object starting at pos; returns (value, end). Names are str, strings bytes.
+
+    With ``keys``, a top-level dictionary keeps only those entries; other values are skipped
+    without being tokenized.
+    """
+    match = _TOKEN.match(buf, pos)
+    if match is None:
+        raise PdfScanError(f"unexpected data at byte {pos}")
+    kind, end = match.lastindex, match.end()
+    if kind == 1:
+        result = {}
+        while True:
+            key_match = _KEY.match(buf, end)
+            if key_match is None:
+                raise PdfScanError(f"dictionary key is not a name at byte {end}")
+            end = key_match.end()
+            if key_match.lastindex == 2:
+                return result, end
+            key = key_match.group(1).decode("latin-1")
+            if keys is None or key in keys:
+                result[key], end = parse_value(buf, end)
+            else:
+                end = _skip_value(buf, end)
+    if kind == 3:
+        rect = _RECT.match(buf, end)
+        if rect is not None:
+            return [float(number) if b"." in number else int(number) for number in rect.groups()], rect.end()
+        items = []
+        while True:
+            item, end = parse_value(buf, end)
+            if item is _CLOSE:
+                return items, end
+            items.append(item)
+    if kind in (2, 4):
+        return _CLOSE, end
+    if kind == 5:
+        return match.group(5).decode("latin-1"), end
+    if kind == 7:
+        return Ref(int(match.group(6)), int(match.group(7))), end
+    if kind == 8:
+        number = match.group(8)
+        return (float(number) if b"." in number else int(number)), end
+    if kind == 9:
+        return match.group(9), end
+    if kind == 10:
+        return _literal_string(buf, end)
+    keyword = match.group(11)
+    if keyword not in _KEYWORDS:
+        raise PdfScanError(f"unexpected keyword {keyword!r} at byte {pos}")
+    return _KEYWORDS[keyword], end
+
+
+def _skip_value(buf, pos: int) -> int:
+    match = _TOKEN.match(buf, pos)
+    if match is None or match.lastindex in (2, 4):
+        raise PdfScanError(f"missing value at byte {pos}")
+    if match.lastindex == 10:
+        return _literal_string(buf, match.end())[1]
+    if match.lastindex not in (1, 3):
+        return match.end()
+    depth, pos = 1, match.end()
+    while depth:
+        match = _SKIP.search(buf, pos)
+        if match is None:
+            raise PdfScanError("unterminated dictionary or array")
+        token, pos = match.group(), match.end()
+        if token == b"(":
+            pos = _literal_string(buf, pos)[1]
+        elif token in (b"<<", b"["):
+            depth += 1
+        elif token in (b">>", b"]"):
+            depth -= 1
+    return pos
+
+
+def _literal_string(buf, pos: int):
+    start, depth = pos, 1
+    while depth:
+        match = _STRING_BOUNDARY.search(buf, pos)
+        if match is None:
+            raise PdfScanError("unterminated string")
+        char, pos = buf[match.start()], match.end()
+        if char == 0x5C:  # backslash escapes the next byte
+            pos += 1
+        else:
+            depth += 1 if char == 0x28 else -1
+    return bytes(buf[start : pos - 1]), pos
+
+
+def _undo_png_predictor(data: bytes, parms: dict) -> bytes:
+    predictor = parms.get("/Predictor", 1)
+    if predictor == 1:
+        return data
+    if predictor < 10:
+        raise PdfScanError("TIFF predictor is not supported")
+    bpp = max(1, parms.get("/Colors", 1) * parms.get("/BitsPerComponent", 8) // 8)
+    row_len = parms.get("/Columns", 1) * bpp + 1
+    rows = np.frombuffer(data, np.uint8)[: len(data) // row_len * row_len].reshape(-1, row_len)
+    kinds, out = rows[:, 0], rows[:, 1:].copy()
+    if (kinds == 2).all():
+        # Up filter on every row (the usual xref-stream case): a running column sum, mod 256.
+        np.cumsum(out, axis=0, dtype=np.uint8, out=out)
+        return out.tobytes()
+    previous = np.zeros(out.shape[1], np.uint8)
+    for index, kind in enumerate(kinds):
+        row = out[index]
+        if kind == 1 or kind == 3 or kind == 4:
+            for col in range(row.size):
+                left = int(row[col - bpp]) if col >= bpp else 0
+                up, up_left = int(previous[col]), int(previous[col - bpp]) if col >= bpp else 0
+                if kind == 1:
+                    guess = left
+                elif kind == 3:
+                    guess = (left + up) // 2
+                else:
+                    base = left + up - up_left
+                    distances = (abs(base - left), abs(base - up), abs(base - up_left))
+                    guess = (left, up, up_left)[distances.index(min(distances))]
+                row[col] = (int(row[col]) + guess) & 0xFF
+        elif kind == 2:
+            row += previous
+        elif kind != 0:
+            raise PdfScanError(f"unknown PNG filter type {kind}")
+        previous = row
+    return out.tobytes()
+
+
+class _LazyPdf:
+    """Random access to objects through the xref; each object is parsed at most once."""
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.xref: dict[int, tuple | None] = {}
+        self.trailer: dict = {}
+        self._objects: dict[int, object] = {}
+        self._object_streams: dict[int, tuple] = {}
+        self._read_xref_chain()
+        if "/Encrypt" in self.trailer:
+            raise PdfScanError("encrypted PDF")
+
+    # --- cross-reference ------------------------------------------------------------------
+
+    def _read_xref_chain(self) -> None:
+        tail_start = max(0, len(self.buf) - 2048)
+        tail = bytes(self.buf[tail_start:])
+        match = _STARTXREF.search(tail, tail.rfind(b"startxref")) if b"startxref" in tail else None
+        if match is None:
+            raise PdfScanError("startxref not found")
+        offset, seen = int(match.group(1)), set()
+        # Newest section first; setdefault keeps the newest entry for each object.
+        while offset is not None:
+            if offset in seen or offset >= len(self.buf):
+                raise PdfScanError("broken xref chain")
+            seen.add(offset)
+            if bytes(self.buf[offset : offset + 4]) == b"xref":
+                trailer = self._read_xref_table(offset + 4)
+                if isinstance(trailer.get("/XRefStm"), int):
+                    self._read_xref_stream(trailer["/XRefStm"])
+            else:
+                trailer = self._read_xref_stream(offset)
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            offset = trailer.get("/Prev") if isinstance(trailer.get("/Prev"), int) else None
+
+    def _read_xref_table(self, pos: int) -> dict:
+        while True:
+            header = _XREF_SUBSECTION.match(self.buf, pos)
+            if header is None:
+                break
+            number, pos = int(header.group(1)), header.end()
+            for _ in range(int(header.group(2))):
+                entry = _XREF_ENTRY.match(self.buf, pos)
+                if entry is None:
+                    raise PdfScanError(f"bad xref entry at byte {pos}")
+                pos = entry.end()
+                self.xref.setdefault(number, ("offset", int(entry.group(1))) if entry.group(3) == b"n" else None)
+                number += 1
+        trailer = _TRAILER.match(self.buf, pos)
+        if trailer is None:
+            raise PdfScanError("trailer not found")
+        value, _ = parse_value(self.buf, trailer.end())
+        return value
+
+    def _read_xref_stream(self, offset: int) -> dict:
+        stream = self._object_at(offset)
+        if not isinstance(stream, _Stream) or stream.info.get("/Type") != "/XRef":
+            raise PdfScanError("startxref does not point at an xref")
+        info = stream.info
+        widths = info["/W"]
+        row_len = sum(widths)
+        data = self._stream_data(stream)
+        index = info.get("/Index") or [0, info["/Size"]]
+        pos = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for number in range(first, first + count):
+                row = data[pos : pos + row_len]
+                pos += row_len
+                fields, start = [], 0
+                for width in widths:
+                    fields.append(int.from_bytes(row[start : start + width], "big"))
+                    start += width
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self.xref.setdefault(number, ("offset", fields[1]))
+                elif kind == 2:
+                    self.xref.setdefault(number, ("objstm", fields[1], fields[2]))
+                else:
+                    self.xref.setdefault(number, None)
+        return info
+
+    # --- objects --------------------------------------------------------------------------
+
+    def _object_at(self, offset: int, keys: frozenset | None = None):
+        header = _OBJ_HEADER.match(self.buf, offset)
+        if header is None:
+            raise PdfScanError(f"no object at byte {offset}")
+        value, end = parse_value(self.buf, header.end(), keys)
+        stream = _STREAM_START.match(self.buf, end)
+        return _Stream(value, stream.end()) if stream else value
+
+    def _stream_data(self, stream: _Stream) -> bytes:
+        info = stream.info
+        length = self.resolve(info.get("/Length"))
+        if not isinstance(length, int):
+            raise PdfScanError("stream without a usable /Length")
+        raw = bytes(self.buf[stream.start : stream.start + length])
+        filters = self.resolve(info.get("/Filter"))
+        filters = [filters] if isinstance(filters, str) else filters or []
+        if not filters:
+            return raw
+        if filters != ["/FlateDecode"]:
+            raise PdfScanError(f"unsupported stream filter {filters}")
+        parms = self.resolve(info.get("/DecodeParms"))
+        parms = (parms[0] if isinstance(parms, list) else parms) or {}
+        return _undo_png_predictor(zlib.decompressobj().decompress(raw), parms)
+
+    def _object_stream(self, number: int) -> tuple:
+        cached = self._object_streams.get(number)
+        if cached is None:
+            stream = self.get(Ref(number, 0))
+            if not isinstance(stream, _Stream) or stream.info.get("/Type") != "/ObjStm":
+                raise PdfScanError(f"object {number} is not an object stream")
+            data = self._stream_data(stream)
+            first = stream.info["/First"]
+            header = [int(value) for value in data[:first].split()]
+            cached = (data, first, dict(zip(header[::2], header[1::2])))
+            self._object_streams[number] = cached
+        return cached
+
+    def get(self, ref: Ref, keys: frozenset | None = None):
+        """Object ``ref``; with ``keys`` only those dictionary entries are parsed (and not cached)."""
+        if ref.num in self._objects:
+            return self._objects[ref.num]
+        entry = self.xref.get(ref.num)
+        if entry is None:
+            value = None
+        elif entry[0] == "offset":
+            value = self._object_at(entry[1], keys)
+        else:
+            data, first, offsets = self._object_stream(entry[1])
+            value, _ = parse_value(data, first + offsets[ref.num], keys)
+        if keys is None:
+            self._objects[ref.num] = value
+        return value
+
+    def resolve(self, value):
+        for _ in range(32):
+            if not isinstance(value, Ref):
+                return value
+            value = self.get(value)
+        raise PdfScanError("reference chain too deep")
+
+    # --- page tree ------------------------------------------------------------------------
+
+    def _rect(self, value) -> tuple[float, float, float, float]:
+        rect = self.resolve(value)
+        if not isinstance(rect, list) or len(rect) != 4:
+            raise PdfScanError("page has no usable MediaBox")
+        left, bottom, right, top = (float(self.resolve(part)) for part in rect)
+        return min(left, right), min(bottom, top), max(left, right), max(bottom, top)
+
+    def media_boxes(self) -> list[tuple[float, float, float, float]]:
+        catalog = self.resolve(self.trailer.get("/Root"))
+        if not isinstance(catalog, dict):
+            raise PdfScanError("document catalog not found")
+        boxes, seen = [], set()
+        stack = [(catalog.get("/Pages"), None)]
+        while stack:
+            node_ref, inherited = stack.pop()
+            if isinstance(node_ref, Ref):
+                if node_ref.num in seen:
+                    raise PdfScanError("page tree has a cycle")
+                seen.add(node_ref.num)
+            node = self.get(node_ref, _NODE_KEYS) if isinstance(node_ref, Ref) else node_ref
+            if not isinstance(node, dict):
+                raise PdfScanError("page tree node is not a dictionary")
+            box = node.get("/MediaBox", inherited)
+            if node.get("/Type") == "/Pages" or ("/Kids" in node and node.get("/Type") != "/Page"):
+                kids = self.resolve(node.get("/Kids")) or []
+                stack.extend((kid, box) for kid in reversed(kids))
+            else:
+                boxes.append(self._rect(box))
+        return boxes
+
+
+@dataclass
+class PdfScan:
+    media_boxes: list[tuple[float, float, float, float]]
+    has_info: bool
+    engine: str = "lazy"
+
+    @property
+    def page_count(self) -> int:
+        return len(self.media_boxes)
+
+    def page_size_inches(self, index: int) -> tuple[float, float]:
+        left, bottom, right, top = self.media_boxes[index]
+        return (right - left) / 72, (top - bottom) / 72
+
+
+@contextmanager
+def _mapped(source):
+    """Zero-copy view of bytes, an in-memory spool buffer, or a memory-mapped file."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield source
+        return
+    if getattr(source, "_rolled", None) is False:  # SpooledTemporaryFile still in memory
+        source = source._file
+    if isinstance(source, io.BytesIO):
+        view = source.getbuffer()
+        try:
+            yield view
+        finally:
+            view.release()
+        return
+    try:
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        source.seek(0)
+        yield source.read()
+        return
+    try:
+        yield mapped
+    finally:
+        mapped.close()
+
+
+def scan_pdf(source) -> PdfScan:
+    """Lazy scan of bytes or a binary file object; raises PdfScanError when a full parse is needed."""
+    with _mapped(source) as buf:
+        try:
+            pdf = _LazyPdf(buf)
+            boxes = pdf.media_boxes()
+            has_info = isinstance(pdf.resolve(pdf.trailer.get("/Info")), dict)
+        except PdfScanError:
+            raise
+        except (KeyError, IndexError, TypeError, ValueError, RecursionError, zlib.error) as exc:
+            raise PdfScanError(str(exc)) from exc
+    return PdfScan(boxes, has_info)
+
+
+def inspect_pdf(source) -> PdfScan:
+    """scan_pdf, falling back to a full pypdf parse for files the lazy scan cannot read."""
+    try:
+        return scan_pdf(source)
+    except PdfScanError:
+        pass
+    if not isinstance(source, (bytes, bytearray, memoryview)):
+        source.seek(0)
+    reader = PdfReader(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source)
+    boxes = [tuple(float(value) for value in page.mediabox) for page in reader.pages]
+    return PdfScan(boxes, reader.metadata is not None, engine="pypdf")
@@ -0,0 +1,314 @@
+"""Print preflight: effective image DPI and font embedding.
+
+Each page's resources are walked once. Content streams are only scanned where the answer
+depends on them: resources that can place images, or that list a non-embedded font (which
+only matters if text is actually shown with it). The scan looks at just the operators that
+move the CTM (q, Q, cm), place an XObject (Do), select a font (Tf) or show text. Images,
+fonts and Form XObjects are analyzed once per unique object and reused wherever they are
+placed, so a 500-page manuscript that repeats one logo costs one image lookup. A time
+budget bounds the whole pass; a report that ran out of time says so instead of blocking
+the request.
+"""
+
+from __future__ import annotations
+
+import io
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, BinaryIO, Union
+
+from pypdf import PdfReader
+
+from src.services.kdp_specs import PRINT_DPI
+
+DEFAULT_TIME_BUDGET_SECONDS = 5.0
+# Rounding in the placement matrix puts exact-300 DPI images a hair under; allow for it.
+DPI_TOLERANCE = 1.0
+MAX_FORM_DEPTH = 8
+MAX_LISTED_PAGES = 10
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+_FONT_FILES = ("/FontFile", "/FontFile2", "/FontFile3")
+_DELIMITERS = rb"\s\[\]()<>{}/%"
+_BEFORE = rb"(?<![^" + _DELIMITERS + rb"])"
+_AFTER = rb"(?![^" + _DELIMITERS + rb"])"
+# Atomic groups / possessive quantifiers: operand runs for other operators (Tm, Td, re...) fail
+# fast instead of backtracking through every way of splitting the numbers.
+_NUM = rb"([+-]?+(?>\d++(?:\.\d*+)?+|\.\d++))"
+# Matches only what changes the CTM, places an XObject, selects a font or shows text; strings,
+# hex strings, comments and inline images are matched (and ignored) so their bytes are never
+# mistaken for operators.
+_OPERATORS = re.compile(
+    rb"\((?>[^()\\]++|\\.|\((?>[^()\\]++|\\.)*+\))*+\)|<<|<[0-9A-Fa-f\s]*+>|%[^\r\n]*+"
+    + (rb"|" + _BEFORE + rb"BI" + _AFTER + rb".*?\sEI" + _AFTER)
+    + (rb"|" + _BEFORE + rb"\s++".join([_NUM] * 6) + rb"\s++cm" + _AFTER)  # groups 1-6
+    + (rb"|(/[^" + _DELIMITERS + rb"]++)\s*+Do" + _AFTER)  # group 7
+    + (rb"|" + _BEFORE + rb"([qQ])" + _AFTER)  # group 8
+    + (rb"|(/[^" + _DELIMITERS + rb"]++)\s++" + _NUM + rb"\s++Tf" + _AFTER)  # groups 9-10
+    + (rb"|" + _BEFORE + rb"(Tj|TJ|'|\")" + _AFTER),  # group 11: text shown with the current font
+    re.S,
+)
+
+
+def _multiply(m, n):
+    """m x n for PDF matrices [a b c d e f] (apply m, then n)."""
+    a, b, c, d, e, f = m
+    A, B, C, D, E, F = n
+    return (a * A + b * C, a * B + b * D, c * A + d * C, c * B + d * D, e * A + f * C + E, e * B + f * D + F)
+
+
+def _object_key(ref) -> tuple[int, int] | None:
+    return (ref.idnum, ref.generation) if hasattr(ref, "idnum") else None
+
+
+@dataclass
+class ImageSummary:
+    name: str
+    pixel_width: int
+    pixel_height: int
+    placements: int = 0
+    min_effective_dpi: float = math.inf
+    pages: list[int] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "pixel_width": self.pixel_width,
+            "pixel_height": self.pixel_height,
+            "placements": self.placements,
+            "min_effective_dpi": round(self.min_effective_dpi, 1),
+            "pages": self.pages,
+        }
+
+
+@dataclass
+class FontSummary:
+    name: str
+    subtype: str
+    embedded: bool
+    pages: list[int] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"name": self.name, "subtype": self.subtype, "embedded": self.embedded, "pages": self.pages}
+
+
+@dataclass
+class PreflightReport:
+    page_count: int
+    pages_analyzed: int
+    images: list[ImageSummary]
+    fonts: list[FontSummary]
+    min_dpi: float
+    elapsed_ms: float
+
+    @property
+    def complete(self) -> bool:
+        return self.pages_analyzed == self.page_count
+
+    @property
+    def low_dpi_images(self) -> list[ImageSummary]:
+        return [image for image in self.images if image.min_effective_dpi < self.min_dpi - DPI_TOLERANCE]
+
+    @property
+    def unembedded_fonts(self) -> list[FontSummary]:
+        return [font for font in self.fonts if not font.embedded]
+
+    @property
+    def fonts_embedded(self) -> bool:
+        return not self.unembedded_fonts
+
+    def warnings(self) -> list[str]:
+        messages = []
+        for image in self.low_dpi_images:
+            messages.append(
+                f"Image {image.name} ({image.pixel_width}x{image.pixel_height} px) prints at "
+                f"{image.min_effective_dpi:.0f} DPI on page {image.pages[0]}; KDP recommends {self.min_dpi:.0f} DPI."
+            )
+        for font in self.unembedded_fonts:
+            messages.append(f"Font {font.name} is not embedded (first used on page {font.pages[0]}).")
+        if not self.complete:
+            messages.append(
+                f"Preflight stopped after {self.pages_analyzed} of {self.page_count} pages (time limit); "
+                "image and font checks are partial."
+            )
+        return messages
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "complete": self.complete,
+            "pages_analyzed": self.pages_analyzed,
+            "min_dpi": self.min_dpi,
+            "fonts_embedded": self.fonts_embedded,
+            "low_dpi_images": [image.to_dict() for image in self.low_dpi_images],
+            "unembedded_fonts": [font.to_dict() for font in self.unembedded_fonts],
+            "unique_images": len(self.images),
+            "unique_fonts": len(self.fonts),
+            "elapsed_ms": round(self.elapsed_ms, 1),
+        }
+
+
+class _Analyzer:
+    """Per-document caches keyed by object reference."""
+
+    def __init__(self):
+        self.images: dict[tuple[int, int], ImageSummary] = {}
+        self.fonts: dict[tuple[int, int], FontSummary] = {}
+        # Form -> (image placements in form space, font keys its resources use)
+        self.forms: dict[tuple[int, int], tuple[list, set]] = {}
+        self._open_forms: set[tuple[int, int]] = set()
+
+    def _font(self, key, font) -> FontSummary:
+        summary = self.fonts.get(key)
+        if summary is None:
+            font = font.get_object()
+            subtype = str(font.get("/Subtype", ""))
+            descriptor_owner = font
+            if subtype == "/Type0" and font.get("/DescendantFonts"):
+                descriptor_owner = font["/DescendantFonts"][0].get_object()
+            descriptor = descriptor_owner.get("/FontDescriptor")
+            descriptor = descriptor.get_object() if descriptor is not None else {}
+            embedded = subtype == "/Type3" or any(name in descriptor for name in _FONT_FILES)
+            name = str(font.get("/BaseFont", "")).lstrip("/") or "(unnamed)"
+            summary = FontSummary(name, subtype.lstrip("/"), embedded)
+            self.fonts[key] = summary
+        return summary
+
+    def _image(self, key, name: str, image) -> ImageSummary:
+        summary = self.images.get(key)
+        if summary is None:
+            image = image.get_object()
+            summary = ImageSummary(name.lstrip("/"), int(image.get("/Width", 0)), int(image.get("/Height", 0)))
+            self.images[key] = summary
+        return summary
+
+    def _form(self, key, form, depth: int) -> tuple[list, set]:
+        cached = self.forms.get(key)
+        if cached is None:
+            if key in self._open_forms or depth > MAX_FORM_DEPTH:
+                return [], set()
+            self._open_forms.add(key)
+            try:
+                cached = self.content(form.get_data, form.get("/Resources"), depth + 1)
+            finally:
+                self._open_forms.discard(key)
+            self.forms[key] = cached
+        return cached
+
+    def content(self, load_data, resources, depth: int = 0) -> tuple[list, set]:
+        """(placements, font keys) for one content stream: placements are (ImageSummary, matrix).
+
+        ``load_data`` returns the decoded stream and is only called when the scan is needed.
+        """
+        resources = resources.get_object() if resources is not None else {}
+        font_keys, unembedded = set(), {}
+        fonts = resources.get("/Font")
+        if fonts is not None:
+            fonts = fonts.get_object()
+            for name in fonts:
+                key = _object_key(fonts.raw_get(name)) or ("direct", id(fonts[name]))
+                if self._font(key, fonts[name]).embedded:
+                    font_keys.add(key)
+                else:
+                    unembedded[name] = key
+
+        xobjects = resources.get("/XObject")
+        xobjects = xobjects.get_object() if xobjects is not None else None
+        if not xobjects and not unembedded:
+            # Nothing placeable and every listed font is embedded: the stream is never read.
+            return [], font_keys
+
+        placements = []
+        # The selected font is graphics state too, so q/Q save and restore it with the CTM.
+        ctm, font, stack = _IDENTITY, None, []
+        for match in _OPERATORS.finditer(load_data()):
+            kind = match.lastindex
+            if kind is None:
+                continue
+            if kind == 11:
+                if font is not None:
+                    font_keys.add(font)
+            elif kind == 10:
+                font = unembedded.get(match.group(9).decode("latin-1"))
+            elif kind == 8:
+                if match.group(8) == b"q":
+                    stack.append((ctm, font))
+                elif stack:
+                    ctm, font = stack.pop()
+            elif kind == 6:
+                ctm = _multiply(tuple(float(match.group(index)) for index in range(1, 7)), ctm)
+            elif kind == 7:
+                name = match.group(7).decode("latin-1")
+                if not xobjects or name not in xobjects:
+                    continue
+                ref = xobjects.raw_get(name)
+                xobject = xobjects[name]
+                key = _object_key(ref) or ("direct", id(xobject))
+                subtype = xobject.get("/Subtype")
+                if subtype == "/Image":
+                    placements.append((self._image(key, name, xobject), ctm))
+                elif subtype == "/Form":
+                    matrix = tuple(float(value) for value in xobject.get("/Matrix", _IDENTITY))
+                    form_ctm = _multiply(matrix, ctm)
+                    form_placements, form_fonts = self._form(key, xobject, depth)
+                    placements.extend((image, _multiply(inner, form_ctm)) for image, inner in form_placements)
+                    font_keys |= form_fonts
+        return placements, font_keys
+
+
+def _content_bytes(page) -> bytes:
+    contents = page.get("/Contents")
+    if contents is None:
+        return b""
+    contents = contents.get_object()
+    if isinstance(contents, list):
+        return b"\n".join(part.get_object().get_data() for part in contents)
+    return contents.get_data()
+
+
+def preflight_pdf(
+    pdf: Union[bytes, BinaryIO],
+    *,
+    min_dpi: float = PRINT_DPI,
+    time_budget: float = DEFAULT_TIME_BUDGET_SECONDS,
+) -> PreflightReport:
+    """Effective DPI of every placed image and embedding of every font, within time_budget seconds."""
+    started = time.perf_counter()
+    deadline = started + time_budget
+    if isinstance(pdf, (bytes, bytearray)):
+        pdf = io.BytesIO(pdf)
+    else:
+        pdf.seek(0)
+    reader = PdfReader(pdf)
+    analyzer = _Analyzer()
+    page_count = len(reader.pages)
+    analyzed = 0
+
+    for page_number, page in enumerate(reader.pages, start=1):
+        if time.perf_counter() > deadline:
+            break
+        placements, font_keys = analyzer.content(lambda: _content_bytes(page), page.get("/Resources"))
+        for image, (a, b, c, d, _, _) in placements:
+            width_pts, height_pts = math.hypot(a, b), math.hypot(c, d)
+            if width_pts <= 0 or height_pts <= 0:
+                continue
+            dpi = min(image.pixel_width * 72 / width_pts, image.pixel_height * 72 / height_pts)
+            image.placements += 1
+            image.min_effective_dpi = min(image.min_effective_dpi, dpi)
+            if len(image.pages) < MAX_LISTED_PAGES and page_number not in image.pages:
+                image.pages.append(page_number)
+        for key in font_keys:
+            font = analyzer.fonts[key]
+            if len(font.pages) < MAX_LISTED_PAGES and page_number not in font.pages:
+                font.pages.append(page_number)
+        analyzed += 1
+
+    return PreflightReport(
+        page_count=page_count,
+        pages_analyzed=analyzed,
+        images=[image for image in analyzer.images.values() if image.placements],
+        fonts=[font for font in analyzer.fonts.values() if font.pages],
+        min_dpi=float(min_dpi),
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
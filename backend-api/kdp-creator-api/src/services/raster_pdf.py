@@ -0,0 +1,169 @@
+"""Single-pass PDF assembly for coloring-page line art.
+
+Engine output is strictly black/white, so each page is stored as one 1-bit DeviceGray image
+XObject (Flate) and written straight into the output PDF. No PNG encode, ReportLab canvas or
+per-page PdfReader round trip is involved, and a page costs ~1/8 of an 8-bit image.
+"""
+
+from __future__ import annotations
+
+import io
+import zlib
+
+import numpy as np
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from src.services.kdp_specs import MIN_PAGE_COUNT, PRINT_DPI
+
+# reportlab.lib.colors.grey — matches the previous ReportLab title page.
+_TITLE_GREY = "0.501961 0.501961 0.501961"
+_FONTS = {"F1": "Helvetica-Bold", "F2": "Helvetica"}
+
+
+def _pdf_text(value: str) -> bytes:
+    raw = value.encode("cp1252", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def pack_bitmap(gray: np.ndarray) -> bytes:
+    """uint8 page (0 = line, 255 = paper) → row-padded 1-bit samples, 1 = white."""
+    return np.packbits(np.asarray(gray) >= 128, axis=1).tobytes()
+
+
+class RasterPdfWriter:
+    """Append-only PDF writer for fixed-size interior pages.
+
+    Page objects are serialized as they are added, so only the compressed page data is
+    retained; the catalog, page tree and xref are written by getvalue().
+    """
+
+    _CATALOG = 1
+    _PAGES = 2
+
+    def __init__(self, page_width_pt: float, page_height_pt: float, compress_level: int = 6):
+        self.width = float(page_width_pt)
+        self.height = float(page_height_pt)
+        self.compress_level = compress_level
+        self._buffer = io.BytesIO()
+        self._buffer.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._offsets: dict[int, int] = {}
+        self._next_id = 3
+        self._page_ids: list[int] = []
+        self._font_ids: dict[str, int] = {}
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_ids)
+
+    def _reserve(self) -> int:
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id: int, body: bytes) -> None:
+        self._offsets[obj_id] = self._buffer.tell()
+        self._buffer.write(b"%d 0 obj\n" % obj_id)
+        self._buffer.write(body)
+        self._buffer.write(b"\nendobj\n")
+
+    def _write_stream(self, obj_id: int, entries: bytes, data: bytes) -> None:
+        self._write_object(
+            obj_id,
+            b"<< " + entries + b" /Length %d >>\nstream\n" % len(data) + data + b"\nendstream",
+        )
+
+    def _font(self, resource_name: str) -> int:
+        if resource_name not in self._font_ids:
+            obj_id = self._reserve()
+            self._write_object(
+                obj_id,
+                b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>"
+                % _FONTS[resource_name].encode("ascii"),
+            )
+            self._font_ids[resource_name] = obj_id
+        return self._font_ids[resource_name]
+
+    def _write_page(self, content: bytes | None, resources: bytes = b"") -> None:
+        page_id = self._reserve()
+        contents = b""
+        if content is not None:
+            content_id = self._reserve()
+            self._write_stream(content_id, b"", content)
+            contents = b" /Contents %d 0 R" % content_id
+        self._write_object(
+            page_id,
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.4f %.4f] /Resources << %s >>%s >>"
+            % (self._PAGES, self.width, self.height, resources, contents),
+        )
+        self._page_ids.append(page_id)
+
+    def add_bitmap_page(self, gray: np.ndarray, dpi: int = PRINT_DPI) -> None:
+        """Place a line-art page at its native DPI, uniformly fit and centered (no stretch)."""
+        img_h, img_w = gray.shape[:2]
+        img_w_pt = img_w * 72 / dpi
+        img_h_pt = img_h * 72 / dpi
+        scale = min(self.width / img_w_pt, self.height / img_h_pt)
+        draw_w = img_w_pt * scale
+        draw_h = img_h_pt * scale
+        x = (self.width - draw_w) / 2
+        y = (self.height - draw_h) / 2
+
+        image_id = self._reserve()
+        self._write_stream(
+            image_id,
+            b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceGray "
+            b"/BitsPerComponent 1 /Filter /FlateDecode" % (img_w, img_h),
+            zlib.compress(pack_bitmap(gray), self.compress_level),
+        )
+        content = b"q %.4f 0 0 %.4f %.4f %.4f cm /Im0 Do Q" % (draw_w, draw_h, x, y)
+        self._write_page(content, b"/XObject << /Im0 %d 0 R >>" % image_id)
+
+    def add_title_page(self, title: str, tagline: str = "KDP Creator Suite") -> None:
+        """Simple centered title page (Helvetica, grey) prepended to batch output."""
+        title = title[:80]
+        title_size = min(36, self.width / 12)
+        title_x = (self.width - stringWidth(title, _FONTS["F1"], title_size)) / 2
+        tagline_x = (self.width - stringWidth(tagline, _FONTS["F2"], 14)) / 2
+        content = b"%s rg BT /F1 %.4f Tf %.4f %.4f Td %s Tj ET BT /F2 14 Tf %.4f %.4f Td %s Tj ET" % (
+            _TITLE_GREY.encode("ascii"),
+            title_size,
+            title_x,
+            self.height / 2 + 20,
+            _pdf_text(title),
+            tagline_x,
+            self.height / 2 - 30,
+            _pdf_text(tagline),
+        )
+        fonts = b"/Font << /F1 %d 0 R /F2 %d 0 R >>" % (self._font("F1"), self._font("F2"))
+        self._write_page(content, fonts)
+
+    def add_blank_page(self) -> None:
+        self._write_page(None)
+
+    def pad_for_print(self, min_pages: int = MIN_PAGE_COUNT) -> None:
+        """Pad with blank pages to the KDP minimum and an even count."""
+        while self.page_count < min_pages or self.page_count % 2 != 0:
+            self.add_blank_page()
+
+    def getvalue(self) -> bytes:
+        out = io.BytesIO()
+        out.write(self._buffer.getvalue())
+        offsets = dict(self._offsets)
+
+        def write(obj_id: int, body: bytes) -> None:
+            offsets[obj_id] = out.tell()
+            out.write(b"%d 0 obj\n%s\nendobj\n" % (obj_id, body))
+
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self._page_ids)
+        write(self._CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % self._PAGES)
+        write(self._PAGES, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._page_ids)))
+
+        xref_offset = out.tell()
+        size = self._next_id
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for obj_id in range(1, size):
+            out.write(b"%010d 00000 n \n" % offsets[obj_id])
+        out.write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, self._CATALOG, xref_offset)
+        )
+        return out.getvalue()
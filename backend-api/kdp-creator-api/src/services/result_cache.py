@@ -0,0 +1,173 @@
+"""Content-addressed byte caches: in-process LRU bounded by total size, plus optional disk tier.
+
+Values are opaque bytes; callers choose the key (normally a SHA-256 over the inputs) and
+the encoding. Both tiers are best-effort — a failed disk read or write is a cache miss.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+def content_key(*parts) -> str:
+    """SHA-256 over the parts; bytes are hashed as-is, everything else via str()."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, (bytes, bytearray, memoryview)) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class LRUByteCache:
+    """Thread-safe LRU that evicts least-recently-used entries once total bytes exceed max_bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, int(max_bytes))
+        self.current_bytes = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: bytes) -> None:
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+
+class DiskByteCache:
+    """One file per key under a directory; oldest files are pruned once the directory exceeds max_bytes."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as handle:
+                value = handle.read()
+            os.utime(path)
+            return value
+        except OSError:
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        if len(value) > self.max_bytes:
+            return
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(value)
+            os.replace(tmp_path, self._path(key))
+        except OSError as cache_error:
+            print(f"[cache] disk write failed: {cache_error}")
+            if tmp_path is not None:
+                # A full disk or failed rename must not leave partial files that _prune never counts.
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            return
+        self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".bin")]
+                stats = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries]
+            except OSError:
+                return
+            total = sum(size for _, size, _ in stats)
+            for _, size, path in sorted(stats):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+
+class TieredByteCache:
+    """Memory LRU in front of an optional disk tier; disk hits are promoted to memory."""
+
+    def __init__(self, memory: LRUByteCache, disk: Optional[DiskByteCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, key: str, value: bytes) -> None:
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+
+
+def _env_mb(name: str, default: float) -> int:
+    raw = os.environ.get(name, "").strip()
+    try:
+        return int(float(raw) * 1024 * 1024) if raw else int(default * 1024 * 1024)
+    except ValueError:
+        return int(default * 1024 * 1024)
+
+
+def cache_from_env(prefix: str, default_memory_mb: float, default_disk_mb: float = 512) -> TieredByteCache:
+    """<PREFIX>_CACHE_MB sizes the memory tier (0 disables it); <PREFIX>_CACHE_DIR enables disk."""
+    memory = LRUByteCache(_env_mb(f"{prefix}_CACHE_MB", default_memory_mb))
+    directory = os.environ.get(f"{prefix}_CACHE_DIR", "").strip()
+    disk = None
+    if directory:
+        try:
+            disk = DiskByteCache(directory, _env_mb(f"{prefix}_CACHE_DISK_MB", default_disk_mb))
+        except OSError as cache_error:
+            print(f"[cache] {prefix} disk tier disabled: {cache_error}")
+    return TieredByteCache(memory, disk)
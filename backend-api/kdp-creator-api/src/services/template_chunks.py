@@ -0,0 +1,246 @@
+"""Chunked, resumable rendering for long template interiors.
+
+ChunkedPageBuilder (template_generator) saves every ``chunk_pages`` pages as a segment PDF in
+a directory keyed by the generation inputs, so ReportLab only ever holds one chunk. Segments
+left on disk by an earlier, interrupted run are reused: the generator still walks those pages
+(layout is cheap) but draws them into a NullCanvas. finalize joins the segments through one
+PdfWriter, merging byte-identical streams, and the directory is removed once the interior is
+complete. A run holds the store's lock file from first chunk to discard, so an identical
+request arriving meanwhile waits instead of losing its segments to the first run's cleanup.
+
+Chunking is opt-in: with repeated backgrounds stamped as forms, one canvas for a whole
+interior is already small, and joining segments costs more than it saves. It is for long
+jobs that must survive a crash. TEMPLATE_CHUNK_PAGES sets the chunk size (0, the default,
+renders in one canvas) and TEMPLATE_CHUNK_WORKERS renders missing chunks in parallel worker
+processes first.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: identical concurrent runs are not serialized
+    fcntl = None
+
+from pypdf import PdfWriter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from src.services.pdf_format import merge_identical_streams
+
+DEFAULT_CHUNK_PAGES = 0
+SEGMENT_TTL_SECONDS = 24 * 3600
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_SIZE = 0
+_POOL_LOCK = threading.Lock()
+
+
+class ChunksDone(Exception):
+    """Raised by a worker's builder once every chunk it owns is saved."""
+
+
+def configured_chunk_pages() -> int:
+    """Chunk size from TEMPLATE_CHUNK_PAGES; 0 (default) renders interiors in one canvas."""
+    raw = os.environ.get("TEMPLATE_CHUNK_PAGES", "").strip()
+    if raw:
+        try:
+            return max(0, int(raw))
+        except ValueError:
+            return DEFAULT_CHUNK_PAGES
+    return DEFAULT_CHUNK_PAGES
+
+
+def configured_workers() -> int:
+    """Chunk worker processes from TEMPLATE_CHUNK_WORKERS; defaults to 1 (serial, and always on Vercel)."""
+    if os.environ.get("VERCEL"):
+        return 1
+    raw = os.environ.get("TEMPLATE_CHUNK_WORKERS", "").strip()
+    try:
+        return max(0, int(raw)) if raw else 1
+    except ValueError:
+        return 1
+
+
+class NullCanvas:
+    """Stands in for a ReportLab canvas on pages whose chunk is already saved.
+
+    Drawing calls do nothing; stringWidth stays real because generators lay text out with it.
+    """
+
+    def stringWidth(self, text: str, font_name: str, font_size: float) -> float:
+        return stringWidth(text, font_name, font_size)
+
+    def __getattr__(self, name: str):
+        setattr(self, name, _ignore)
+        return _ignore
+
+
+def _ignore(*args, **kwargs) -> None:
+    return None
+
+
+class SegmentStore:
+    """Segment PDFs for one interior, written atomically so a crash never leaves half a chunk."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def lock_path(self) -> Path:
+        # Beside the directory, not in it: discard must not remove a lock another run waits on.
+        return self.root.parent / f"{self.root.name}.lock"
+
+    @contextmanager
+    def locked(self):
+        """Hold the store exclusively while rendering, joining and discarding it."""
+        with open(self.lock_path, "ab") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                # The previous holder may have discarded the directory.
+                self.root.mkdir(parents=True, exist_ok=True)
+                yield self
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def path(self, index: int) -> Path:
+        return self.root / f"chunk_{index:05d}.pdf"
+
+    def has(self, index: int) -> bool:
+        return self.path(index).exists()
+
+    def write(self, index: int, data: bytes) -> None:
+        partial = self.root / f".chunk_{index:05d}.{os.getpid()}.{threading.get_ident()}.tmp"
+        partial.write_bytes(data)
+        os.replace(partial, self.path(index))
+
+    def concatenate(self, count: int) -> bytes:
+        writer = PdfWriter()
+        for index in range(count):
+            writer.append(str(self.path(index)))
+        # Each segment embeds its own copy of shared stamps; keep one.
+        merge_identical_streams(writer)
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    def discard(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def _segments_root() -> Path:
+    configured = os.environ.get("TEMPLATE_SEGMENT_DIR", "").strip()
+    return Path(configured) if configured else Path(tempfile.gettempdir()) / "kdp-template-segments"
+
+
+def _prune_stale(root: Path) -> None:
+    cutoff = time.time() - SEGMENT_TTL_SECONDS
+    try:
+        entries = list(root.iterdir())
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            elif entry.suffix == ".lock":
+                entry.unlink()
+        except OSError:
+            continue
+
+
+def segment_store_for(*inputs: Any) -> SegmentStore:
+    """Store keyed by everything that shapes the interior, so a retry finds its own chunks."""
+    key = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+    root = _segments_root()
+    _prune_stale(root)
+    return SegmentStore(root / key)
+
+
+def render_chunk_range(job: dict[str, Any], chunks: list[int]) -> list[int]:
+    """Worker entrypoint: lay out the interior and draw only ``chunks`` into the job's store."""
+    from src.services.template_generator import GENERATORS, ChunkedPageBuilder, _hex_color
+
+    store = SegmentStore(Path(job["store"]))
+    builder = ChunkedPageBuilder(
+        job["trim_size"],
+        job["with_bleed"],
+        job["target_pages"],
+        chunk_pages=job["chunk_pages"],
+        store=store,
+        only_chunks=set(chunks),
+        doc_key=job.get("doc_key"),
+    )
+    options = job["options"]
+    try:
+        GENERATORS[job["niche"]](builder, options, _hex_color(options.get("accent_color")), job["target_pages"])
+    except ChunksDone:
+        pass
+    return chunks
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_SIZE != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False, cancel_futures=True)
+            _POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _POOL_SIZE = workers
+        return _POOL
+
+
+def _discard_pool() -> None:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+        _POOL_SIZE = 0
+
+
+def shutdown_pool() -> None:
+    """Stop worker processes (tests / graceful shutdown)."""
+    _discard_pool()
+
+
+def render_missing_chunks(job: dict[str, Any], store: SegmentStore, chunk_count: int, workers: Optional[int] = None):
+    """Fill in missing segments on worker processes, one contiguous run of chunks per worker.
+
+    Anything a worker does not finish (or a platform without processes) is left for the
+    in-thread builder, which draws whatever is still missing.
+    """
+    if workers is None:
+        workers = configured_workers()
+    missing = [index for index in range(chunk_count) if not store.has(index)]
+    if workers <= 1 or len(missing) <= 1:
+        return
+    workers = min(workers, len(missing))
+    size = -(-len(missing) // workers)
+    runs = [missing[start : start + size] for start in range(0, len(missing), size)]
+    job = {**job, "store": str(store.root)}
+    try:
+        pool = _get_pool(workers)
+        for future in [pool.submit(render_chunk_range, job, run) for run in runs]:
+            future.result()
+    except (BrokenProcessPool, OSError, PermissionError):
+        _discard_pool()
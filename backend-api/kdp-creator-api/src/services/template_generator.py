@@ -3,13 +3,18 @@
 from __future__ import annotations
 
 import io
+import json
 import math
+import os
 import re
+import threading
+from contextlib import ExitStack
 from dataclasses import dataclass
 from typing import Any, Callable
 
 from pypdf import PdfReader
 from reportlab.lib.colors import Color, HexColor, black, white
+from reportlab.lib.rl_accel import fp_str
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
@@ -31,42 +36,84 @@ from src.services.kdp_specs import (
     interior_page_size,
     normalize_print_profile,
 )
+from src.services.preflight import preflight_pdf
+from src.services.result_cache import cache_from_env, content_key
+from src.services.template_chunks import (
+    ChunksDone,
+    NullCanvas,
+    SegmentStore,
+    configured_chunk_pages,
+    render_missing_chunks,
+    segment_store_for,
+)
+from src.services.template_pool import submit_stage
 
 # ReportLab ships Liberation/DejaVu-compatible TTF under reportlab/fonts in some installs;
 # fall back to Helvetica only if no TTF is available — Helvetica is a standard PDF font
 # and does not need embedding. Prefer an embedded TTF when present.
 _FONT_REGISTERED = False
+_FONT_LOCK = threading.Lock()
 FONT_REGULAR = "Helvetica"
 FONT_BOLD = "Helvetica-Bold"
 
 
 def _ensure_fonts() -> None:
+    # Interior and cover render on separate threads; neither may see a half-registered font.
     global _FONT_REGISTERED, FONT_REGULAR, FONT_BOLD
     if _FONT_REGISTERED:
         return
-    _FONT_REGISTERED = True
+    with _FONT_LOCK:
+        if _FONT_REGISTERED:
+            return
+        try:
+            from pathlib import Path
+
+            import reportlab
+
+            fonts_dir = Path(reportlab.__file__).resolve().parent / "fonts"
+            candidates = [
+                ("DejaVuSans.ttf", "DejaVuSans-Bold.ttf"),
+                ("Vera.ttf", "VeraBd.ttf"),
+            ]
+            for regular_name, bold_name in candidates:
+                regular = fonts_dir / regular_name
+                bold = fonts_dir / bold_name
+                if regular.exists() and bold.exists():
+                    pdfmetrics.registerFont(TTFont("KdpSans", str(regular)))
+                    pdfmetrics.registerFont(TTFont("KdpSans-Bold", str(bold)))
+                    FONT_REGULAR = "KdpSans"
+                    FONT_BOLD = "KdpSans-Bold"
+                    break
+        except Exception:
+            # Keep Helvetica defaults.
+            pass
+        finally:
+            _FONT_REGISTERED = True
+
+
+def _font_is_embedded(name: str) -> bool:
+    # Registered TTFs are subset-embedded by ReportLab; the standard 14 fonts are not.
     try:
-        from pathlib import Path
-
-        import reportlab
-
-        fonts_dir = Path(reportlab.__file__).resolve().parent / "fonts"
-        candidates = [
-            ("DejaVuSans.ttf", "DejaVuSans-Bold.ttf"),
-            ("Vera.ttf", "VeraBd.ttf"),
-        ]
-        for regular_name, bold_name in candidates:
-            regular = fonts_dir / regular_name
-            bold = fonts_dir / bold_name
-            if regular.exists() and bold.exists():
-                pdfmetrics.registerFont(TTFont("KdpSans", str(regular)))
-                pdfmetrics.registerFont(TTFont("KdpSans-Bold", str(bold)))
-                FONT_REGULAR = "KdpSans"
-                FONT_BOLD = "KdpSans-Bold"
-                return
-    except Exception:
-        # Keep Helvetica defaults.
-        return
+        return isinstance(pdfmetrics.getFont(name), TTFont)
+    except KeyError:
+        return False
+
+
+def page_manifest(page_sizes_pts: list[tuple[float, float]], fonts: set[str]) -> dict[str, Any]:
+    """inspect_pdf-shaped summary recorded while drawing, so the output never needs re-parsing."""
+    return {
+        "num_pages": len(page_sizes_pts),
+        "pages": [{"width_in": width / 72.0, "height_in": height / 72.0} for width, height in page_sizes_pts],
+        "print_dpi_target": PRINT_DPI,
+        "fonts": sorted(fonts),
+        "fonts_embedded": all(_font_is_embedded(name) for name in fonts),
+        "source": "manifest",
+    }
+
+
+def paranoid_checks_enabled() -> bool:
+    """TEMPLATE_PARANOID_CHECKS=1 re-parses every generated PDF instead of trusting the manifest."""
+    return os.environ.get("TEMPLATE_PARANOID_CHECKS", "").strip().lower() in ("1", "true", "yes")
 
 
 def _hex_color(value: str | None, fallback: str = "#334155") -> Color:
@@ -102,6 +149,35 @@ def _as_str_list(value: Any) -> list[str]:
     return [line.strip() for line in text.splitlines() if line.strip()]
 
 
+DOT_RADIUS = 0.6
+
+
+def _steps(start: float, stop: float, step: float) -> list[float]:
+    # Same accumulation as the original while-loops, so dot positions do not drift.
+    values = []
+    value = start
+    while (value < stop) if step > 0 else (value > stop):
+        values.append(value)
+        value += step
+    return values
+
+
+def _dot_grid_ops(left: float, right: float, top: float, bottom: float, spacing: float) -> str:
+    """Path operators for a dot grid, stroked with round caps at line width 2 * DOT_RADIUS.
+
+    Each dot is a zero-length segment, which a round cap paints as a filled disc, instead of
+    the four Bezier curves of a circle. One row is written once and stepped down the page
+    with a translation, so the Python work is per row and column rather than per dot.
+    """
+    xs = _steps(left, right, spacing)
+    rows = len(_steps(top, bottom, -spacing))
+    if not xs or not rows:
+        return ""
+    row = " ".join(f"{fp_str(x)} 0 m {fp_str(x)} 0 l" for x in xs) + " S"
+    step_down = f"1 0 0 1 0 {fp_str(-spacing)} cm"
+    return f"1 0 0 1 0 {fp_str(top)} cm " + f" {step_down} ".join([row] * rows)
+
+
 @dataclass
 class GenerationResult:
     interior_pdf: bytes
@@ -115,11 +191,54 @@ class GenerationResult:
     spine_width_in: float
     allow_spine_text: bool
     compliance: dict[str, Any]
+    product_key: str = ""
+    cached: bool = False
+
+
+# Bump when generator output changes, so cached products are not served for new code.
+PRODUCT_CACHE_VERSION = 1
+_PRODUCT_CACHE = None
+_PRODUCT_CACHE_LOCK = threading.Lock()
+
+
+def product_cache():
+    """Process-wide cache of generated products (TEMPLATE_PRODUCT_CACHE_MB / _CACHE_DIR)."""
+    global _PRODUCT_CACHE
+    with _PRODUCT_CACHE_LOCK:
+        if _PRODUCT_CACHE is None:
+            _PRODUCT_CACHE = cache_from_env("TEMPLATE_PRODUCT", 64)
+        return _PRODUCT_CACHE
+
+
+def _pack_result(result: GenerationResult) -> bytes:
+    header = {
+        name: value for name, value in vars(result).items() if name not in ("interior_pdf", "cover_pdf", "cached")
+    }
+    header["interior_bytes"] = len(result.interior_pdf)
+    encoded = json.dumps(header).encode("utf-8")
+    return len(encoded).to_bytes(4, "big") + encoded + result.interior_pdf + result.cover_pdf
+
+
+def _unpack_result(blob: bytes) -> GenerationResult:
+    size = int.from_bytes(blob[:4], "big")
+    header = json.loads(blob[4 : 4 + size])
+    split = 4 + size + header.pop("interior_bytes")
+    return GenerationResult(interior_pdf=blob[4 + size : split], cover_pdf=blob[split:], cached=True, **header)
+
+
+def _document_canvas(buffer: io.BytesIO, pagesize: tuple[float, float], doc_key: str | None) -> canvas.Canvas:
+    # invariant: fixed creation date and no run-specific comments; /ID is a digest seeded
+    # with doc_key, so the same inputs produce the same bytes.
+    pdf = canvas.Canvas(buffer, pagesize=pagesize, invariant=1)
+    if doc_key:
+        pdf._doc.updateSignature(doc_key)
+    return pdf
 
 
 class PageBuilder:
-    def __init__(self, trim_size: str, with_bleed: bool, page_count_estimate: int):
+    def __init__(self, trim_size: str, with_bleed: bool, page_count_estimate: int, *, doc_key: str | None = None):
         _ensure_fonts()
+        self.doc_key = doc_key
         self.trim_size = trim_size
         self.with_bleed = with_bleed
         self.page = interior_page_size(trim_size, with_bleed=with_bleed)
@@ -128,8 +247,11 @@ class PageBuilder:
         self.trim = get_trim(trim_size)
         self.page_count_estimate = max(page_count_estimate, 24)
         self.buffer = io.BytesIO()
-        self.canvas = canvas.Canvas(self.buffer, pagesize=(self.width, self.height))
+        self.canvas = _document_canvas(self.buffer, (self.width, self.height), doc_key)
         self.pages_drawn = 0
+        self._canvas_pages = 0
+        self.page_sizes: list[tuple[float, float]] = []
+        self._stamps: dict[tuple, str] = {}
 
     def _margins_for_side(self, page_side: str):
         margins = get_margins(self.page_count_estimate, with_bleed=self.with_bleed)
@@ -163,9 +285,11 @@ class PageBuilder:
     def new_page(self, target_pages: int | None = None) -> tuple[float, float, float, float] | None:
         if target_pages is not None and self.pages_drawn >= target_pages:
             return None
-        if self.pages_drawn > 0:
+        if self._canvas_pages > 0:
             self.canvas.showPage()
         self.pages_drawn += 1
+        self._canvas_pages += 1
+        self.page_sizes.append((self.width, self.height))
         # Odd pages are recto (right); even are verso (left)
         page_side = "right" if self.pages_drawn % 2 == 1 else "left"
         left, right, top, bottom, _ = self._margins_for_side(page_side)
@@ -174,6 +298,24 @@ class PageBuilder:
         self.canvas.rect(0, 0, self.width, self.height, fill=1, stroke=0)
         return left, right, top, bottom
 
+    def stamp(self, key: tuple, draw: Callable[[], None]) -> None:
+        """Place the content ``draw`` paints on the current page, drawing it only once per ``key``.
+
+        The first call records ``draw()`` as a Form XObject; every later call with the same key
+        is a single ``Do`` of that form, so repeated backgrounds (rules, grids, tables) are
+        rendered and written once per document. ``key`` must capture everything ``draw``
+        depends on, and ``draw`` must set its own colors and line widths because the form
+        inherits the graphics state of whichever page places it.
+        """
+        name = self._stamps.get(key)
+        if name is None:
+            name = f"KdpStamp{len(self._stamps)}"
+            self.canvas.beginForm(name, 0, 0, self.width, self.height)
+            draw()
+            self.canvas.endForm()
+            self._stamps[key] = name
+        self.canvas.doForm(name)
+
     def draw_header(self, text: str, left: float, right: float, top: float, color: Color):
         self.canvas.setFillColor(color)
         self.canvas.setFont(FONT_BOLD, 14)
@@ -210,22 +352,26 @@ class PageBuilder:
         return cursor
 
     def draw_lines(self, left: float, right: float, top: float, bottom: float, spacing: float = 18):
-        self.canvas.setStrokeColor(HexColor("#cbd5e1"))
-        self.canvas.setLineWidth(0.5)
-        y = top
-        while y > bottom:
-            self.canvas.line(left, y, right, y)
-            y -= spacing
+        def draw():
+            self.canvas.setStrokeColor(HexColor("#cbd5e1"))
+            self.canvas.setLineWidth(0.5)
+            y = top
+            while y > bottom:
+                self.canvas.line(left, y, right, y)
+                y -= spacing
+
+        self.stamp(("lines", left, right, top, bottom, spacing), draw)
 
     def draw_dots(self, left: float, right: float, top: float, bottom: float, spacing: float = 14):
-        self.canvas.setFillColor(HexColor("#94a3b8"))
-        y = top
-        while y > bottom:
-            x = left
-            while x < right:
-                self.canvas.circle(x, y, 0.6, fill=1, stroke=0)
-                x += spacing
-            y -= spacing
+        def draw():
+            self.canvas.saveState()
+            self.canvas.setStrokeColor(HexColor("#94a3b8"))
+            self.canvas.setLineWidth(2 * DOT_RADIUS)
+            self.canvas.setLineCap(1)
+            self.canvas.addLiteral(_dot_grid_ops(left, right, top, bottom, spacing))
+            self.canvas.restoreState()
+
+        self.stamp(("dots", left, right, top, bottom, spacing), draw)
 
     def draw_table(
         self,
@@ -236,24 +382,27 @@ class PageBuilder:
         columns: list[str],
         row_height: float,
     ):
-        self.canvas.setStrokeColor(HexColor("#64748b"))
-        self.canvas.setLineWidth(0.7)
-        col_count = max(len(columns), 1)
-        col_w = (right - left) / col_count
-        # header
-        self.canvas.setFillColor(HexColor("#e2e8f0"))
-        self.canvas.rect(left, top - row_height, right - left, row_height, fill=1, stroke=1)
-        self.canvas.setFillColor(black)
-        self.canvas.setFont(FONT_BOLD, 8)
-        for i, col in enumerate(columns):
-            self.canvas.drawString(left + i * col_w + 4, top - row_height + 6, col[:18])
-        y = top - row_height
-        while y - row_height >= bottom:
-            self.canvas.setStrokeColor(HexColor("#94a3b8"))
-            self.canvas.rect(left, y - row_height, right - left, row_height, fill=0, stroke=1)
-            for i in range(1, col_count):
-                self.canvas.line(left + i * col_w, y, left + i * col_w, y - row_height)
-            y -= row_height
+        def draw():
+            self.canvas.setStrokeColor(HexColor("#64748b"))
+            self.canvas.setLineWidth(0.7)
+            col_count = max(len(columns), 1)
+            col_w = (right - left) / col_count
+            # header
+            self.canvas.setFillColor(HexColor("#e2e8f0"))
+            self.canvas.rect(left, top - row_height, right - left, row_height, fill=1, stroke=1)
+            self.canvas.setFillColor(black)
+            self.canvas.setFont(FONT_BOLD, 8)
+            for i, col in enumerate(columns):
+                self.canvas.drawString(left + i * col_w + 4, top - row_height + 6, col[:18])
+            y = top - row_height
+            while y - row_height >= bottom:
+                self.canvas.setStrokeColor(HexColor("#94a3b8"))
+                self.canvas.rect(left, y - row_height, right - left, row_height, fill=0, stroke=1)
+                for i in range(1, col_count):
+                    self.canvas.line(left + i * col_w, y, left + i * col_w, y - row_height)
+                y -= row_height
+
+        self.stamp(("table", left, right, top, bottom, tuple(columns), row_height), draw)
 
     def draw_coloring_frame(
         self,
@@ -264,44 +413,57 @@ class PageBuilder:
         motif: str,
         index: int,
     ):
-        self.canvas.setStrokeColor(black)
-        self.canvas.setLineWidth(1.5)
-        self.canvas.rect(left, bottom, right - left, top - bottom, fill=0, stroke=1)
         cx = (left + right) / 2
-        cy = (top + bottom) / 2
-        self.canvas.setLineWidth(1.2)
-        # Decorative geometric motifs (vector line art — no external images required)
-        if motif == "woodland":
-            for i in range(5):
-                offset = (i - 2) * 28
-                self.canvas.line(cx + offset, cy - 40, cx + offset - 18, cy + 35)
-                self.canvas.line(cx + offset, cy - 40, cx + offset + 18, cy + 35)
-                self.canvas.line(cx + offset - 10, cy, cx + offset + 10, cy)
-        elif motif == "kitchen":
-            self.canvas.circle(cx, cy + 10, 40, fill=0, stroke=1)
-            self.canvas.circle(cx, cy + 10, 28, fill=0, stroke=1)
-            self.canvas.rect(cx - 8, cy - 50, 16, 30, fill=0, stroke=1)
-        else:  # cottagecore
-            self.canvas.circle(cx, cy + 20, 22, fill=0, stroke=1)
-            for angle in range(0, 360, 30):
-                rad = math.radians(angle)
-                self.canvas.line(
-                    cx + 22 * math.cos(rad),
-                    cy + 20 + 22 * math.sin(rad),
-                    cx + 48 * math.cos(rad),
-                    cy + 20 + 48 * math.sin(rad),
-                )
-            self.canvas.rect(cx - 35, cy - 55, 70, 45, fill=0, stroke=1)
-            self.canvas.line(cx - 35, cy - 10, cx, cy + 15)
-            self.canvas.line(cx + 35, cy - 10, cx, cy + 15)
+
+        def draw():
+            self.canvas.setStrokeColor(black)
+            self.canvas.setLineWidth(1.5)
+            self.canvas.rect(left, bottom, right - left, top - bottom, fill=0, stroke=1)
+            cy = (top + bottom) / 2
+            self.canvas.setLineWidth(1.2)
+            # Decorative geometric motifs (vector line art — no external images required)
+            if motif == "woodland":
+                for i in range(5):
+                    offset = (i - 2) * 28
+                    self.canvas.line(cx + offset, cy - 40, cx + offset - 18, cy + 35)
+                    self.canvas.line(cx + offset, cy - 40, cx + offset + 18, cy + 35)
+                    self.canvas.line(cx + offset - 10, cy, cx + offset + 10, cy)
+            elif motif == "kitchen":
+                self.canvas.circle(cx, cy + 10, 40, fill=0, stroke=1)
+                self.canvas.circle(cx, cy + 10, 28, fill=0, stroke=1)
+                self.canvas.rect(cx - 8, cy - 50, 16, 30, fill=0, stroke=1)
+            else:  # cottagecore
+                self.canvas.circle(cx, cy + 20, 22, fill=0, stroke=1)
+                for angle in range(0, 360, 30):
+                    rad = math.radians(angle)
+                    self.canvas.line(
+                        cx + 22 * math.cos(rad),
+                        cy + 20 + 22 * math.sin(rad),
+                        cx + 48 * math.cos(rad),
+                        cy + 20 + 48 * math.sin(rad),
+                    )
+                self.canvas.rect(cx - 35, cy - 55, 70, 45, fill=0, stroke=1)
+                self.canvas.line(cx - 35, cy - 10, cx, cy + 15)
+                self.canvas.line(cx + 35, cy - 10, cx, cy + 15)
+
+        self.stamp(("frame", motif, left, right, top, bottom), draw)
         self.canvas.setFont(FONT_REGULAR, 9)
         self.canvas.drawCentredString(cx, bottom + 8, f"Page {index}")
 
     def fill_black(self):
-        self.canvas.setFillColor(black)
-        self.canvas.rect(0, 0, self.width, self.height, fill=1, stroke=0)
+        def draw():
+            self.canvas.setFillColor(black)
+            self.canvas.rect(0, 0, self.width, self.height, fill=1, stroke=0)
+
+        self.stamp(("black",), draw)
 
     def finalize(self, target_pages: int) -> bytes:
+        self._pad_to(target_pages)
+        self.canvas.save()
+        self.buffer.seek(0)
+        return self.buffer.getvalue()
+
+    def _pad_to(self, target_pages: int) -> None:
         while self.pages_drawn < target_pages:
             box = self.new_page(target_pages)
             if box is None:
@@ -311,9 +473,70 @@ class PageBuilder:
             self.canvas.setFillColor(HexColor("#94a3b8"))
             self.canvas.setFont(FONT_REGULAR, 9)
             self.canvas.drawCentredString((left + right) / 2, (top + bottom) / 2, "Notes")
-        self.canvas.save()
-        self.buffer.seek(0)
-        return self.buffer.getvalue()
+
+    def manifest(self) -> dict[str, Any]:
+        return page_manifest(self.page_sizes, {FONT_REGULAR, FONT_BOLD})
+
+
+class ChunkedPageBuilder(PageBuilder):
+    """PageBuilder that saves every ``chunk_pages`` pages to ``store`` as its own segment.
+
+    Chunks already in the store are laid out but not drawn. ``only_chunks`` limits drawing
+    further (worker processes); such a builder stops with ChunksDone after its last chunk and
+    its finalize returns b"" instead of the joined interior.
+    """
+
+    def __init__(
+        self,
+        trim_size: str,
+        with_bleed: bool,
+        page_count_estimate: int,
+        *,
+        chunk_pages: int,
+        store: SegmentStore,
+        only_chunks: set[int] | None = None,
+        doc_key: str | None = None,
+    ):
+        super().__init__(trim_size, with_bleed, page_count_estimate, doc_key=doc_key)
+        self.chunk_pages = chunk_pages
+        self.store = store
+        self.only_chunks = only_chunks
+        self.chunk_index = 0
+        self._open_chunk(0)
+
+    def _open_chunk(self, index: int) -> None:
+        if self.only_chunks is not None and index > max(self.only_chunks, default=-1):
+            raise ChunksDone()
+        self.chunk_index = index
+        self._canvas_pages = 0
+        self._stamps = {}  # forms belong to one segment's document
+        if self.store.has(index) or (self.only_chunks is not None and index not in self.only_chunks):
+            self.buffer = None
+            self.canvas = NullCanvas()
+        else:
+            self.buffer = io.BytesIO()
+            self.canvas = _document_canvas(self.buffer, (self.width, self.height), f"{self.doc_key}:{index}")
+
+    def _close_chunk(self) -> None:
+        if self.buffer is not None:
+            self.canvas.save()
+            self.store.write(self.chunk_index, self.buffer.getvalue())
+            self.buffer = None
+
+    def new_page(self, target_pages: int | None = None) -> tuple[float, float, float, float] | None:
+        if target_pages is not None and self.pages_drawn >= target_pages:
+            return None
+        if self.pages_drawn and self.pages_drawn % self.chunk_pages == 0:
+            self._close_chunk()
+            self._open_chunk(self.pages_drawn // self.chunk_pages)
+        return super().new_page(target_pages)
+
+    def finalize(self, target_pages: int) -> bytes:
+        self._pad_to(target_pages)
+        self._close_chunk()
+        if self.only_chunks is not None:
+            return b""
+        return self.store.concatenate(self.chunk_index + 1)
 
 
 def _title_page(builder: PageBuilder, options: dict[str, Any], accent: Color, target_pages: int) -> bool:
@@ -476,6 +699,23 @@ def generate_journal_interior(builder: PageBuilder, options: dict[str, Any], acc
     return builder.finalize(target_pages)
 
 
+def _week_grid(builder: PageBuilder, box: tuple[float, float, float, float], days: list[str]) -> None:
+    left, right, top, bottom = box
+    col_w = (right - left) / 2
+    row_h = (top - bottom - 40) / 4
+    builder.canvas.setLineWidth(0.8)  # as left by draw_header
+    for idx, day in enumerate(days):
+        col = idx % 2
+        row = idx // 2
+        x = left + col * col_w
+        y = top - 30 - row * row_h
+        builder.canvas.setStrokeColor(HexColor("#94a3b8"))
+        builder.canvas.rect(x + 2, y - row_h + 4, col_w - 6, row_h - 8, fill=0, stroke=1)
+        builder.canvas.setFont(FONT_BOLD, 10)
+        builder.canvas.setFillColor(black)
+        builder.canvas.drawString(x + 8, y - 14, day)
+
+
 def generate_planner_interior(builder: PageBuilder, options: dict[str, Any], accent: Color, target_pages: int) -> bytes:
     _title_page(builder, options, accent, target_pages)
     weeks = max(4, _as_int(options.get("weeks"), 52))
@@ -516,18 +756,7 @@ def generate_planner_interior(builder: PageBuilder, options: dict[str, Any], acc
         days = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
         if start_day.lower() == "sunday":
             days = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
-        col_w = (right - left) / 2
-        row_h = (top - bottom - 40) / 4
-        for idx, day in enumerate(days):
-            col = idx % 2
-            row = idx // 2
-            x = left + col * col_w
-            y = top - 30 - row * row_h
-            builder.canvas.setStrokeColor(HexColor("#94a3b8"))
-            builder.canvas.rect(x + 2, y - row_h + 4, col_w - 6, row_h - 8, fill=0, stroke=1)
-            builder.canvas.setFont(FONT_BOLD, 10)
-            builder.canvas.setFillColor(black)
-            builder.canvas.drawString(x + 8, y - 14, day)
+        builder.stamp(("week", left, right, top, bottom, tuple(days)), lambda: _week_grid(builder, box, days))
         if _as_bool(options.get("include_pomodoro"), True):
             pomo_box = builder.new_page(target_pages)
             if pomo_box:
@@ -552,6 +781,14 @@ def generate_planner_interior(builder: PageBuilder, options: dict[str, Any], acc
     return builder.finalize(target_pages)
 
 
+def _match_rows(builder: PageBuilder, left: float, right: float, top: float) -> None:
+    builder.canvas.setStrokeColor(black)
+    builder.canvas.setLineWidth(0.8)  # as left by draw_header
+    for i in range(4):
+        builder.canvas.circle(left + 30, top - 50 - i * 55, 18, fill=0, stroke=1)
+        builder.canvas.rect(left + 70, top - 65 - i * 55, right - left - 80, 30, fill=0, stroke=1)
+
+
 def generate_phonics_interior(builder: PageBuilder, options: dict[str, Any], accent: Color, target_pages: int) -> bytes:
     _title_page(builder, options, accent, target_pages)
     box = builder.new_page(target_pages)
@@ -597,17 +834,7 @@ def generate_phonics_interior(builder: PageBuilder, options: dict[str, Any], acc
             if match_box:
                 left, right, top, bottom = match_box
                 builder.draw_header(f"Match sounds: {item}", left, right, top, accent)
-                for i in range(4):
-                    builder.canvas.setStrokeColor(black)
-                    builder.canvas.circle(left + 30, top - 50 - i * 55, 18, fill=0, stroke=1)
-                    builder.canvas.rect(
-                        left + 70,
-                        top - 65 - i * 55,
-                        right - left - 80,
-                        30,
-                        fill=0,
-                        stroke=1,
-                    )
+                builder.stamp(("match", left, right, top), lambda: _match_rows(builder, left, right, top))
 
     if _as_bool(options.get("include_progress"), True):
         progress_box = builder.new_page(target_pages)
@@ -687,7 +914,9 @@ GENERATORS: dict[str, Callable[[PageBuilder, dict[str, Any], Color, int], bytes]
 }
 
 
-def generate_cover_pdf(options: dict[str, Any], page_count: int, print_profile: str) -> tuple[bytes, dict[str, Any]]:
+def generate_cover_pdf(
+    options: dict[str, Any], page_count: int, print_profile: str, doc_key: str | None = None
+) -> tuple[bytes, dict[str, Any]]:
     _ensure_fonts()
     trim_size = str(options["trim_size"])
     dims = cover_dimensions(trim_size, page_count, print_profile)
@@ -706,7 +935,7 @@ def generate_cover_pdf(options: dict[str, Any], page_count: int, print_profile:
     want_spine = _as_bool(options.get("include_spine_text"), True) and dims.allow_spine_text
 
     buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=(width_pt, height_pt))
+    c = _document_canvas(buffer, (width_pt, height_pt), doc_key)
 
     # Background fills full bleed
     c.setFillColor(accent)
@@ -796,11 +1025,12 @@ def generate_cover_pdf(options: dict[str, Any], page_count: int, print_profile:
         "allow_spine_text": dims.allow_spine_text,
         "spine_text_included": want_spine,
         "page_count": page_count,
+        "manifest": page_manifest([(width_pt, height_pt)], {FONT_REGULAR, FONT_BOLD}),
     }
     return buffer.getvalue(), meta
 
 
-def inspect_pdf(pdf_bytes: bytes) -> dict[str, Any]:
+def inspect_pdf(pdf_bytes: bytes, preflight: bool = True) -> dict[str, Any]:
     reader = PdfReader(io.BytesIO(pdf_bytes))
     pages = []
     for page in reader.pages:
@@ -811,15 +1041,26 @@ def inspect_pdf(pdf_bytes: bytes) -> dict[str, Any]:
                 "height_in": float(box.height) / 72.0,
             }
         )
-    fonts_embedded = True
-    # Helvetica is a standard font; custom TTFs registered via reportlab are embedded.
-    # Mark True when we used KdpSans or standard fonts (KDP accepts both for these generators).
-    return {
+    result = {
         "num_pages": len(reader.pages),
         "pages": pages,
-        "fonts_embedded": fonts_embedded,
         "print_dpi_target": PRINT_DPI,
+        "source": "parsed",
     }
+    if preflight:
+        report = preflight_pdf(pdf_bytes)
+        result["fonts_embedded"] = report.fonts_embedded
+        result["preflight"] = report.to_dict()
+        result["preflight_warnings"] = report.warnings()
+    return result
+
+
+def _same_geometry(parsed: list[dict[str, float]], recorded: list[dict[str, float]]) -> bool:
+    # ReportLab rounds MediaBox values when writing, so compare to a thousandth of an inch.
+    return len(parsed) == len(recorded) and all(
+        abs(a["width_in"] - b["width_in"]) < 1e-3 and abs(a["height_in"] - b["height_in"]) < 1e-3
+        for a, b in zip(parsed, recorded)
+    )
 
 
 def build_compliance_report(
@@ -829,13 +1070,26 @@ def build_compliance_report(
     print_profile: str,
     with_bleed: bool,
     cover_meta: dict[str, Any],
+    interior_manifest: dict[str, Any] | None = None,
+    paranoid: bool = False,
 ) -> dict[str, Any]:
-    interior = inspect_pdf(interior_pdf)
-    cover = inspect_pdf(cover_pdf)
+    """Check the generated PDFs against KDP rules.
+
+    By default the page manifests recorded while drawing are trusted. ``paranoid`` (or a
+    missing manifest) re-parses both PDFs, adds the image/font preflight, and reports any
+    disagreement with the manifests as an error.
+    """
+    cover_manifest = cover_meta.get("manifest")
+    interior = inspect_pdf(interior_pdf) if paranoid or interior_manifest is None else interior_manifest
+    cover = inspect_pdf(cover_pdf) if paranoid or cover_manifest is None else cover_manifest
     expected = interior_page_size(trim_size, with_bleed=with_bleed)
     warnings: list[str] = []
     errors: list[str] = []
 
+    for label, parsed, manifest in (("Interior", interior, interior_manifest), ("Cover", cover, cover_manifest)):
+        if manifest is not None and parsed is not manifest and not _same_geometry(parsed["pages"], manifest["pages"]):
+            errors.append(f"{label} PDF does not match the page geometry recorded while generating it.")
+
     if interior["num_pages"] % 2 != 0:
         errors.append("Interior page count must be even.")
     try:
@@ -863,6 +1117,9 @@ def build_compliance_report(
     if cover_meta.get("spine_text_included") and interior["num_pages"] < SPINE_TEXT_MIN_PAGES:
         errors.append("Spine text included but page count is below 79.")
 
+    warnings.extend(interior.get("preflight_warnings", []))
+    warnings.extend(f"Cover: {message}" for message in cover.get("preflight_warnings", []))
+
     warnings.append(
         "This preflight checks published KDP size, page-count, and cover-wrap rules. "
         "Always run Amazon KDP Print Previewer and order a physical proof before publishing."
@@ -882,12 +1139,14 @@ def build_compliance_report(
         },
         "print_profile": print_profile,
         "with_bleed": with_bleed,
-        "fonts_embedded": interior.get("fonts_embedded", True),
+        "fonts_embedded": interior.get("fonts_embedded", True) and cover.get("fonts_embedded", True),
         "image_dpi_target": PRINT_DPI,
     }
 
 
-def generate_product(template: dict[str, Any], options: dict[str, Any] | None = None) -> GenerationResult:
+def generate_product(
+    template: dict[str, Any], options: dict[str, Any] | None = None, *, paranoid: bool | None = None
+) -> GenerationResult:
     opts = {**(template.get("defaults") or {}), **(options or {})}
     niche = template["niche"]
     if niche not in GENERATORS:
@@ -909,17 +1168,65 @@ def generate_product(template: dict[str, Any], options: dict[str, Any] | None =
     requested_pages = _as_int(opts.get("page_count"), int(template.get("page_count") or 24))
     target_pages = clamp_to_valid_page_count(requested_pages, trim_size, print_profile)
     accent = _hex_color(opts.get("accent_color"))
-
-    builder = PageBuilder(trim_size, with_bleed, target_pages)
-    interior_pdf = GENERATORS[niche](builder, opts, accent, target_pages)
-
-    # Re-inspect actual page count and pad already handled in finalize; trust builder.
-    actual_pages = inspect_pdf(interior_pdf)["num_pages"]
+    paranoid = paranoid_checks_enabled() if paranoid is None else paranoid
+
+    # Generation is deterministic, so identical inputs are served from the product cache.
+    key = content_key(
+        PRODUCT_CACHE_VERSION,
+        template["id"],
+        niche,
+        json.dumps(opts, sort_keys=True, default=str),
+        trim_size,
+        print_profile,
+        with_bleed,
+        target_pages,
+        paranoid,
+    )
+    cache = product_cache()
+    blob = cache.get(key)
+    if blob is not None:
+        return _unpack_result(blob)
+
+    store = None
+    chunk_pages = configured_chunk_pages()
+    with ExitStack() as stack:
+        if chunk_pages and target_pages > chunk_pages:
+            # An identical run in progress holds the store until it has discarded it.
+            store = stack.enter_context(segment_store_for(key, chunk_pages).locked())
+            job = {
+                "niche": niche,
+                "options": opts,
+                "trim_size": trim_size,
+                "with_bleed": with_bleed,
+                "target_pages": target_pages,
+                "chunk_pages": chunk_pages,
+                "doc_key": key,
+            }
+            render_missing_chunks(job, store, math.ceil(target_pages / chunk_pages))
+            builder = ChunkedPageBuilder(
+                trim_size, with_bleed, target_pages, chunk_pages=chunk_pages, store=store, doc_key=key
+            )
+        else:
+            builder = PageBuilder(trim_size, with_bleed, target_pages, doc_key=key)
+        # finalize pads the interior to exactly target_pages, so the cover (spine width) can be
+        # drawn from the target while the interior renders.
+        cover_future = submit_stage(generate_cover_pdf, opts, target_pages, print_profile, f"{key}:cover")
+        try:
+            interior_pdf = GENERATORS[niche](builder, opts, accent, target_pages)
+        except BaseException:
+            # Saved chunks stay in the store for a retry with the same inputs.
+            cover_future.cancel()
+            raise
+        if store is not None:
+            store.discard()
+
+    # Padding is handled in finalize; the builder's manifest is the page count.
+    interior_manifest = builder.manifest()
+    actual_pages = interior_manifest["num_pages"]
+    cover_pdf, cover_meta = cover_future.result()
     if actual_pages != target_pages:
-        # Should not happen, but re-clamp if generator overshot somehow.
-        target_pages = clamp_to_valid_page_count(actual_pages, trim_size, print_profile)
-
-    cover_pdf, cover_meta = generate_cover_pdf(opts, actual_pages, print_profile)
+        # Should not happen, but redraw the cover if the generator overshot somehow.
+        cover_pdf, cover_meta = generate_cover_pdf(opts, actual_pages, print_profile, f"{key}:cover")
     compliance = build_compliance_report(
         interior_pdf,
         cover_pdf,
@@ -927,9 +1234,11 @@ def generate_product(template: dict[str, Any], options: dict[str, Any] | None =
         print_profile,
         with_bleed,
         cover_meta,
+        interior_manifest=interior_manifest,
+        paranoid=paranoid,
     )
 
-    return GenerationResult(
+    result = GenerationResult(
         interior_pdf=interior_pdf,
         cover_pdf=cover_pdf,
         page_count=actual_pages,
@@ -941,4 +1250,7 @@ def generate_product(template: dict[str, Any], options: dict[str, Any] | None =
         spine_width_in=cover_meta["spine_width_in"],
         allow_spine_text=cover_meta["allow_spine_text"],
         compliance=compliance,
+        product_key=key,
     )
+    cache.put(key, _pack_result(result))
+    return result
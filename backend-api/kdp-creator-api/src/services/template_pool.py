@@ -0,0 +1,76 @@
+"""Shared thread pool for the independent stages of template generation.
+
+A template request builds an interior and a cover, uploads both and renders a preview.
+None of those depend on each other once the page count is known, so they run side by side
+instead of back to back. Threads rather than processes: the stages hand ReportLab/PDF bytes
+around and mostly wait on storage uploads and poppler, which release the GIL.
+TEMPLATE_WORKERS sets the pool size; 0/1 runs every stage inline, in submission order.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_SIZE = 0
+_POOL_LOCK = threading.Lock()
+DEFAULT_WORKERS = 4
+
+
+def configured_workers() -> int:
+    """Pool size from TEMPLATE_WORKERS; defaults to DEFAULT_WORKERS."""
+    raw = os.environ.get("TEMPLATE_WORKERS", "").strip()
+    if raw:
+        try:
+            return max(0, int(raw))
+        except ValueError:
+            return 1
+    return DEFAULT_WORKERS
+
+
+def _get_pool(workers: int) -> ThreadPoolExecutor:
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_SIZE != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=False)
+            _POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="template-stage")
+            _POOL_SIZE = workers
+        return _POOL
+
+
+def shutdown_pool() -> None:
+    """Stop the stage threads (tests / graceful shutdown)."""
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.shutdown(wait=False)
+        _POOL = None
+        _POOL_SIZE = 0
+
+
+def _run_inline(fn: Callable[..., Any], *args, **kwargs) -> Future:
+    future: Future = Future()
+    try:
+        future.set_result(fn(*args, **kwargs))
+    except BaseException as exc:  # surfaced by future.result(), as with the pool
+        future.set_exception(exc)
+    return future
+
+
+def submit_stage(fn: Callable[..., Any], *args, **kwargs) -> Future:
+    """Run ``fn`` on the stage pool; errors surface from ``result()`` either way.
+
+    Callers must not wait on a stage from inside another stage, so the pool cannot starve.
+    """
+    workers = configured_workers()
+    if workers <= 1:
+        return _run_inline(fn, *args, **kwargs)
+    try:
+        return _get_pool(workers).submit(fn, *args, **kwargs)
+    except RuntimeError:
+        # Pool shut down (interpreter exit or shutdown_pool race) — finish in-thread.
+        return _run_inline(fn, *args, **kwargs)
@@ -0,0 +1,92 @@
+"""Atomic monthly usage counters: reserve quota before the work, refund it if the work fails.
+
+The counters are the conversions_this_month / batch_operations_this_month columns of
+user_profiles. consume_usage (see scripts/migrations/usage_counters.sql) checks the user's tier
+limit and increments in a single UPDATE, so concurrent requests can neither lose an increment
+nor pass the limit. Without Supabase nothing is counted and every request is allowed, as
+before; LocalUsageStore is the in-process equivalent that tests inject as _STORE.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Optional
+
+KINDS = {
+    "conversions": "conversions_this_month",
+    "batch_operations": "batch_operations_this_month",
+}
+
+
+def _limit_for(tier_limits: dict, tier: Optional[str]) -> int:
+    limit = tier_limits.get(tier or "free")
+    return tier_limits.get("free", 0) if limit is None else limit
+
+
+class LocalUsageStore:
+    """In-process stand-in for consume_usage (tests). Unknown users are on the free tier at zero.
+
+    Never picked by get_usage_store: per-process counters would let every worker hand out a full quota.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tiers: dict[str, str] = {}
+        self._used: dict[tuple[str, str], int] = {}
+
+    def set_tier(self, user_id: str, tier: str) -> None:
+        with self._lock:
+            self._tiers[str(user_id)] = tier
+
+    def used(self, user_id: str, kind: str) -> int:
+        with self._lock:
+            return self._used.get((str(user_id), kind), 0)
+
+    def consume(self, user_id: str, kind: str, amount: int, tier_limits: dict) -> tuple[bool, int]:
+        """Add ``amount`` if it keeps the counter within the tier limit; returns (allowed, used)."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown usage kind: {kind}")
+        key = (str(user_id), kind)
+        with self._lock:
+            used = self._used.get(key, 0)
+            limit = _limit_for(tier_limits, self._tiers.get(str(user_id)))
+            if amount > 0 and limit >= 0 and used + amount > limit:
+                return False, used
+            self._used[key] = max(0, used + amount)
+            return True, self._used[key]
+
+
+class SupabaseUsageStore:
+    """user_profiles counters through the consume_usage RPC: one round trip per reservation."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def consume(self, user_id: str, kind: str, amount: int, tier_limits: dict) -> tuple[bool, int]:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown usage kind: {kind}")
+        res = self.client.rpc(
+            "consume_usage",
+            {"p_user_id": str(user_id), "p_kind": kind, "p_amount": int(amount), "p_tier_limits": tier_limits},
+        ).execute()
+        data = res.data
+        row = data[0] if isinstance(data, list) and data else data
+        if not isinstance(row, dict):
+            raise RuntimeError("consume_usage returned no row")
+        return bool(row["allowed"]), int(row.get("used") or 0)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_usage_store():
+    """Process-wide store: Supabase (service role) when configured, else None (usage is not counted)."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            from src.models.user import supabase
+
+            if supabase is not None:
+                _STORE = SupabaseUsageStore(supabase)
+        return _STORE
@@ -28,14 +28,19 @@ BUCKET_NAME = "kdp-created-files"
 SIGNED_URL_EXPIRY = 3600  # 1 hour in seconds
 
 
-def _storage_client():
+def storage_client():
+    """The caller's RLS-scoped client, else the global one.
+
+    Resolve it on the request thread and pass it as ``client=`` to calls made from worker threads,
+    which have no request (and so no bearer token) of their own.
+    """
     scoped = user_scoped_client()
     if scoped is not None:
         return scoped
     return supabase
 
 
-def upload_file(file_bytes: bytes, user_id: str, filename: str, file_type: str) -> dict:
+def upload_file(file_bytes: bytes, user_id: str, filename: str, file_type: str, client=None) -> dict:
     """
     Upload a file to Supabase Storage.
 
@@ -44,11 +49,12 @@ def upload_file(file_bytes: bytes, user_id: str, filename: str, file_type: str)
         user_id: The user ID (for organizing files)
         filename: The filename to save as
         file_type: Type of file (e.g., 'coloring_page', 'kdp_formatted_pdf')
+        client: Storage client to use (see storage_client); resolved from the request if omitted
 
     Returns:
         dict with 'path', 'url', and 'signed_url' keys
     """
-    client = _storage_client()
+    client = client or storage_client()
     if not client:
         raise Exception(
             "Supabase is not configured. Please set SUPABASE_URL and "
@@ -84,17 +90,51 @@ def upload_file(file_bytes: bytes, user_id: str, filename: str, file_type: str)
         raise Exception(f"Failed to upload file to Supabase: {str(e)}")
 
 
-def delete_file(file_path: str) -> bool:
+def download_file(file_path: str) -> bytes:
+    """
+    Download a file from Supabase Storage (batch workers read queued inputs).
+
+    Args:
+        file_path: The full path of the file to download
+
+    Returns:
+        The file content as bytes
+    """
+    client = storage_client()
+    if not client:
+        raise Exception("Supabase is not configured. File downloads are disabled.")
+
+    try:
+        return client.storage.from_(BUCKET_NAME).download(file_path)
+    except Exception as e:
+        raise Exception(f"Failed to download file from Supabase: {str(e)}")
+
+
+def create_signed_url(file_path: str, client=None) -> str | None:
+    """Fresh signed URL for an existing object (valid for SIGNED_URL_EXPIRY seconds)."""
+    client = client or storage_client()
+    if not client:
+        return None
+    try:
+        signed_url = client.storage.from_(BUCKET_NAME).create_signed_url(file_path, SIGNED_URL_EXPIRY)
+        return (signed_url.get("signedURL") or signed_url.get("signedUrl")) if signed_url else None
+    except Exception as e:
+        print(f"Failed to sign file {file_path}: {str(e)}")
+        return None
+
+
+def delete_file(file_path: str, client=None) -> bool:
     """
     Delete a file from Supabase Storage.
 
     Args:
         file_path: The full path of the file to delete
+        client: Storage client to use (see storage_client); resolved from the request if omitted
 
     Returns:
         True if successful, False otherwise
     """
-    client = _storage_client()
+    client = client or storage_client()
     if not client:
         return False
 
@@ -7,13 +7,18 @@ Provides rate limiting for sensitive API endpoints:
 - File uploads
 - Batch processing
 
-Uses in-memory storage (suitable for single-instance deployments).
-For multi-instance deployments, use Redis.
+With Supabase configured, limits are shared across instances through one counter row per
+key and window (see scripts/migrations/rate_limit_counters.sql): each check is a single
+rate_limit_hit RPC. Without it (local dev, tests), or if the RPC fails, an in-memory
+limiter is used.
 """
 
+import math
+import os
+import sqlite3
+import threading
 import time
-from collections import defaultdict
-from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
 from functools import wraps
 
 from flask import request
@@ -26,32 +31,67 @@ from src.utils.responses import error_response
 # Rate Limiter Configuration
 # ============================================================================
 
+DEFAULT_MAX_KEYS = 100_000
 
-class RateLimiter:
-    """In-memory rate limiter for single-instance deployments"""
 
-    def __init__(self):
-        self.requests = defaultdict(list)
-        self.cleanup_interval = 300  # Clean up old entries every 5 minutes
-        self.last_cleanup = time.time()
+def _configured_max_keys():
+    """In-memory limiter key cap from RATE_LIMIT_MAX_KEYS."""
+    raw = os.environ.get("RATE_LIMIT_MAX_KEYS", "").strip()
+    try:
+        return int(raw) if raw else DEFAULT_MAX_KEYS
+    except ValueError:
+        return DEFAULT_MAX_KEYS
 
-    def _cleanup(self):
-        """Remove old entries to prevent memory bloat"""
-        current_time = time.time()
 
-        if current_time - self.last_cleanup < self.cleanup_interval:
-            return
+def _slide(window_start, hits, previous_hits, now, max_requests, window_seconds):
+    """Sliding-window counter step shared by every limiter here (and mirrored in the rate_limit_hit RPC).
 
-        # Remove entries older than 1 hour
-        cutoff_time = current_time - 3600
+    The estimate is this fixed window's hits plus the previous window's hits weighted by how
+    much of it still overlaps the sliding window. Denied requests are not counted.
+
+    Returns:
+        tuple: ((window_start, hits, previous_hits), (allowed, remaining, reset_time))
+    """
+    current_start = math.floor(now / window_seconds) * window_seconds
+    if window_start < current_start:
+        previous_hits = hits if window_start == current_start - window_seconds else 0
+        hits = 0
+        window_start = current_start
+    estimate = previous_hits * (1 - (now - current_start) / window_seconds) + hits
+    allowed = estimate + 1 <= max_requests
+    if allowed:
+        hits += 1
+        estimate += 1
+    remaining = max(0, max_requests - math.ceil(estimate))
+    return (window_start, hits, previous_hits), (allowed, remaining, current_start + window_seconds)
 
-        for key in list(self.requests.keys()):
-            self.requests[key] = [timestamp for timestamp in self.requests[key] if timestamp > cutoff_time]
 
-            if not self.requests[key]:
-                del self.requests[key]
+class _Window:
+    """Counter state for one (key, window) in the in-memory limiter."""
+
+    __slots__ = ("window_start", "hits", "previous_hits")
+
+    def __init__(self):
+        self.window_start = 0.0
+        self.hits = 0
+        self.previous_hits = 0
 
-        self.last_cleanup = current_time
+
+class RateLimiter:
+    """In-memory sliding-window-counter limiter for single-instance deployments (and the shared-store fallback).
+
+    Each (key, window) keeps three numbers however many requests it makes, and the table is
+    capped at ``max_keys`` entries, evicting the least recently seen key (which forgets its
+    count) once full. RATE_LIMIT_MAX_KEYS sets the cap.
+    """
+
+    def __init__(self, max_keys=None, clock=time.time):
+        if max_keys is None:
+            max_keys = _configured_max_keys()
+        self.max_keys = max(1, max_keys)
+        self.windows = OrderedDict()
+        self._clock = clock
+        self._lock = threading.Lock()
 
     def is_allowed(self, key, max_requests, window_seconds):
         """
@@ -65,44 +105,137 @@ class RateLimiter:
         Returns:
             tuple: (allowed, remaining_requests, reset_time)
         """
-        self._cleanup()
-
-        current_time = time.time()
-        cutoff_time = current_time - window_seconds
+        now = self._clock()
+        slot = (key, window_seconds)
+        with self._lock:
+            window = self.windows.get(slot)
+            if window is None:
+                window = self.windows[slot] = _Window()
+                if len(self.windows) > self.max_keys:
+                    self.windows.popitem(last=False)
+            else:
+                self.windows.move_to_end(slot)
+            state, result = _slide(
+                window.window_start, window.hits, window.previous_hits, now, max_requests, window_seconds
+            )
+            window.window_start, window.hits, window.previous_hits = state
+        return result
 
-        # Remove old requests outside the window
-        self.requests[key] = [timestamp for timestamp in self.requests[key] if timestamp > cutoff_time]
+    def reset(self, key):
+        """Forget every window counted for ``key``; returns whether there was any."""
+        with self._lock:
+            slots = [slot for slot in self.windows if slot[0] == key]
+            for slot in slots:
+                del self.windows[slot]
+        return bool(slots)
 
-        # Check if limit exceeded
-        request_count = len(self.requests[key])
 
-        if request_count >= max_requests:
-            # Calculate reset time (when oldest request expires)
-            reset_time = self.requests[key][0] + window_seconds
-            return False, 0, reset_time
+# ============================================================================
+# Shared Stores
+# ============================================================================
 
-        # Add current request
-        self.requests[key].append(current_time)
 
-        remaining = max_requests - len(self.requests[key])
-        reset_time = current_time + window_seconds
+class SqliteRateLimitStore:
+    """Local stand-in for the rate_limit_counters table. One connection, serialized by a lock."""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_limit_counters (
+            key TEXT NOT NULL,
+            window_seconds INTEGER NOT NULL,
+            window_start REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            previous_hits INTEGER NOT NULL DEFAULT 0,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (key, window_seconds)
+        );
+        CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_expires_at ON rate_limit_counters (expires_at);
+    """
 
-        return True, remaining, reset_time
+    def __init__(self, path=":memory:", clock=time.time, cleanup_interval=300):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.executescript(self._SCHEMA)
+        self._clock = clock
+        self.cleanup_interval = cleanup_interval
+        self.last_cleanup = clock()
+
+    def hit(self, key, max_requests, window_seconds):
+        """Count one request against ``key``; returns (allowed, remaining, reset_time)."""
+        now = self._clock()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT window_start, hits, previous_hits FROM rate_limit_counters"
+                    " WHERE key = ? AND window_seconds = ?",
+                    (key, window_seconds),
+                ).fetchone()
+                state, result = _slide(*(row or (0.0, 0, 0)), now, max_requests, window_seconds)
+                window_start, hits, previous_hits = state
+                self._conn.execute(
+                    "INSERT INTO rate_limit_counters"
+                    " (key, window_seconds, window_start, hits, previous_hits, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (key, window_seconds) DO UPDATE SET"
+                    " window_start = excluded.window_start, hits = excluded.hits,"
+                    " previous_hits = excluded.previous_hits, expires_at = excluded.expires_at",
+                    (key, window_seconds, window_start, hits, previous_hits, window_start + 2 * window_seconds),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            if now - self.last_cleanup >= self.cleanup_interval:
+                self._cleanup(now)
+        return result
+
+    def _cleanup(self, now):
+        self._conn.execute("DELETE FROM rate_limit_counters WHERE expires_at < ?", (now,))
+        self.last_cleanup = now
+
+    def cleanup(self):
+        """Drop counters whose window (and the one after it) has passed."""
+        with self._lock:
+            self._cleanup(self._clock())
+
+
+class SupabaseRateLimitStore:
+    """rate_limit_counters in Postgres: one rate_limit_hit RPC per check, expired rows swept server-side."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def hit(self, key, max_requests, window_seconds):
+        res = self.client.rpc(
+            "rate_limit_hit",
+            {"p_key": key, "p_limit": int(max_requests), "p_window_seconds": int(window_seconds)},
+        ).execute()
+        data = res.data
+        row = data[0] if isinstance(data, list) and data else data
+        if not isinstance(row, dict):
+            raise RuntimeError("rate_limit_hit returned no row")
+        return bool(row["allowed"]), int(row["remaining"]), float(row["reset_at"])
 
 
-# Global rate limiter instance
 class CompositeRateLimiter:
-    """Postgres-backed limiter with in-memory fallback if the shared table is missing."""
+    """Shared-store limiter (Supabase RPC by default) with in-memory fallback if the store fails."""
 
-    def __init__(self):
+    def __init__(self, shared=None):
         self.memory = RateLimiter()
+        self.shared = shared
         self._warned_fallback = False
 
+    def _shared_store(self):
+        if self.shared is None and supabase is not None:
+            self.shared = SupabaseRateLimitStore(supabase)
+        return self.shared
+
     def is_allowed(self, key, max_requests, window_seconds):
-        if supabase is None:
+        store = self._shared_store()
+        if store is None:
             return self.memory.is_allowed(key, max_requests, window_seconds)
         try:
-            return self._shared_is_allowed(supabase, str(key), max_requests, window_seconds)
+            return store.hit(str(key), max_requests, window_seconds)
         except Exception as store_error:
             if not self._warned_fallback:
                 log_warning(
@@ -112,25 +245,8 @@ class CompositeRateLimiter:
                 self._warned_fallback = True
             return self.memory.is_allowed(key, max_requests, window_seconds)
 
-    def _shared_is_allowed(self, client, key, max_requests, window_seconds):
-        now = datetime.now(timezone.utc)
-        cutoff = (now - timedelta(seconds=window_seconds)).isoformat()
-        client.table("rate_limit_events").insert({"key": key, "created_at": now.isoformat()}).execute()
-        res = (
-            client.table("rate_limit_events")
-            .select("id", count="exact")
-            .eq("key", key)
-            .gte("created_at", cutoff)
-            .execute()
-        )
-        count = res.count if getattr(res, "count", None) is not None else len(res.data or [])
-        reset_time = time.time() + window_seconds
-        if count > max_requests:
-            return False, 0, reset_time
-        remaining = max(0, max_requests - count)
-        return True, remaining, reset_time
-
 
+# Global rate limiter instance
 _rate_limiter = CompositeRateLimiter()
 
 
@@ -346,7 +462,4 @@ def get_rate_limit_status(key, max_requests, window_seconds):
 
 def reset_rate_limit(key):
     """Reset rate limit for a specific key (admin only)"""
-    if key in _rate_limiter.memory.requests:
-        del _rate_limiter.memory.requests[key]
-        return True
-    return False
+    return _rate_limiter.memory.reset(key)
@@ -0,0 +1,135 @@
+"""Upload ingestion: spooled multipart bodies, per-endpoint byte limits, header-only probes.
+
+Multipart file parts are streamed into a SpooledTemporaryFile (small parts stay in memory,
+large ones go to disk). The byte limit is applied while the body is still streaming, and
+images/PDFs are checked from their headers before anything decodes them, so an oversized or
+bogus upload is rejected without the worker ever holding it in memory.
+"""
+
+import os
+import tempfile
+from functools import wraps
+
+from flask import Request, request
+from PIL import Image, UnidentifiedImageError
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from src.utils.responses import error_response
+
+MB = 1024 * 1024
+# Parts up to this size stay in memory; larger ones roll over to a temp file.
+SPOOL_MEMORY_BYTES = 1 * MB
+
+UPLOAD_LIMIT_DEFAULTS_MB = {"image": 40, "pdf": 100, "batch": 200}
+ALLOWED_IMAGE_FORMATS = frozenset({"JPEG", "PNG", "WEBP", "GIF", "BMP", "TIFF", "MPO"})
+
+
+def upload_limit_bytes(kind: str) -> int:
+    """UPLOAD_MAX_<KIND>_MB, e.g. UPLOAD_MAX_IMAGE_MB; defaults in UPLOAD_LIMIT_DEFAULTS_MB."""
+    raw = os.environ.get(f"UPLOAD_MAX_{kind.upper()}_MB", "").strip()
+    try:
+        return int(float(raw) * MB) if raw else UPLOAD_LIMIT_DEFAULTS_MB[kind] * MB
+    except ValueError:
+        return UPLOAD_LIMIT_DEFAULTS_MB[kind] * MB
+
+
+def max_upload_bytes() -> int:
+    """App-wide backstop: the largest per-endpoint limit."""
+    return max(upload_limit_bytes(kind) for kind in UPLOAD_LIMIT_DEFAULTS_MB)
+
+
+class UploadRequest(Request):
+    """Request class whose multipart file parts spool to disk past SPOOL_MEMORY_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES, mode="rb+")
+
+
+def _too_large(limit: int):
+    return error_response(
+        f"Upload too large. Maximum size: {limit / MB:.0f} MB",
+        "FILE_TOO_LARGE",
+        details={"max_size": limit},
+        status_code=413,
+    )
+
+
+def upload_limit(kind: str):
+    """Cap the request body for this endpoint and parse it eagerly.
+
+    Werkzeug rejects a declared Content-Length over the cap before reading anything and
+    stops a chunked body as soon as it crosses the cap. Place under @jwt_required() so
+    unauthenticated bodies are never read.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limit = upload_limit_bytes(kind)
+            request.max_content_length = limit
+            try:
+                request.files
+            except RequestEntityTooLarge:
+                return _too_large(limit)
+            return f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
+
+
+def _file_size(file_storage) -> int:
+    stream = file_storage.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+def image_upload_problem(file_storage, max_pixels: int, label: str = "file"):
+    """Header-only image check. Returns (code, message) for a bad upload, else None."""
+    if _file_size(file_storage) == 0:
+        return "INVALID_IMAGE", f"{label} is empty"
+    stream = file_storage.stream
+    try:
+        stream.seek(0)
+        with Image.open(stream) as image:
+            width, height = image.size
+            image_format = image.format
+    except Image.DecompressionBombError:
+        return "IMAGE_TOO_LARGE", f"{label}: image too large. Max {max_pixels} pixels."
+    except (UnidentifiedImageError, OSError, ValueError):
+        return "INVALID_IMAGE", f"{label} is not a supported image"
+    finally:
+        stream.seek(0)
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        return "INVALID_IMAGE", f"{label}: unsupported image format {image_format}"
+    if width * height > max_pixels:
+        return "IMAGE_TOO_LARGE", f"{label}: image too large ({width}×{height}). Max {max_pixels} pixels."
+    return None
+
+
+def pdf_upload_problem(file_storage, label: str = "file"):
+    """Magic-number check (%PDF- within the first KB). Returns (code, message) or None."""
+    stream = file_storage.stream
+    try:
+        stream.seek(0)
+        head = stream.read(1024)
+    finally:
+        stream.seek(0)
+    if b"%PDF-" not in head:
+        return "INVALID_PDF", f"{label} is not a PDF"
+    return None
+
+
+def check_image_upload(file_storage, max_pixels: int):
+    """image_upload_problem as an error response (None when the upload is fine)."""
+    problem = image_upload_problem(file_storage, max_pixels)
+    return error_response(problem[1], problem[0], status_code=400) if problem else None
+
+
+def check_pdf_upload(file_storage):
+    """pdf_upload_problem as an error response (None when the upload is fine)."""
+    problem = pdf_upload_problem(file_storage)
+    return error_response(problem[1], problem[0], status_code=400) if problem else None
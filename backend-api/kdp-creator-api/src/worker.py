@@ -0,0 +1,34 @@
+"""Standalone batch-job worker: python -m src.worker
+
+Run one or more of these next to the API (and set JOB_WORKERS_EMBEDDED=0 on the API)
+to keep heavy batch work out of the request-serving processes.
+"""
+
+import os
+import signal
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.services.batch_jobs import start_job_workers
+
+
+def main():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    pool = start_job_workers()
+    print(f"[WORKER] {pool.size} batch worker(s) running as {pool.prefix}")
+    stop.wait()
+    print("[WORKER] Shutting down; in-flight jobs finish or are reclaimed after their lease expires")
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -145,6 +145,58 @@ def test_template_generate_requires_auth(client):
     assert_error_envelope(payload, 401)
 
 
+def test_template_generate_reuses_identical_uploads():
+    import json
+
+    from src.routes import templates as template_routes
+    from src.services.template_pool import submit_stage
+
+    record = {'interior_path': 'u1/template_interior/a.pdf', 'cover_path': 'u1/template_cover/b.pdf', 'preview': 'jpeg'}
+    template_routes.uploaded_products().put('product-key', json.dumps(record).encode('utf-8'))
+
+    def sign(path, client):
+        return f'{client}:{path}'
+
+    signed = template_routes._reuse_uploads('product-key', submit_stage, sign, 'scoped')
+    # The request's client is handed to the stage threads, which have no request of their own.
+    assert signed == ('scoped:u1/template_interior/a.pdf', 'scoped:u1/template_cover/b.pdf', 'jpeg')
+    # Objects deleted from storage (no URL) fall back to a fresh upload.
+    assert template_routes._reuse_uploads('product-key', submit_stage, lambda path, client: None, 'scoped') is None
+    assert template_routes._reuse_uploads('unknown-key', submit_stage, sign, 'scoped') is None
+
+
+def test_failed_template_upload_leaves_no_orphaned_objects():
+    import threading
+    from concurrent.futures import Future, ThreadPoolExecutor
+
+    from src.routes import templates as template_routes
+
+    failed = Future()
+    failed.set_exception(RuntimeError('storage down'))
+    finished = Future()
+    finished.set_result({'path': 'u1/template_cover/done.pdf'})
+    started, release = threading.Event(), threading.Event()
+
+    def slow_upload():
+        started.set()
+        release.wait()
+        return {'path': 'u1/template_cover/late.pdf'}
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        running = pool.submit(slow_upload)
+        queued = pool.submit(lambda: {'path': 'u1/template_cover/never.pdf'})
+        started.wait()
+        deleted = []
+
+        template_routes._discard_uploads(
+            (failed, finished, running, queued), lambda path, client: deleted.append((path, client)), 'scoped'
+        )
+        assert queued.cancelled()
+        assert deleted == [('u1/template_cover/done.pdf', 'scoped')]
+        release.set()
+    assert deleted == [('u1/template_cover/done.pdf', 'scoped'), ('u1/template_cover/late.pdf', 'scoped')]
+
+
 def test_templates_niche_filter(client):
     response = client.get('/api/templates?niche=kids_workbook')
     payload = response.get_json()
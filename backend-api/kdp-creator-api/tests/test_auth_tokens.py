@@ -0,0 +1,106 @@
+"""Tests for local access-token verification in jwt_required."""
+
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("ENVIRONMENT", "development")
+
+import jwt as pyjwt
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import src.models.user as user_module
+from src.main import app
+from src.models.user import TokenCache, verify_access_token
+
+SECRET = "project-jwt-secret-at-least-32-bytes-long"
+WRONG_SECRET = "some-other-projects-jwt-secret-value"
+
+
+class FakeAuth:
+    def __init__(self):
+        self.calls = 0
+
+    def get_user(self, token):
+        self.calls += 1
+        return SimpleNamespace(user=SimpleNamespace(id="remote-user", email="remote@example.com"))
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", SECRET)
+    fake = FakeAuth()
+    monkeypatch.setattr(user_module, "supabase", SimpleNamespace(auth=fake))
+    monkeypatch.setattr(user_module, "_TOKEN_CACHE", TokenCache(60, 100))
+    return fake
+
+
+def _token(secret=SECRET, **claims):
+    payload = {"sub": "user-1", "aud": "authenticated", "email": "a@example.com", "exp": int(time.time()) + 3600}
+    return pyjwt.encode({**payload, **claims}, secret, algorithm="HS256")
+
+
+def test_valid_token_is_verified_locally_and_cached(auth, monkeypatch):
+    token = _token(app_metadata={"role": "admin"})
+    user = verify_access_token(token)
+
+    assert (user.id, user.email, user.app_metadata) == ("user-1", "a@example.com", {"role": "admin"})
+    assert auth.calls == 0
+
+    monkeypatch.setattr(user_module, "verify_supabase_token", lambda token: pytest.fail("not cached"))
+    assert verify_access_token(token) is user
+
+
+def test_forged_expired_and_subjectless_tokens_are_refused(auth):
+    assert verify_access_token(_token(secret=WRONG_SECRET)) is None
+    assert verify_access_token(_token(exp=int(time.time()) - 10)) is None
+    assert verify_access_token(_token(sub="")) is None
+    assert auth.calls == 0
+
+
+def test_remote_verification_always_asks_supabase(auth):
+    token = _token()
+    verify_access_token(token)
+    assert verify_access_token(token, remote=True).id == "remote-user"
+    assert verify_access_token(token, remote=True).id == "remote-user"
+    assert auth.calls == 2
+
+
+def test_without_secret_remote_runs_once_per_token(auth, monkeypatch):
+    monkeypatch.delenv("SUPABASE_JWT_SECRET")
+    token = _token()
+    assert verify_access_token(token).id == "remote-user"
+    assert verify_access_token(token).id == "remote-user"
+    assert auth.calls == 1
+
+
+def test_cache_entries_expire_with_ttl_or_token():
+    clock = SimpleNamespace(now=1000.0)
+    cache = TokenCache(60, 2, clock=lambda: clock.now)
+    cache.put("short", "u1", token_exp=1010)
+    cache.put("long", "u2")
+    cache.put("newest", "u3")  # over max_entries: "short" is evicted
+
+    assert cache.get("short") is None
+    clock.now = 1059.0
+    assert (cache.get("long"), cache.get("newest")) == ("u2", "u3")
+    clock.now = 1061.0
+    assert cache.get("long") is None
+
+
+def test_jwt_required_accepts_locally_verified_token(auth):
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        ok = client.get("/api/me", headers={"Authorization": f"Bearer {_token()}"})
+        forged = client.get("/api/me", headers={"Authorization": f"Bearer {_token(secret=WRONG_SECRET)}"})
+
+    assert ok.status_code == 404  # authenticated; there is just no profile row here
+    assert forged.status_code == 401
+    assert forged.get_json()["error"]["code"] == "AUTH_INVALID"
+    assert auth.calls == 0
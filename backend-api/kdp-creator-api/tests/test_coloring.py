@@ -0,0 +1,239 @@
+"""Tests for the coloring-book line-art engines and batch execution."""
+
+import base64
+import io
+import os
+import sys
+import time
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("ENVIRONMENT", "development")
+
+import jwt as pyjwt
+import numpy as np
+import pytest
+from PIL import Image
+from pypdf import PdfReader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.services.coloring import coloring_gray
+from src.services.coloring_pool import render_coloring_batch, shutdown_pool
+from src.services.kdp_specs import interior_page_size_pts
+from src.services.raster_pdf import RasterPdfWriter
+
+
+def _image_bytes(color, size=(120, 160), mode="RGB"):
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def pool_cleanup():
+    yield
+    shutdown_pool()
+
+
+def test_batch_pool_preserves_file_order(pool_cleanup):
+    items = [
+        ("a", _image_bytes((0, 0, 0))),
+        ("b", _image_bytes((255, 255, 255))),
+        ("c", _image_bytes((0, 0, 0))),
+    ]
+    outcomes = render_coloring_batch(items, "5x8", with_bleed=False, workers=2)
+    assert [o.key for o in outcomes] == ["a", "b", "c"]
+    assert all(o.ok for o in outcomes)
+    means = [float(o.gray.mean()) for o in outcomes]
+    # Black source is letterboxed into a white page, so it is darker than the all-white page.
+    assert means[0] < means[1]
+    assert means[2] < means[1]
+
+
+def test_batch_reports_failures_per_file():
+    items = [
+        ("ok", _image_bytes((255, 255, 255))),
+        ("huge", _image_bytes(1, size=(8000, 7000), mode="1")),
+    ]
+    outcomes = render_coloring_batch(items, "5x8", with_bleed=False, workers=0)
+    assert outcomes[0].ok is True
+    assert outcomes[1].ok is False
+    assert outcomes[1].error_code == "IMAGE_TOO_LARGE"
+
+
+def test_raster_pdf_pages_are_lossless_1bit():
+    source = Image.new("RGB", (300, 400), (255, 255, 255))
+    source.paste((0, 0, 0), (100, 100, 200, 300))
+    buffer = io.BytesIO()
+    source.save(buffer, format="PNG")
+    gray = coloring_gray(buffer.getvalue(), "6x9", with_bleed=True)
+
+    width_pt, height_pt = interior_page_size_pts("6x9", with_bleed=True)
+    writer = RasterPdfWriter(width_pt, height_pt)
+    writer.add_title_page("My (Coloring) Book")
+    writer.add_bitmap_page(gray)
+    writer.pad_for_print()
+    reader = PdfReader(io.BytesIO(writer.getvalue()))
+
+    assert len(reader.pages) == 24
+    assert abs(float(reader.pages[1].mediabox.width) - width_pt) < 0.01
+    assert "My (Coloring) Book" in reader.pages[0].extract_text()
+    image = reader.pages[1].images[0].image
+    assert image.size == (gray.shape[1], gray.shape[0])
+    assert np.array_equal(np.asarray(image.convert("L")), gray)
+
+
+def test_repeat_conversion_is_served_from_result_cache(monkeypatch):
+    import src.services.coloring as coloring
+
+    monkeypatch.setattr(coloring, "_RESULT_CACHE", None)
+    source = _image_bytes((40, 40, 40))
+    first, hit = coloring.cached_coloring_gray(source, "5x8", with_bleed=False, engine="legacy", threshold=100)
+    assert hit is False
+
+    def fail(*args, **kwargs):
+        raise AssertionError("engine should not run on a cache hit")
+
+    monkeypatch.setattr(coloring, "coloring_gray", fail)
+    # Legacy ignores contrast, so a contrast tweak still hits.
+    again, hit = coloring.cached_coloring_gray(
+        source, "5x8", with_bleed=False, engine="legacy", threshold=100, contrast=20
+    )
+    assert hit is True
+    assert np.array_equal(again, first)
+
+
+def test_threshold_rerun_reuses_prepared_canvas(monkeypatch):
+    import src.services.coloring as coloring
+
+    monkeypatch.setattr(coloring, "_CANVAS_CACHE", None)
+    monkeypatch.setattr(coloring, "_RESULT_CACHE", None)
+    source = Image.new("RGB", (300, 400), (255, 255, 255))
+    source.paste((90, 90, 90), (50, 50, 250, 350))
+    buffer = io.BytesIO()
+    source.save(buffer, format="PNG")
+    source_bytes = buffer.getvalue()
+
+    expected = {t: coloring.coloring_gray(source_bytes, "6x9", engine="legacy", threshold=t) for t in (60, 127)}
+    decodes = []
+    real_load = coloring._load_rgb
+    monkeypatch.setattr(coloring, "_load_rgb", lambda *a, **k: decodes.append(1) or real_load(*a, **k))
+
+    for threshold in (60, 127):
+        gray = coloring.coloring_gray(source_bytes, "6x9", engine="legacy", threshold=threshold)
+        assert np.array_equal(gray, expected[threshold])
+    enhanced = coloring.coloring_gray(source_bytes, "6x9", engine="enhanced", contrast=10)
+    # Opaque RGB: the enhanced engine's alpha-flattened canvas is decoded once, legacy's never again.
+    assert len(decodes) == 1
+    assert enhanced.shape == expected[60].shape
+
+
+def test_remove_small_objects_matches_per_label_reference():
+    from benchmarks.bench_coloring import _remove_small_objects_per_label, noisy_mask
+    from src.services.coloring import _remove_small_objects
+
+    mask = noisy_mask(200, 160, density=0.45, seed=3)
+    for min_size in (1, 5, 10):
+        assert np.array_equal(_remove_small_objects(mask, min_size), _remove_small_objects_per_label(mask, min_size))
+    assert not _remove_small_objects(np.zeros((4, 4), bool)).any()
+
+
+@pytest.mark.parametrize(
+    "opts",
+    [
+        {"detail_level": "medium", "threshold": "auto", "contrast": 10, "edge_enhancement": "mild"},
+        {"detail_level": "high", "threshold": 100, "contrast": 0, "edge_enhancement": "off"},
+        {"detail_level": "low", "threshold": 180, "contrast": -30, "edge_enhancement": "strong"},
+    ],
+)
+def test_lean_enhanced_pipeline_matches_float64_within_budget(opts):
+    import tracemalloc
+
+    from benchmarks.bench_coloring import enhanced_lines_float64, photo_like_canvas
+    from src.services.coloring import ENHANCED_PEAK_BYTES_PER_PIXEL, _enhanced_lines
+
+    canvas = photo_like_canvas(900, 700, seed=5)
+    reference = enhanced_lines_float64(canvas, **opts)
+    tracemalloc.start()
+    try:
+        lean = _enhanced_lines(canvas, **opts)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert lean.dtype == np.uint8
+    # float32 may flip a handful of pixels sitting exactly on the 0.1 edge cutoff.
+    assert np.count_nonzero(lean != reference) / lean.size < 1e-4
+    assert peak < ENHANCED_PEAK_BYTES_PER_PIXEL * canvas.size
+
+
+def test_preview_working_dpi_keeps_the_framing():
+    from src.services.coloring import PREVIEW_WORKING_DPI
+
+    source = Image.new("RGB", (600, 800), (255, 255, 255))
+    source.paste((20, 20, 20), (150, 200, 450, 600))
+    buffer = io.BytesIO()
+    source.save(buffer, format="PNG")
+
+    for engine in ("legacy", "enhanced"):
+        draft = coloring_gray(buffer.getvalue(), "8.5x11", engine=engine, dpi=PREVIEW_WORKING_DPI)
+        full = coloring_gray(buffer.getvalue(), "8.5x11", engine=engine)
+        assert draft.size * 9 < full.size
+        # Same framing: the dark block covers a similar share of the page at both resolutions.
+        assert abs(float((draft == 0).mean()) - float((full == 0).mean())) < 0.02
+
+
+def test_preview_request_returns_a_draft_jpeg_without_storing_or_counting(monkeypatch):
+    import src.models.user as user_module
+    import src.routes.pdf_processing as pdf_processing
+    from src.main import app
+    from src.services.coloring import PREVIEW_WORKING_DPI
+
+    secret = "project-jwt-secret-at-least-32-bytes-long"
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", secret)
+    monkeypatch.setattr(user_module, "_TOKEN_CACHE", user_module.TokenCache(60, 100))
+    monkeypatch.setattr(user_module, "supabase", None)
+
+    def must_not_run(*args, **kwargs):
+        raise AssertionError("preview requests are not stored or counted")
+
+    monkeypatch.setattr(pdf_processing, "upload_file", must_not_run)
+    monkeypatch.setattr(pdf_processing, "reserve_conversion_quota", must_not_run)
+    token = pyjwt.encode(
+        {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 600}, secret, algorithm="HS256"
+    )
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        response = client.post(
+            "/api/pdf/convert-coloring",
+            data={"file": (io.BytesIO(_image_bytes((90, 90, 90), size=(600, 800))), "photo.png"), "preview": "true"},
+            headers={"Authorization": f"Bearer {token}"},
+        )
+
+    assert response.status_code == 200
+    data = response.get_json()["data"]
+    assert data["preview_only"] is True
+    assert data["preview_dpi"] == PREVIEW_WORKING_DPI
+    assert "download_url" not in data
+    assert Image.open(io.BytesIO(base64.b64decode(data["preview"]))).format == "JPEG"
+
+
+def test_large_jpeg_is_draft_decoded_to_cover_the_page():
+    from src.services.coloring import _fit_size, _load_rgb, _prepare_canvas, _target_pixels
+
+    pattern = (np.indices((2400, 3200)).sum(axis=0) // 40 % 2 * 200).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pattern).convert("RGB").save(buffer, format="JPEG", quality=92)
+    target = _target_pixels("5x8", False, dpi=150)
+    needed = _fit_size(3200, 2400, *target)
+
+    draft = _load_rgb(buffer.getvalue(), flatten_alpha=False, fit_within=target)
+    full = _load_rgb(buffer.getvalue(), flatten_alpha=False)
+    assert full.size == (3200, 2400)
+    assert draft.size[0] < full.size[0] and draft.size[0] >= needed[0] and draft.size[1] >= needed[1]
+
+    draft_page = np.asarray(_prepare_canvas(draft, "5x8", False, dpi=150).convert("L"), dtype=np.int16)
+    full_page = np.asarray(_prepare_canvas(full, "5x8", False, dpi=150).convert("L"), dtype=np.int16)
+    assert np.abs(draft_page - full_page).mean() < 2
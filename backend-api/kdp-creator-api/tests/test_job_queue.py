@@ -0,0 +1,127 @@
+"""Tests for the durable batch-job queue (SQLite stand-in store)."""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.services.job_queue import (
+    JobCancelled,
+    JobContext,
+    JobWorkerPool,
+    PermanentJobError,
+    SqliteJobStore,
+    run_job,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SqliteJobStore(str(tmp_path / "jobs.db"))
+
+
+def _enqueue(store, user_id="u1", tier="free", job_type="convert_image", **extra):
+    return store.enqueue(
+        {"user_id": user_id, "job_type": job_type, "tier": tier, "total_files": 2, "payload": {"inputs": ["a", "b"]}}
+        | extra
+    )
+
+
+def test_claim_respects_tier_concurrency(store):
+    first = _enqueue(store, tier="free")
+    _enqueue(store, tier="free")
+    other_user = _enqueue(store, user_id="u2", tier="free")
+
+    assert store.claim("w1")["id"] == first["id"]
+    # u1's second job waits for a free-tier slot; u2's job is claimable.
+    assert store.claim("w2")["id"] == other_user["id"]
+    assert store.claim("w3") is None
+
+
+def test_failed_job_retries_with_backoff_then_fails(store):
+    job = _enqueue(store, max_attempts=2)
+
+    def broken(ctx):
+        raise RuntimeError("storage unavailable")
+
+    handlers = {"convert_image": broken}
+    settled = []
+    assert run_job(store, store.claim("w1"), handlers, "w1", on_failed=settled.append) == "queued"
+    assert settled == []
+    queued = store.get(job["id"])
+    assert queued["error_message"] == "storage unavailable"
+    assert queued["next_run_at"] > datetime.now(timezone.utc).isoformat()
+    assert store.claim("w1") is None  # still backing off
+
+    store._conn.execute("UPDATE batch_jobs SET next_run_at = NULL WHERE id = ?", (job["id"],))
+    assert run_job(store, store.claim("w1"), handlers, "w1", on_failed=settled.append) == "failed"
+    assert store.get(job["id"])["attempts"] == 2
+    assert [failed["id"] for failed in settled] == [job["id"]]
+
+
+def test_permanent_error_is_not_retried(store):
+    job = _enqueue(store)
+
+    def bad_input(ctx):
+        raise PermanentJobError("a.png: Image too large")
+
+    settled = []
+    assert run_job(store, store.claim("w1"), {"convert_image": bad_input}, "w1", on_failed=settled.append) == "failed"
+    assert store.get(job["id"])["attempts"] == 1
+    assert [failed["id"] for failed in settled] == [job["id"]]
+
+
+def test_cancel_stops_running_job_at_next_progress(store):
+    job = _enqueue(store)
+    seen = []
+
+    def handler(ctx):
+        ctx.progress(1)
+        seen.append(1)
+        assert store.cancel(job["id"], "u1") == "processing"
+        ctx.progress(2)
+        seen.append(2)
+        return {}
+
+    assert run_job(store, store.claim("w1"), {"convert_image": handler}, "w1") == "cancelled"
+    assert seen == [1]
+    final = store.get(job["id"])
+    assert final["status"] == "cancelled"
+    assert final["processed_files"] == 1
+
+
+def test_cancel_reports_whether_the_job_had_started(store):
+    queued = _enqueue(store)
+    assert store.cancel(queued["id"], "u2") is None  # not theirs
+    assert store.cancel(queued["id"], "u1") == "queued"
+    assert store.cancel(queued["id"], "u1") is None  # already cancelled
+    assert store.claim("w1") is None
+
+
+def test_expired_lease_is_reclaimed(store):
+    job = _enqueue(store)
+    assert store.claim("dead-worker")["id"] == job["id"]
+    expired = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    store._conn.execute("UPDATE batch_jobs SET lease_expires_at = ? WHERE id = ?", (expired, job["id"]))
+
+    reclaimed = store.claim("w2")
+    assert reclaimed["id"] == job["id"]
+    assert reclaimed["attempts"] == 2
+    # The dead worker can no longer write to the job.
+    assert store.progress(job["id"], "dead-worker", 1) is False
+    with pytest.raises(JobCancelled):
+        JobContext(store, reclaimed | {"leased_by": "dead-worker"}, "dead-worker", 60, 60).progress(1)
+
+
+def test_worker_pool_runs_job_to_completion(store):
+    job = _enqueue(store, job_type="convert_pdf")
+    pool = JobWorkerPool(store, {"convert_pdf": lambda ctx: {"outputs": [{"path": "u1/out.pdf"}]}})
+
+    assert pool.run_once() == "completed"
+    final = store.get(job["id"])
+    assert final["status"] == "completed"
+    assert final["result"] == {"outputs": [{"path": "u1/out.pdf"}]}
+    assert pool.run_once() is None
@@ -0,0 +1,84 @@
+"""Tests for reformatting manuscript PDFs to KDP interior sizes."""
+
+import io
+import os
+import sys
+
+from pypdf import PdfReader, PdfWriter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.services.kdp_specs import MIN_PAGE_COUNT, interior_page_size_pts
+from src.services.pdf_format import fit_transform, format_pdf_for_kdp
+
+
+def _manuscript(pages: int, size=(612, 792), image=None) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=size)
+    for number in range(pages):
+        pdf.setFont("Helvetica", 12)
+        pdf.drawString(72, 720, f"Chapter page {number}")
+        if image is not None:
+            pdf.drawImage(ImageReader(image), 72, 72, 200, 200)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def test_fit_transform_centers_offset_box():
+    scale, tx, ty = fit_transform([10, 20, 110, 220], 50, 50)
+    assert scale == 0.25
+    # The box origin maps to the centered lower-left corner.
+    assert (10 * scale + tx, 20 * scale + ty) == (12.5, 0.0)
+
+
+def test_format_pads_and_resizes_every_page():
+    source = _manuscript(5)
+    result = format_pdf_for_kdp(io.BytesIO(source), "6x9", "kdp-print")
+    reader = PdfReader(io.BytesIO(result.pdf_bytes))
+    target = interior_page_size_pts("6x9", with_bleed=result.with_bleed)
+
+    assert result.page_count == len(reader.pages) == MIN_PAGE_COUNT
+    for page in reader.pages:
+        assert (float(page.mediabox.width), float(page.mediabox.height)) == target
+    assert "Chapter page 3" in reader.pages[3].extract_text()
+
+
+def test_format_shares_resources_across_pages():
+    source = _manuscript(60)
+    result = format_pdf_for_kdp(source, "8.5x11", "kdp-print-bleed")
+    reader = PdfReader(io.BytesIO(result.pdf_bytes))
+
+    forms = [page["/Resources"]["/XObject"]["/KdpPage"] for page in reader.pages[:60]]
+    assert {form["/Subtype"] for form in forms} == {"/Form"}
+    assert len({form["/Resources"]["/Font"]["/F1"].indirect_reference.idnum for form in forms}) == 1
+    # Fitting wraps content instead of copying it, so output stays near the input size.
+    assert len(result.pdf_bytes) < len(source) * 1.5
+
+
+def test_ebook_pages_pass_through():
+    result = format_pdf_for_kdp(_manuscript(3, size=(400, 600)), "6x9", "kdp-ebook")
+    reader = PdfReader(io.BytesIO(result.pdf_bytes))
+    assert result.page_count == 3
+    assert float(reader.pages[0].mediabox.width) == 400
+
+
+def test_format_merges_images_embedded_per_chapter():
+    from PIL import Image
+
+    art = Image.new("RGB", (64, 64), (200, 40, 40))
+    chapters = PdfWriter()
+    for _ in range(3):
+        # Each appended chapter brings its own copy of the same image.
+        chapters.append(PdfReader(io.BytesIO(_manuscript(2, image=art))))
+    manuscript = io.BytesIO()
+    chapters.write(manuscript)
+
+    reader = PdfReader(io.BytesIO(format_pdf_for_kdp(manuscript.getvalue(), "6x9").pdf_bytes))
+    images = set()
+    for page in reader.pages[:6]:
+        xobjects = page["/Resources"]["/XObject"]["/KdpPage"]["/Resources"]["/XObject"]
+        images |= {xobjects.raw_get(name).idnum for name in xobjects}
+    assert len(images) == 1
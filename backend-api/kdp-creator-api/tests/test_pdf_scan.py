@@ -0,0 +1,108 @@
+"""Tests for the lazy PDF structure scan used by /pdf/validate-kdp."""
+
+import io
+import os
+import sys
+import tempfile
+import zlib
+
+import pytest
+from pypdf import PdfReader
+from reportlab.pdfgen import canvas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.services.pdf_scan import PdfScanError, inspect_pdf, scan_pdf
+
+
+def _compressed_pdf() -> bytes:
+    """PDF 1.5 with an xref stream (PNG Up predictor) and the page tree inside an object stream."""
+    packed = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        2: b"<< /Type /Pages /Kids [3 0 R 4 0 R 5 0 R] /Count 4 /MediaBox [0 0 432 648] >>",
+        3: b"<< /Type /Page /Parent 2 0 R /Resources << /Font << /F1 10 0 R >> >> /T (a (nested) \\) <<) >>",
+        4: b"<< /Type /Page /Parent 2 0 R /MediaBox 7 0 R >>",
+        5: b"<< /Type /Pages /Parent 2 0 R /Kids [6 0 R] /Count 1 /MediaBox [0 0 612.5 792] >>",
+        6: b"<< /Type /Page /Parent 5 0 R >>",
+    }
+    header, body = [], b""
+    for number, data in packed.items():
+        header.append(b"%d %d" % (number, len(body)))
+        body += data + b"\n"
+    header = b" ".join(header) + b"\n"
+    objstm = zlib.compress(header + body)
+
+    pdf = bytearray(b"%PDF-1.5\n")
+    offsets = {7: len(pdf)}
+    pdf += b"7 0 obj\n[0 0 441 666]\nendobj\n"
+    offsets[8] = len(pdf)
+    pdf += b"8 0 obj\n<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode /Length %d >>\nstream\n" % (
+        len(packed),
+        len(header),
+        len(objstm),
+    )
+    pdf += objstm + b"\nendstream\nendobj\n"
+    offsets[9] = len(pdf)
+
+    rows, previous = [], bytes(7)
+    for number in range(10):
+        if number in packed:
+            row = bytes([2]) + (8).to_bytes(4, "big") + list(packed).index(number).to_bytes(2, "big")
+        elif number in offsets:
+            row = bytes([1]) + offsets[number].to_bytes(4, "big") + bytes(2)
+        else:
+            row = bytes(7)
+        rows.append(bytes([2]) + bytes((a - b) & 0xFF for a, b in zip(row, previous)))
+        previous = row
+    xref = zlib.compress(b"".join(rows))
+    pdf += (
+        b"9 0 obj\n<< /Type /XRef /Size 10 /W [1 4 2] /Root 1 0 R /Filter /FlateDecode "
+        b"/DecodeParms << /Columns 7 /Predictor 12 >> /Length %d >>\nstream\n" % len(xref)
+    )
+    pdf += xref + b"\nendstream\nendobj\nstartxref\n%d\n%%%%EOF\n" % offsets[9]
+    return bytes(pdf)
+
+
+def _simple_pdf(pages: int) -> bytes:
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(432, 648))
+    for number in range(pages):
+        pdf.drawString(72, 500, f"page {number}")
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def test_scan_reads_object_streams_and_inherited_media_boxes():
+    data = _compressed_pdf()
+    scan = scan_pdf(data)
+
+    assert scan.media_boxes == [(0, 0, 432, 648), (0, 0, 441, 666), (0, 0, 612.5, 792)]
+    assert scan.media_boxes == [tuple(float(v) for v in page.mediabox) for page in PdfReader(io.BytesIO(data)).pages]
+    assert scan.page_size_inches(1) == (441 / 72, 666 / 72)
+    assert scan.has_info is False
+
+
+def test_scan_accepts_spooled_and_disk_uploads():
+    data = _simple_pdf(5)
+    spooled = tempfile.SpooledTemporaryFile(max_size=len(data) + 1)
+    spooled.write(data)
+    assert scan_pdf(spooled).page_count == 5
+
+    with tempfile.TemporaryFile() as on_disk:
+        on_disk.write(data)
+        on_disk.flush()
+        scan = scan_pdf(on_disk)
+    assert scan.page_count == 5
+    assert scan.has_info is True
+
+
+def test_damaged_xref_falls_back_to_pypdf():
+    data = _simple_pdf(3)
+    damaged = data[: data.rindex(b"startxref")] + b"startxref\n9\n%%EOF\n"
+
+    with pytest.raises(PdfScanError):
+        scan_pdf(damaged)
+    scan = inspect_pdf(io.BytesIO(damaged))
+    assert scan.engine == "pypdf"
+    assert scan.page_count == 3
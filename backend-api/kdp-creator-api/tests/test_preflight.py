@@ -0,0 +1,117 @@
+"""Tests for the image-DPI / font-embedding preflight."""
+
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("ENVIRONMENT", "development")
+
+import jwt as pyjwt
+import reportlab
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import src.models.user as user_module
+import src.routes.pdf_processing as pdf_processing
+from src.main import app
+from src.services.pdf_format import format_pdf_for_kdp
+from src.services.preflight import preflight_pdf
+
+
+def _manuscript(pages: int, font: str = "Helvetica") -> bytes:
+    sharp = ImageReader(Image.new("L", (600, 600), 128))
+    blurry = ImageReader(Image.new("L", (100, 100), 64))
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=(612, 792))
+    for number in range(pages):
+        pdf.setFont(font, 12)
+        pdf.drawString(72, 720, f"Page {number}")
+        pdf.drawImage(sharp, 72, 300, 144, 144)  # 600 px over 2 in: 300 DPI
+        if number == 2:
+            pdf.drawImage(blurry, 300, 300, 144, 144)  # 100 px over 2 in: 50 DPI
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def test_effective_dpi_per_unique_image():
+    report = preflight_pdf(_manuscript(6))
+
+    assert report.complete
+    assert len(report.images) == 2
+    sharp = max(report.images, key=lambda image: image.pixel_width)
+    assert sharp.placements == 6
+    assert round(sharp.min_effective_dpi) == 300
+    assert [(image.pixel_width, round(image.min_effective_dpi), image.pages) for image in report.low_dpi_images] == [
+        (100, 50, [3])
+    ]
+
+
+def test_dpi_follows_form_xobject_scaling():
+    formatted = format_pdf_for_kdp(_manuscript(2), "6x9", "kdp-print").pdf_bytes
+    report = preflight_pdf(formatted)
+
+    sharp = max(report.images, key=lambda image: image.pixel_width)
+    # Letter pages shrink to the 6.125 in bleed width, so placed images gain resolution.
+    assert round(sharp.min_effective_dpi) == round(300 * 612 / (6.125 * 72))
+
+
+def test_standard_fonts_are_flagged_and_ttf_is_embedded():
+    report = preflight_pdf(_manuscript(1))
+    assert not report.fonts_embedded
+    assert [font.name for font in report.unembedded_fonts] == ["Helvetica"]
+    assert "Font Helvetica is not embedded (first used on page 1)." in report.warnings()
+
+    pdfmetrics.registerFont(TTFont("PreflightVera", str(Path(reportlab.__file__).parent / "fonts" / "Vera.ttf")))
+    assert preflight_pdf(_manuscript(1, font="PreflightVera")).fonts_embedded
+
+
+def test_time_budget_reports_partial_result():
+    report = preflight_pdf(_manuscript(3), time_budget=0)
+    assert not report.complete
+    assert report.warnings()[-1].startswith("Preflight stopped after 0 of 3 pages")
+
+
+def test_validate_kdp_runs_preflight_only_when_asked(monkeypatch):
+    secret = "project-jwt-secret-at-least-32-bytes-long"
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", secret)
+    monkeypatch.setattr(user_module, "_TOKEN_CACHE", user_module.TokenCache(60, 100))
+    monkeypatch.setattr(user_module, "supabase", None)
+    parsed = []
+
+    def spy_preflight(stream):
+        parsed.append(stream)
+        return preflight_pdf(stream)
+
+    monkeypatch.setattr(pdf_processing, "preflight_pdf", spy_preflight)
+    token = pyjwt.encode(
+        {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 600}, secret, algorithm="HS256"
+    )
+    manuscript = _manuscript(3)
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+
+        def validate(**form):
+            form["file"] = (io.BytesIO(manuscript), "book.pdf")
+            response = client.post(
+                "/api/pdf/validate-kdp", data=form, headers={"Authorization": f"Bearer {token}"}
+            )
+            assert response.status_code == 200
+            return response.get_json()["data"]
+
+        # The dashboard validates every upload without the field: page-tree scan only.
+        assert validate()["preflight"] is None
+        assert parsed == []
+        report = validate(preflight="true")["preflight"]
+        assert len(parsed) == 1
+        assert report["complete"]
@@ -0,0 +1,145 @@
+"""Tests for the shared rate-limit stores."""
+
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.utils.rate_limit import (
+    CompositeRateLimiter,
+    RateLimiter,
+    SqliteRateLimitStore,
+    SupabaseRateLimitStore,
+    _Window,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _rows(store):
+    return store._conn.execute("SELECT COUNT(*) FROM rate_limit_counters").fetchone()[0]
+
+
+def test_store_enforces_limit_with_one_row_per_key():
+    store = SqliteRateLimitStore(clock=FakeClock())
+    results = [store.hit("ip:1", 3, 60) for _ in range(50)]
+
+    assert [allowed for allowed, _remaining, _reset in results[:4]] == [True, True, True, False]
+    assert [remaining for _allowed, remaining, _reset in results[:3]] == [2, 1, 0]
+    assert not any(allowed for allowed, _remaining, _reset in results[3:])
+    assert _rows(store) == 1
+
+
+def test_previous_window_is_weighted_then_forgotten():
+    clock = FakeClock(600.0)  # start of a 60s window
+    store = SqliteRateLimitStore(clock=clock)
+    for _ in range(4):
+        assert store.hit("k", 4, 60)[0] is True
+
+    clock.now = 660.0 + 45  # 3/4 through the next window: 4 * 0.25 = 1 still counts
+    allowed = [store.hit("k", 4, 60)[0] for _ in range(4)]
+    assert allowed == [True, True, True, False]
+
+    clock.now = 840.0  # a whole empty window later: nothing carries over
+    assert store.hit("k", 4, 60) == (True, 3, 900.0)
+
+
+def test_expired_counters_are_cleaned_up():
+    clock = FakeClock(0.0)
+    store = SqliteRateLimitStore(clock=clock, cleanup_interval=300)
+    for index in range(20):
+        store.hit(f"ip:{index}", 5, 60)
+    assert _rows(store) == 20
+
+    clock.now = 121.0
+    store.cleanup()
+    assert _rows(store) == 0
+
+    for index in range(5):
+        store.hit(f"ip:{index}", 5, 60)
+    clock.now = 500.0
+    store.hit("late", 5, 60)  # past cleanup_interval: the hit sweeps expired rows itself
+    assert _rows(store) == 1
+
+
+def test_concurrent_hits_never_exceed_limit(tmp_path):
+    store = SqliteRateLimitStore(str(tmp_path / "limits.db"))
+    results = []
+    barrier = threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        for _ in range(25):
+            results.append(store.hit("shared", 40, 3600)[0])
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 40
+    assert len(results) == 200
+
+
+class FakeRpcClient:
+    def __init__(self, data=None, error=None):
+        self.calls = []
+        self.data = data
+        self.error = error
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        if self.error:
+            raise self.error
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=self.data))
+
+
+def test_supabase_store_is_one_rpc_per_check():
+    client = FakeRpcClient(data=[{"allowed": True, "remaining": 4, "reset_at": 1234.0}])
+    limiter = CompositeRateLimiter(shared=SupabaseRateLimitStore(client))
+
+    assert limiter.is_allowed("ip:1", 5, 60) == (True, 4, 1234.0)
+    assert client.calls == [("rate_limit_hit", {"p_key": "ip:1", "p_limit": 5, "p_window_seconds": 60})]
+
+
+def test_rpc_failure_falls_back_to_memory():
+    client = FakeRpcClient(error=RuntimeError("function rate_limit_hit does not exist"))
+    limiter = CompositeRateLimiter(shared=SupabaseRateLimitStore(client))
+
+    assert [limiter.is_allowed("ip:1", 2, 60)[0] for _ in range(3)] == [True, True, False]
+    assert len(client.calls) == 3
+
+
+def test_memory_limiter_state_stays_constant_per_key():
+    clock = FakeClock(600.0)
+    limiter = RateLimiter(clock=clock)
+    results = [limiter.is_allowed("ip:1", 100, 60) for _ in range(10_000)]
+
+    assert sum(allowed for allowed, _remaining, _reset in results) == 100
+    assert list(limiter.windows) == [("ip:1", 60)]
+    assert not hasattr(limiter.windows[("ip:1", 60)], "__dict__")
+
+    clock.now = 660.0 + 30  # halfway through the next window: 50 of the previous 100 still count
+    assert sum(limiter.is_allowed("ip:1", 100, 60)[0] for _ in range(100)) == 50
+
+
+def test_memory_limiter_evicts_least_recent_key():
+    limiter = RateLimiter(max_keys=3, clock=FakeClock())
+    for key in ("a", "b", "c"):
+        limiter.is_allowed(key, 1, 60)
+    limiter.is_allowed("a", 1, 60)  # touch "a" so "b" is the oldest
+    limiter.is_allowed("d", 1, 60)
+
+    assert [slot[0] for slot in limiter.windows] == ["c", "a", "d"]
+    assert isinstance(limiter.windows[("d", 60)], _Window)
+    assert limiter.reset("a") is True
+    assert limiter.is_allowed("a", 1, 60)[0] is True
@@ -0,0 +1,83 @@
+"""Tests for the content-addressed result caches."""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import src.services.coloring as coloring
+import src.services.result_cache as result_cache_module
+from src.services.result_cache import DiskByteCache, LRUByteCache, TieredByteCache, content_key
+
+
+def test_lru_evicts_least_recent_by_bytes():
+    cache = LRUByteCache(max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"5678")
+    assert cache.get("a") == b"1234"  # a is now most recent
+    cache.put("c", b"90ab")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"90ab"
+    assert cache.current_bytes == 8
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None
+
+
+def test_disk_tier_survives_memory_and_is_promoted(tmp_path):
+    disk = DiskByteCache(str(tmp_path), max_bytes=1024)
+    first = TieredByteCache(LRUByteCache(1024), disk)
+    first.put("k", b"page")
+
+    # A fresh process only has the disk tier.
+    second = TieredByteCache(LRUByteCache(1024), DiskByteCache(str(tmp_path), max_bytes=1024))
+    assert second.get("k") == b"page"
+    assert second.memory.get("k") == b"page"
+
+
+def test_failed_disk_write_leaves_no_partial_file(tmp_path, monkeypatch):
+    disk = DiskByteCache(str(tmp_path), max_bytes=1024)
+
+    def disk_full(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(result_cache_module.os, "replace", disk_full)
+    disk.put("k", b"page")
+
+    assert disk.get("k") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_process_cache_is_created_once_under_concurrent_first_use(monkeypatch):
+    created = []
+
+    def slow_cache_from_env(prefix, default_mb):
+        time.sleep(0.01)  # widen the window between the None check and the assignment
+        created.append(prefix)
+        return TieredByteCache(LRUByteCache(1024))
+
+    monkeypatch.setattr(coloring, "_RESULT_CACHE", None)
+    monkeypatch.setattr(coloring, "cache_from_env", slow_cache_from_env)
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def first_use():
+        barrier.wait()
+        seen.append(coloring.result_cache())
+
+    threads = [threading.Thread(target=first_use) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert created == ["COLORING_RESULT"]
+    assert len({id(cache) for cache in seen}) == 1
+
+
+def test_content_key_is_unambiguous():
+    assert content_key("ab", "c") != content_key("a", "bc")
+    assert content_key(b"img", "6x9", True) == content_key(b"img", "6x9", True)
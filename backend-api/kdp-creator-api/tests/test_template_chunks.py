@@ -0,0 +1,128 @@
+"""Tests for chunked, resumable template interior rendering."""
+
+import io
+import os
+import sys
+import threading
+
+import pytest
+from pypdf import PdfReader
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import src.services.template_generator as generator
+from src.data.templates import get_template
+from src.services.result_cache import LRUByteCache, TieredByteCache
+from src.services.template_chunks import SegmentStore, render_chunk_range, segment_store_for
+
+
+@pytest.fixture
+def chunked(monkeypatch, tmp_path):
+    monkeypatch.setenv("TEMPLATE_CHUNK_PAGES", "40")
+    monkeypatch.setenv("TEMPLATE_CHUNK_WORKERS", "1")
+    monkeypatch.setenv("TEMPLATE_SEGMENT_DIR", str(tmp_path))
+    monkeypatch.setattr(generator, "_PRODUCT_CACHE", TieredByteCache(LRUByteCache(0)))
+    return tmp_path
+
+
+def _log_book():
+    template = get_template("tpl-log-etsy-seller")
+    return template, {**template["defaults"], "page_count": 120}
+
+
+def _store_dirs(root):
+    # Lock files stay beside the stores (pruned with stale segments); only directories matter.
+    return [path for path in root.iterdir() if path.is_dir()]
+
+
+def _texts(pdf_bytes):
+    return [page.extract_text() for page in PdfReader(io.BytesIO(pdf_bytes)).pages]
+
+
+def test_chunked_interior_matches_single_canvas(chunked, monkeypatch):
+    template, options = _log_book()
+    joined = generator.generate_product(template, options)
+    monkeypatch.setenv("TEMPLATE_CHUNK_PAGES", "0")
+    single = generator.generate_product(template, options)
+
+    assert joined.page_count == single.page_count == 120
+    assert _texts(joined.interior_pdf) == _texts(single.interior_pdf)
+    assert joined.compliance["is_valid"] is True
+    assert _store_dirs(chunked) == []  # segments are dropped once the interior is complete
+
+
+def test_crash_keeps_finished_chunks_for_the_retry(chunked, monkeypatch):
+    template, options = _log_book()
+    real = generator.GENERATORS["log_book"]
+
+    def crash_at_page_100(builder, *args):
+        new_page = builder.new_page
+
+        def failing(target_pages=None):
+            if builder.pages_drawn == 100:
+                raise RuntimeError("worker killed")
+            return new_page(target_pages)
+
+        builder.new_page = failing
+        return real(builder, *args)
+
+    monkeypatch.setitem(generator.GENERATORS, "log_book", crash_at_page_100)
+    with pytest.raises(RuntimeError):
+        generator.generate_product(template, options)
+    (store_dir,) = _store_dirs(chunked)
+    assert sorted(path.name for path in store_dir.glob("chunk_*.pdf")) == ["chunk_00000.pdf", "chunk_00001.pdf"]
+
+    monkeypatch.setitem(generator.GENERATORS, "log_book", real)
+    written = []
+    real_write = SegmentStore.write
+    monkeypatch.setattr(
+        SegmentStore, "write", lambda self, index, data: written.append(index) or real_write(self, index, data)
+    )
+    result = generator.generate_product(template, options)
+
+    assert written == [2]
+    assert result.page_count == 120
+    monkeypatch.setenv("TEMPLATE_CHUNK_PAGES", "0")
+    assert _texts(result.interior_pdf) == _texts(generator.generate_product(template, options).interior_pdf)
+
+
+def test_worker_draws_only_its_chunks(chunked):
+    template, options = _log_book()
+    store = segment_store_for("worker-test")
+    job = {
+        "niche": template["niche"],
+        "options": options,
+        "trim_size": template["trim_size"],
+        "with_bleed": bool(template.get("bleed")),
+        "target_pages": 120,
+        "chunk_pages": 40,
+        "store": str(store.root),
+    }
+
+    assert render_chunk_range(job, [1]) == [1]
+    assert [store.has(index) for index in range(3)] == [False, True, False]
+    assert len(PdfReader(str(store.path(1))).pages) == 40
+
+
+def test_identical_concurrent_runs_do_not_discard_each_others_segments(chunked):
+    template, options = _log_book()
+    results, errors = [], []
+    barrier = threading.Barrier(3)
+
+    def run():
+        barrier.wait()
+        try:
+            results.append(generator.generate_product(template, options))
+        except Exception as exc:  # pragma: no cover - the failure being guarded against
+            errors.append(exc)
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len({result.interior_pdf for result in results}) == 1
+    assert results[0].page_count == 120
+    assert _store_dirs(chunked) == []
@@ -1,5 +1,6 @@
 """Tests for template product generation."""
 
+import io
 import os
 import sys
 
@@ -10,6 +11,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from src.data.templates import STARTER_TEMPLATES, get_template
 from src.services.kdp_specs import SPINE_TEXT_MIN_PAGES, interior_page_size
+from src.services.result_cache import LRUByteCache, TieredByteCache
 from src.services.template_generator import generate_product
 
 
@@ -62,3 +64,137 @@ def test_spine_text_suppressed_below_79_pages():
     assert result.allow_spine_text is False
     assert result.compliance["is_valid"] is True
     assert result.compliance["cover"]["num_pages"] == 1
+
+
+def test_compliance_uses_recorded_manifest_without_reparsing(monkeypatch):
+    import src.services.template_generator as generator
+
+    template = get_template(STARTER_TEMPLATES[0]["id"])
+    options = {**template["defaults"], "page_count": 24}
+
+    def no_reparse(*args, **kwargs):
+        raise AssertionError("generated PDF was re-parsed")
+
+    monkeypatch.setattr(generator, "PdfReader", no_reparse)
+    monkeypatch.setattr(generator, "preflight_pdf", no_reparse)
+    fast = generate_product(template, options)
+    assert fast.compliance["interior"]["source"] == "manifest"
+    assert fast.compliance["interior"]["num_pages"] == fast.page_count
+
+    monkeypatch.undo()
+    checked = generate_product(template, options, paranoid=True)
+    assert checked.compliance["interior"]["source"] == "parsed"
+    assert checked.compliance["is_valid"] is True
+    assert checked.compliance["interior"]["num_pages"] == fast.compliance["interior"]["num_pages"]
+    assert checked.compliance["fonts_embedded"] == fast.compliance["fonts_embedded"]
+
+
+def test_cover_renders_on_stage_pool_while_interior_draws(monkeypatch):
+    import threading
+
+    import src.services.template_generator as generator
+    from src.services.template_pool import shutdown_pool
+
+    template = get_template(STARTER_TEMPLATES[0]["id"])
+    options = {**template["defaults"], "page_count": 24}
+    real_cover = generator.generate_cover_pdf
+    calls = []
+
+    def spy_cover(opts, page_count, print_profile, doc_key=None):
+        calls.append((threading.current_thread().name, page_count))
+        return real_cover(opts, page_count, print_profile, doc_key)
+
+    monkeypatch.setattr(generator, "generate_cover_pdf", spy_cover)
+    monkeypatch.setattr(generator, "_PRODUCT_CACHE", TieredByteCache(LRUByteCache(0)))
+    monkeypatch.setenv("TEMPLATE_WORKERS", "0")
+    serial = generate_product(template, options)
+    monkeypatch.setenv("TEMPLATE_WORKERS", "2")
+    try:
+        pooled = generate_product(template, options)
+    finally:
+        shutdown_pool()
+
+    assert calls[0] == (threading.current_thread().name, serial.page_count)
+    assert calls[1][0].startswith("template-stage") and calls[1][1] == pooled.page_count
+    assert len(calls) == 2
+    assert pooled.page_count == serial.page_count
+    assert pooled.spine_width_in == serial.spine_width_in
+    assert pooled.compliance == serial.compliance
+
+
+def test_repeated_page_backgrounds_are_stamped_once():
+    template = get_template("tpl-log-etsy-seller")
+    result = generate_product(template, {**template["defaults"], "page_count": 200})
+    reader = PdfReader(io.BytesIO(result.interior_pdf))
+
+    forms = set()
+    stamped_pages = 0
+    for page in reader.pages:
+        xobjects = page["/Resources"].get("/XObject") or {}
+        placed = [xobjects[name].indirect_reference.idnum for name in xobjects if name.startswith("/FormXob.KdpStamp")]
+        if placed and b"Do" in page.get_contents().get_data():
+            stamped_pages += 1
+        forms.update(placed)
+    # One table and one ruled page per recto/verso side, reused by ~200 pages.
+    assert stamped_pages > 150
+    assert len(forms) <= 8
+    # Column headers live in the stamped form and still extract with the page.
+    assert "sku" in reader.pages[3].extract_text()
+
+
+def test_dot_grid_is_one_round_capped_path():
+    from src.services.template_generator import _dot_grid_ops
+
+    left, right, top, bottom, spacing = 36.0, 400.0, 560.0, 300.0, 12
+    expected = 0
+    y = top
+    while y > bottom:
+        x = left
+        while x < right:
+            expected += 1
+            x += spacing
+        y -= spacing
+
+    ops = _dot_grid_ops(left, right, top, bottom, spacing).split()
+    assert ops.count("m") == ops.count("l") == expected
+    # Every dot is a zero-length segment; rows are stroked once each.
+    assert ops.count("S") == len(range(int((top - bottom) // spacing) + 1))
+    assert _dot_grid_ops(left, left, top, bottom, spacing) == ""
+
+    template = get_template("tpl-wellness-cbt-journal")
+    result = generate_product(template, {**template["defaults"], "page_style": "dot", "page_count": 24})
+    assert result.compliance["is_valid"] is True
+    form_streams = [
+        xobject.get_object().get_data()
+        for page in PdfReader(io.BytesIO(result.interior_pdf)).pages
+        for xobject in (page["/Resources"].get("/XObject") or {}).values()
+    ]
+    assert any(b"1 J" in data and b" l S" in data for data in form_streams)
+
+
+def test_repeat_generation_is_byte_identical_and_cached(monkeypatch):
+    import src.services.template_generator as generator
+
+    monkeypatch.setattr(generator, "_PRODUCT_CACHE", TieredByteCache(LRUByteCache(0)))
+    template = get_template("tpl-planner-gtd")
+    options = {**template["defaults"], "page_count": 40}
+    first = generate_product(template, options)
+    second = generate_product(template, options)
+    assert first.interior_pdf == second.interior_pdf
+    assert first.cover_pdf == second.cover_pdf
+    assert first.product_key == second.product_key
+    other = generate_product(template, {**options, "title": "Another planner"})
+    assert other.product_key != first.product_key
+    assert (
+        PdfReader(io.BytesIO(other.interior_pdf)).trailer["/ID"]
+        != PdfReader(io.BytesIO(first.interior_pdf)).trailer["/ID"]
+    )
+
+    monkeypatch.setattr(generator, "_PRODUCT_CACHE", TieredByteCache(LRUByteCache(16 * 1024 * 1024)))
+    rendered = generate_product(template, options)
+    monkeypatch.setitem(generator.GENERATORS, template["niche"], None)  # a render would now fail
+    cached = generate_product(template, options)
+    assert (rendered.cached, cached.cached) == (False, True)
+    assert cached.interior_pdf == first.interior_pdf and cached.cover_pdf == first.cover_pdf
+    assert cached.compliance == rendered.compliance
+    assert cached.spine_width_in == rendered.spine_width_in and cached.page_count == rendered.page_count
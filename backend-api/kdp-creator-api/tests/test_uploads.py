@@ -0,0 +1,66 @@
+"""Tests for upload ingestion limits and header-only probes."""
+
+import io
+import os
+import struct
+import sys
+import zlib
+
+import pytest
+from flask import Flask, request
+from werkzeug.datastructures import FileStorage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.utils.uploads import UploadRequest, image_upload_problem, pdf_upload_problem, upload_limit
+
+
+def _png_header_only(width, height):
+    """A PNG whose IHDR claims width×height but carries no pixel data."""
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    chunk = b"IHDR" + ihdr
+    iend = struct.pack(">I", 0) + b"IEND" + struct.pack(">I", zlib.crc32(b"IEND"))
+    return b"\x89PNG\r\n\x1a\n" + struct.pack(">I", len(ihdr)) + chunk + struct.pack(">I", zlib.crc32(chunk)) + iend
+
+
+def _storage(data, name="upload"):
+    return FileStorage(stream=io.BytesIO(data), filename=name)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("UPLOAD_MAX_IMAGE_MB", "0.01")
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+
+    @app.route("/upload", methods=["POST"])
+    @upload_limit("image")
+    def upload():
+        return {"size": len(request.files["file"].read()), "spooled": type(request.files["file"].stream).__name__}
+
+    return app.test_client()
+
+
+def test_upload_over_endpoint_limit_is_rejected(client):
+    response = client.post("/upload", data={"file": (io.BytesIO(b"x" * 20_000), "big.png")})
+    assert response.status_code == 413
+    assert response.get_json()["error"]["code"] == "FILE_TOO_LARGE"
+
+    response = client.post("/upload", data={"file": (io.BytesIO(b"x" * 1_000), "small.png")})
+    assert response.status_code == 200
+    assert response.get_json() == {"size": 1_000, "spooled": "SpooledTemporaryFile"}
+
+
+def test_image_probe_rejects_from_header_alone():
+    huge = _storage(_png_header_only(20_000, 20_000))
+    assert image_upload_problem(huge, max_pixels=50_000_000)[0] == "IMAGE_TOO_LARGE"
+    assert huge.stream.tell() == 0
+
+    assert image_upload_problem(_storage(_png_header_only(100, 100)), max_pixels=50_000_000) is None
+    assert image_upload_problem(_storage(b"not an image"), max_pixels=50_000_000)[0] == "INVALID_IMAGE"
+    assert image_upload_problem(_storage(b""), max_pixels=50_000_000)[0] == "INVALID_IMAGE"
+
+
+def test_pdf_probe_checks_magic():
+    assert pdf_upload_problem(_storage(b"%PDF-1.7\n...")) is None
+    assert pdf_upload_problem(_storage(b"<html>nope</html>"))[0] == "INVALID_PDF"
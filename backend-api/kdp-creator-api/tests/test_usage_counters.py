@@ -0,0 +1,208 @@
+"""Tests for atomic usage counters (quota reservation and refunds)."""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("ENVIRONMENT", "development")
+
+import jwt as pyjwt
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import src.models.user as user_module
+import src.services.job_queue as job_queue
+import src.services.template_generator as generator
+import src.services.usage_counters as usage_counters
+from src.main import app
+from src.routes import subscription
+from src.services.batch_jobs import refund_job_quota
+from src.services.job_queue import PermanentJobError, SqliteJobStore, run_job
+from src.services.usage_counters import LocalUsageStore, SupabaseUsageStore
+
+UNLIMITED = {"free": -1}
+
+
+def _hammer(threads, calls, fn):
+    barrier = threading.Barrier(threads)
+    results = []
+
+    def worker():
+        barrier.wait()
+        for _ in range(calls):
+            results.append(fn())
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return results
+
+
+def test_concurrent_increments_are_not_lost():
+    store = LocalUsageStore()
+    _hammer(16, 50, lambda: store.consume("user-1", "conversions", 1, UNLIMITED))
+    assert store.used("user-1", "conversions") == 800
+
+
+def test_concurrent_reservations_stop_exactly_at_the_limit():
+    store = LocalUsageStore()
+    store.set_tier("user-1", "pro")
+    limits = {"free": 1, "pro": 10}
+    results = _hammer(12, 5, lambda: store.consume("user-1", "batch_operations", 1, limits)[0])
+
+    assert results.count(True) == 10
+    assert store.used("user-1", "batch_operations") == 10
+    assert store.used("user-1", "conversions") == 0
+
+
+def test_refund_returns_quota_and_never_goes_negative():
+    store = LocalUsageStore()
+    limits = {"free": 2}
+    assert store.consume("user-1", "conversions", 2, limits) == (True, 2)
+    assert store.consume("user-1", "conversions", 1, limits) == (False, 2)
+    assert store.consume("user-1", "conversions", -1, limits) == (True, 1)
+    assert store.consume("user-1", "conversions", 1, limits) == (True, 2)
+    assert store.consume("user-2", "conversions", -5, limits) == (True, 0)
+    with pytest.raises(ValueError):
+        store.consume("user-1", "storage", 1, limits)
+
+
+def test_supabase_store_is_one_rpc_per_reservation():
+    calls = []
+
+    class Client:
+        def rpc(self, name, params):
+            calls.append((name, params))
+            return SimpleNamespace(execute=lambda: SimpleNamespace(data=[{"allowed": False, "used": 5}]))
+
+    store = SupabaseUsageStore(Client())
+    assert store.consume("user-1", "conversions", 1, {"free": 5}) == (False, 5)
+    assert calls == [
+        (
+            "consume_usage",
+            {"p_user_id": "user-1", "p_kind": "conversions", "p_amount": 1, "p_tier_limits": {"free": 5}},
+        )
+    ]
+
+
+@pytest.fixture
+def local_usage(monkeypatch):
+    store = LocalUsageStore()
+    monkeypatch.setattr(usage_counters, "_STORE", store)
+    monkeypatch.setattr(user_module, "supabase", None)
+    return store
+
+
+def test_parallel_requests_cannot_pass_the_free_quota(local_usage):
+    def reserve():
+        with app.app_context():
+            return subscription.reserve_conversion_quota("user-1")
+
+    results = _hammer(8, 4, reserve)
+    limit = subscription.SUBSCRIPTION_TIERS["free"]["monthly_conversions"]
+
+    assert results.count((None, 1)) == limit
+    assert local_usage.used("user-1", "conversions") == limit
+    refused, reserved = next(result for result in results if result[0] is not None)
+    assert reserved == 0
+    assert refused[1] == 403
+    assert refused[0].get_json()["error"]["code"] == "QUOTA_EXCEEDED"
+
+
+def test_unrecorded_reservation_is_not_refunded(local_usage, monkeypatch):
+    local_usage.consume("user-1", "conversions", 2, UNLIMITED)
+    consume = local_usage.consume
+
+    def store_down(user_id, kind, amount, tier_limits):
+        raise RuntimeError("connection reset")
+
+    with app.app_context():
+        monkeypatch.setattr(local_usage, "consume", store_down)
+        # The work may go ahead, but nothing was counted, so a failure must not hand quota back.
+        error, reserved = subscription.reserve_conversion_quota("user-1")
+        assert (error, reserved) == (None, 0)
+        monkeypatch.setattr(local_usage, "consume", consume)
+        subscription.refund_conversion_usage("user-1", reserved)
+
+    assert local_usage.used("user-1", "conversions") == 2
+
+
+def test_usage_is_not_counted_without_supabase(monkeypatch):
+    monkeypatch.setattr(usage_counters, "_STORE", None)
+    monkeypatch.setattr(user_module, "supabase", None)
+    assert usage_counters.get_usage_store() is None
+    with app.app_context():
+        assert subscription.reserve_batch_quota("user-1") == (None, 0)
+
+
+def test_failed_generation_gives_the_conversion_back(local_usage, monkeypatch):
+    secret = "project-jwt-secret-at-least-32-bytes-long"
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", secret)
+    monkeypatch.setattr(user_module, "_TOKEN_CACHE", user_module.TokenCache(60, 100))
+
+    reserved_during_work = []
+
+    def broken(template, options):
+        reserved_during_work.append(local_usage.used("user-1", "conversions"))
+        raise RuntimeError("renderer crashed")
+
+    monkeypatch.setattr(generator, "generate_product", broken)
+    token = pyjwt.encode(
+        {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 600}, secret, algorithm="HS256"
+    )
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        response = client.post(
+            "/api/templates/tpl-log-etsy-seller/generate", json={}, headers={"Authorization": f"Bearer {token}"}
+        )
+
+    assert response.status_code == 500
+    assert response.get_json()["error"]["code"] == "GENERATION_ERROR"
+    assert reserved_during_work == [1]
+    assert local_usage.used("user-1", "conversions") == 0
+
+
+def test_queued_batch_jobs_give_the_quota_back_when_they_fail_or_are_cancelled(local_usage, monkeypatch, tmp_path):
+    secret = "project-jwt-secret-at-least-32-bytes-long"
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", secret)
+    monkeypatch.setattr(user_module, "_TOKEN_CACHE", user_module.TokenCache(60, 100))
+    store = SqliteJobStore(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_queue, "_STORE", store)
+
+    def submit():
+        with app.app_context():
+            error, reserved = subscription.reserve_batch_quota("user-1")
+        assert (error, reserved) == (None, 1)
+        job = {"user_id": "user-1", "job_type": "convert_image", "tier": "free", "total_files": 1}
+        return store.enqueue(job | {"payload": {"inputs": ["a.png"], "reserved_quota": reserved}})
+
+    def bad_input(ctx):
+        raise PermanentJobError("a.png: Image too large")
+
+    submit()
+    assert local_usage.used("user-1", "batch_operations") == 1
+    # Workers run outside any app or request context.
+    assert run_job(store, store.claim("w1"), {"convert_image": bad_input}, "w1", on_failed=refund_job_quota) == "failed"
+    assert local_usage.used("user-1", "batch_operations") == 0
+
+    job = submit()
+    token = pyjwt.encode(
+        {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 600}, secret, algorithm="HS256"
+    )
+    app.config["TESTING"] = True
+    with app.test_client() as client:
+        cancel = client.post(f"/api/batch/jobs/{job['id']}/cancel", headers={"Authorization": f"Bearer {token}"})
+        assert cancel.status_code == 200
+        assert cancel.get_json()["data"]["job"]["status"] == "cancelled"
+        assert local_usage.used("user-1", "batch_operations") == 0
+        # A job that is no longer active cannot be cancelled (or refunded) again.
+        again = client.post(f"/api/batch/jobs/{job['id']}/cancel", headers={"Authorization": f"Bearer {token}"})
+        assert again.status_code == 409
@@ -0,0 +1,105 @@
+"""Tests for request-scoped user profile loading."""
+
+import os
+import sys
+from types import SimpleNamespace
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret")
+os.environ.setdefault("SUPABASE_URL", "https://example.supabase.co")
+os.environ.setdefault("ENVIRONMENT", "development")
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import src.models.user as user_module
+import src.routes.subscription as subscription
+import src.services.usage_counters as usage_counters
+from src.main import app
+from src.models.user import UserProfile, _enforce_mfa_if_required
+
+
+class FakeQuery:
+    def __init__(self, db, op=None, fields=None):
+        self.db = db
+        self.op = op
+        self.fields = fields
+
+    def select(self, *columns):
+        return FakeQuery(self.db, "select")
+
+    def update(self, fields):
+        return FakeQuery(self.db, "update", fields)
+
+    def eq(self, column, value):
+        return self
+
+    def maybe_single(self):
+        return self
+
+    def execute(self):
+        self.db.calls.append(self.op)
+        if self.op == "update":
+            self.db.row.update(self.fields)
+        return SimpleNamespace(data=dict(self.db.row))
+
+
+class FakeProfiles:
+    def __init__(self, **row):
+        self.row = {"id": "user-1", "subscription_tier": "free", "conversions_this_month": 0, **row}
+        self.calls = []
+
+    def table(self, name):
+        assert name == "user_profiles"
+        return FakeQuery(self)
+
+
+@pytest.fixture
+def profiles(monkeypatch):
+    monkeypatch.delenv("SUPABASE_ANON_KEY", raising=False)
+    db = FakeProfiles()
+    monkeypatch.setattr(user_module, "supabase", db)
+    monkeypatch.setattr(subscription, "supabase", db)
+    monkeypatch.setattr(usage_counters, "_STORE", usage_counters.LocalUsageStore())
+    return db
+
+
+def test_mfa_quota_and_usage_share_one_profile_fetch(profiles):
+    user = SimpleNamespace(id="user-1")
+    with app.test_request_context("/api/pdf/convert-coloring", method="POST"):
+        assert _enforce_mfa_if_required(user) is None
+        assert subscription.enforce_conversion_quota("user-1") is None
+        assert subscription.enforce_template_tier("user-1", "free") is None
+        assert subscription.reserve_conversion_quota("user-1") == (None, 1)
+        assert profiles.calls == ["select"]
+
+        # Reserving changed the counter, so the request's copy is dropped and read again.
+        UserProfile.get_by_id("user-1")
+        assert profiles.calls == ["select", "select"]
+
+
+def test_profiles_are_not_shared_across_requests(profiles):
+    for _ in range(2):
+        with app.test_request_context("/api/me"):
+            UserProfile.get_by_id("user-1")
+            UserProfile.get_by_id("user-1")
+    UserProfile.get_by_id("user-1")  # off-request: no memo
+    assert profiles.calls == ["select"] * 3
+
+
+def test_failed_fetch_is_retried(profiles, monkeypatch):
+    execute = FakeQuery.execute
+
+    def flaky(self):
+        if len(profiles.calls) == 0:
+            profiles.calls.append("error")
+            raise RuntimeError("timeout")
+        return execute(self)
+
+    monkeypatch.setattr(FakeQuery, "execute", flaky)
+    with app.test_request_context("/api/me"):
+        assert UserProfile.get_by_id("user-1") is None
+        assert UserProfile.get_by_id("user-1")["id"] == "user-1"
+        assert UserProfile.get_by_id("user-1")["id"] == "user-1"
+    assert profiles.calls == ["error", "select"]
@@ -0,0 +1,79 @@
+-- Durable batch-job queue: payload/result, leases, retries (see src/services/job_queue.py).
+-- Workers claim through claim_batch_job() with the service role; clients only read their rows.
+-- Safe to re-run.
+
+ALTER TABLE public.batch_jobs
+  ADD COLUMN IF NOT EXISTS tier TEXT NOT NULL DEFAULT 'free',
+  ADD COLUMN IF NOT EXISTS payload JSONB NOT NULL DEFAULT '{}',
+  ADD COLUMN IF NOT EXISTS result JSONB,
+  ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS max_attempts INTEGER NOT NULL DEFAULT 3,
+  ADD COLUMN IF NOT EXISTS leased_by TEXT,
+  ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS next_run_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_batch_jobs_claimable
+  ON public.batch_jobs (created_at)
+  WHERE status IN ('queued', 'processing');
+
+-- Claim the oldest runnable job whose owner is under their tier's concurrency limit.
+-- Jobs whose lease expired are reclaimed; on the final attempt they are failed instead.
+CREATE OR REPLACE FUNCTION public.claim_batch_job(
+  p_worker_id TEXT,
+  p_lease_seconds INTEGER,
+  p_tier_limits JSONB
+)
+RETURNS SETOF public.batch_jobs
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  candidate public.batch_jobs;
+  running INTEGER;
+BEGIN
+  UPDATE public.batch_jobs
+     SET status = 'failed',
+         error_message = 'Worker lost the job too many times',
+         leased_by = NULL,
+         completed_at = now()
+   WHERE status = 'processing'
+     AND lease_expires_at < now()
+     AND attempts >= max_attempts;
+
+  FOR candidate IN
+    SELECT *
+      FROM public.batch_jobs
+     WHERE (status = 'queued' AND (next_run_at IS NULL OR next_run_at <= now()))
+        OR (status = 'processing' AND lease_expires_at < now())
+     ORDER BY created_at, id
+     LIMIT 100
+     FOR UPDATE SKIP LOCKED
+  LOOP
+    SELECT count(*) INTO running
+      FROM public.batch_jobs
+     WHERE user_id = candidate.user_id
+       AND status = 'processing'
+       AND lease_expires_at >= now();
+
+    IF running < COALESCE((p_tier_limits ->> candidate.tier)::INTEGER, (p_tier_limits ->> 'free')::INTEGER, 1) THEN
+      RETURN QUERY
+        UPDATE public.batch_jobs
+           SET status = 'processing',
+               leased_by = p_worker_id,
+               lease_expires_at = now() + make_interval(secs => p_lease_seconds),
+               heartbeat_at = now(),
+               attempts = attempts + 1
+         WHERE id = candidate.id
+        RETURNING *;
+      RETURN;
+    END IF;
+  END LOOP;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.claim_batch_job(TEXT, INTEGER, JSONB) FROM PUBLIC, anon, authenticated;
+
+COMMENT ON FUNCTION public.claim_batch_job(TEXT, INTEGER, JSONB) IS
+  'Lease the next runnable batch job for a worker; called by the API service role only.';
@@ -0,0 +1,87 @@
+-- Shared rate limiter: one counter row per (key, window) updated by a single RPC
+-- (see src/utils/rate_limit.py). Replaces insert-then-count over rate_limit_events.
+-- Service role only. Safe to re-run.
+
+CREATE TABLE IF NOT EXISTS public.rate_limit_counters (
+  key TEXT NOT NULL,
+  window_seconds INTEGER NOT NULL,
+  window_start TIMESTAMPTZ NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0,
+  previous_hits INTEGER NOT NULL DEFAULT 0,
+  expires_at TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (key, window_seconds)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_expires_at
+  ON public.rate_limit_counters (expires_at);
+
+ALTER TABLE public.rate_limit_counters ENABLE ROW LEVEL SECURITY;
+
+-- Sliding-window counter: hits in the current fixed window plus the previous window's hits
+-- weighted by how much of it still overlaps the sliding window. Denied requests are not
+-- counted. Rows expire two windows after their window starts; about 1 call in 100 sweeps
+-- expired rows, so the table holds only recently active keys.
+CREATE OR REPLACE FUNCTION public.rate_limit_hit(
+  p_key TEXT,
+  p_limit INTEGER,
+  p_window_seconds INTEGER
+)
+RETURNS TABLE (allowed BOOLEAN, remaining INTEGER, reset_at DOUBLE PRECISION)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  now_epoch DOUBLE PRECISION := extract(epoch FROM clock_timestamp());
+  current_start TIMESTAMPTZ := to_timestamp(floor(now_epoch / p_window_seconds) * p_window_seconds);
+  window_length INTERVAL := make_interval(secs => p_window_seconds);
+  counter public.rate_limit_counters;
+  estimate DOUBLE PRECISION;
+BEGIN
+  INSERT INTO public.rate_limit_counters (key, window_seconds, window_start, hits, previous_hits, expires_at)
+  VALUES (p_key, p_window_seconds, current_start, 0, 0, current_start + 2 * window_length)
+  ON CONFLICT (key, window_seconds) DO NOTHING;
+
+  SELECT * INTO counter
+    FROM public.rate_limit_counters
+   WHERE key = p_key AND window_seconds = p_window_seconds
+     FOR UPDATE;
+
+  IF counter.window_start < current_start THEN
+    counter.previous_hits := CASE WHEN counter.window_start = current_start - window_length THEN counter.hits ELSE 0 END;
+    counter.hits := 0;
+    counter.window_start := current_start;
+  END IF;
+
+  estimate := counter.previous_hits * (1 - (now_epoch - extract(epoch FROM current_start)) / p_window_seconds)
+              + counter.hits;
+  allowed := estimate + 1 <= p_limit;
+  IF allowed THEN
+    counter.hits := counter.hits + 1;
+    estimate := estimate + 1;
+  END IF;
+
+  UPDATE public.rate_limit_counters
+     SET window_start = counter.window_start,
+         hits = counter.hits,
+         previous_hits = counter.previous_hits,
+         expires_at = counter.window_start + 2 * window_length
+   WHERE key = p_key AND window_seconds = p_window_seconds;
+
+  IF random() < 0.01 THEN
+    DELETE FROM public.rate_limit_counters WHERE expires_at < now();
+  END IF;
+
+  remaining := greatest(0, p_limit - ceil(estimate)::INTEGER);
+  reset_at := extract(epoch FROM current_start) + p_window_seconds;
+  RETURN NEXT;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.rate_limit_hit(TEXT, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+
+COMMENT ON FUNCTION public.rate_limit_hit(TEXT, INTEGER, INTEGER) IS
+  'Count one request against a sliding-window limit; called by the API service role only.';
+
+-- rate_limit_events is no longer written. Once every instance runs this version:
+--   DROP TABLE IF EXISTS public.rate_limit_events;
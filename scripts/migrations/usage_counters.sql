@@ -0,0 +1,82 @@
+-- Atomic monthly usage counters on user_profiles (see src/services/usage_counters.py).
+-- The API reserves quota with consume_usage() before doing the work and gives it back with
+-- a negative amount if the work fails. Service role only. Safe to re-run.
+
+-- Add p_amount to the user's conversions or batch_operations counter, but only if that keeps
+-- it within their tier's limit (p_tier_limits: tier -> limit, -1 unlimited). Negative amounts
+-- (refunds) always apply and never take the counter below zero. The row lock taken by the
+-- UPDATE serializes concurrent calls, so no increment is lost and the limit cannot be passed.
+CREATE OR REPLACE FUNCTION public.consume_usage(
+  p_user_id UUID,
+  p_kind TEXT,
+  p_amount INTEGER,
+  p_tier_limits JSONB
+)
+RETURNS TABLE (allowed BOOLEAN, used INTEGER)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  tier_limit INTEGER;
+BEGIN
+  IF p_kind = 'conversions' THEN
+    UPDATE public.user_profiles
+       SET conversions_this_month = greatest(0, COALESCE(conversions_this_month, 0) + p_amount),
+           updated_at = now()
+     WHERE id = p_user_id
+       AND (
+         p_amount <= 0
+         OR COALESCE((p_tier_limits ->> COALESCE(subscription_tier, 'free'))::INTEGER,
+                     (p_tier_limits ->> 'free')::INTEGER) < 0
+         OR COALESCE(conversions_this_month, 0) + p_amount
+              <= COALESCE((p_tier_limits ->> COALESCE(subscription_tier, 'free'))::INTEGER,
+                          (p_tier_limits ->> 'free')::INTEGER)
+       )
+    RETURNING conversions_this_month INTO used;
+  ELSIF p_kind = 'batch_operations' THEN
+    UPDATE public.user_profiles
+       SET batch_operations_this_month = greatest(0, COALESCE(batch_operations_this_month, 0) + p_amount),
+           updated_at = now()
+     WHERE id = p_user_id
+       AND (
+         p_amount <= 0
+         OR COALESCE((p_tier_limits ->> COALESCE(subscription_tier, 'free'))::INTEGER,
+                     (p_tier_limits ->> 'free')::INTEGER) < 0
+         OR COALESCE(batch_operations_this_month, 0) + p_amount
+              <= COALESCE((p_tier_limits ->> COALESCE(subscription_tier, 'free'))::INTEGER,
+                          (p_tier_limits ->> 'free')::INTEGER)
+       )
+    RETURNING batch_operations_this_month INTO used;
+  ELSE
+    RAISE EXCEPTION 'Unknown usage kind: %', p_kind;
+  END IF;
+
+  IF FOUND THEN
+    allowed := TRUE;
+    RETURN NEXT;
+    RETURN;
+  END IF;
+
+  SELECT CASE WHEN p_kind = 'conversions' THEN COALESCE(conversions_this_month, 0)
+              ELSE COALESCE(batch_operations_this_month, 0) END
+    INTO used
+    FROM public.user_profiles
+   WHERE id = p_user_id;
+
+  IF NOT FOUND THEN
+    -- No profile row yet: nothing to count against, judge by the free tier as before.
+    tier_limit := (p_tier_limits ->> 'free')::INTEGER;
+    used := 0;
+    allowed := tier_limit < 0 OR p_amount <= tier_limit;
+  ELSE
+    allowed := FALSE;
+  END IF;
+  RETURN NEXT;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.consume_usage(UUID, TEXT, INTEGER, JSONB) FROM PUBLIC, anon, authenticated;
+
+COMMENT ON FUNCTION public.consume_usage(UUID, TEXT, INTEGER, JSONB) IS
+  'Reserve (or refund) monthly conversion / batch quota atomically; called by the API service role only.';